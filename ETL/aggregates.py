@@ -0,0 +1,148 @@
+import numpy as np
+
+from models import AGGREGATE_DEFAULT, AGGREGATES, RUNNING_SUMS
+
+
+def calc_playlist_aggregates(feature_matrix, playlist_offsets, playlist_track_rows):
+    """
+    Calculates every aggregate of every feature for a batch of playlists at once. The playlists are given CSR style: the
+    feature_matrix rows of playlist i are playlist_track_rows[playlist_offsets[i]:playlist_offsets[i + 1]].
+
+    Returns a map of each aggregate name to a (playlists x features) matrix, matching the statistics module (std is the
+    sample standard deviation). Aggregates which are undefined for a playlist (any for an empty playlist, std for a
+    single track playlist) are AGGREGATE_DEFAULT.
+
+    min and max are exact. avg and std are accumulated in extended precision (where the platform has it), so they only
+    differ from statistics' exact fraction arithmetic when rounding back to float64 is a near tie, and then by one ulp,
+    which the (single precision in MySQL) Float columns they're loaded into don't keep anyway.
+    """
+    playlist_offsets = np.asarray(playlist_offsets, dtype=np.int64)
+    playlist_track_rows = np.asarray(playlist_track_rows, dtype=np.int64)
+    playlists_count = len(playlist_offsets) - 1
+    counts = np.diff(playlist_offsets)
+
+    aggregates = {aggregate_name: np.full((playlists_count, feature_matrix.shape[1]), AGGREGATE_DEFAULT,
+                                          dtype=np.float64)
+                  for aggregate_name in AGGREGATES}
+
+    # reduceat can't express empty segments, so they're left out (and keep their default):
+    non_empty = counts > 0
+    if not non_empty.any():
+        return aggregates
+    starts = playlist_offsets[:-1][non_empty]
+    segment_counts = counts[non_empty]
+    # The empty playlists have no rows in playlist_track_rows, so the non empty starts index it directly:
+    values = feature_matrix[playlist_track_rows]
+    extended_values = values.astype(np.longdouble)
+    n = segment_counts[:, np.newaxis].astype(np.longdouble)
+
+    mean = np.add.reduceat(extended_values, starts, axis=0) / n
+    # One correction pass over the deviations cancels most of the rounding error of the plain sum:
+    deviations = extended_values - np.repeat(mean, segment_counts, axis=0)
+    mean += np.add.reduceat(deviations, starts, axis=0) / n
+    deviations = extended_values - np.repeat(mean, segment_counts, axis=0)
+    sum_of_squares = np.add.reduceat(deviations * deviations, starts, axis=0)
+
+    aggregates['avg'][non_empty] = mean
+    aggregates['min'][non_empty] = np.minimum.reduceat(values, starts, axis=0)
+    aggregates['max'][non_empty] = np.maximum.reduceat(values, starts, axis=0)
+    multiple_tracks = segment_counts > 1
+    aggregates['std'][np.flatnonzero(non_empty)[multiple_tracks]] = np.sqrt(
+        sum_of_squares[multiple_tracks] / (n[multiple_tracks] - 1))
+    return aggregates
+
+
+def calc_playlist_sums(feature_matrix, playlist_offsets, playlist_track_rows):
+    """
+    Calculates the running sums (see models.RUNNING_SUMS) of every feature for a batch of playlists given CSR style, as
+    for calc_playlist_aggregates. Returns the track count of every playlist, and a map of each running sum name to a
+    (playlists x features) matrix. The sums are accumulated in extended precision (where the platform has it).
+    """
+    playlist_offsets = np.asarray(playlist_offsets, dtype=np.int64)
+    counts = np.diff(playlist_offsets)
+    running_sums = {running_sum_name: np.zeros((len(counts), feature_matrix.shape[1]), dtype=np.float64)
+                    for running_sum_name in RUNNING_SUMS}
+
+    # As in calc_playlist_aggregates, the empty playlists are left out of the reduceat (and keep their zero sums):
+    non_empty = counts > 0
+    if not non_empty.any():
+        return counts, running_sums
+    starts = playlist_offsets[:-1][non_empty]
+    extended_values = feature_matrix[np.asarray(playlist_track_rows, dtype=np.int64)].astype(np.longdouble)
+    running_sums['sum'][non_empty] = np.add.reduceat(extended_values, starts, axis=0)
+    running_sums['sumsq'][non_empty] = np.add.reduceat(extended_values * extended_values, starts, axis=0)
+    return counts, running_sums
+
+
+def aggregates_from_sums(counts, sums, sums_of_squares):
+    """
+    The avg and std (as for calc_playlist_aggregates) of playlists from their track counts and running sums. These can
+    differ from calc_playlist_aggregates' by a few ulps, more so for the std of features with a large mean.
+    """
+    counts = np.asarray(counts, dtype=np.float64)[:, np.newaxis]
+    avg = np.full(sums.shape, AGGREGATE_DEFAULT, dtype=np.float64)
+    std = np.full(sums.shape, AGGREGATE_DEFAULT, dtype=np.float64)
+    non_empty = counts[:, 0] > 0
+    avg[non_empty] = sums[non_empty] / counts[non_empty]
+    multiple_tracks = counts[:, 0] > 1
+    # Rounding can make the sum of squared deviations slightly negative when they're all (close to) zero:
+    sum_of_squares = np.maximum(sums_of_squares[multiple_tracks] - sums[multiple_tracks] * avg[multiple_tracks], 0)
+    std[multiple_tracks] = np.sqrt(sum_of_squares / (counts[multiple_tracks] - 1))
+    return {'avg': avg, 'std': std}
+
+
+def artist_genre_matrix(artist_genres):
+    """
+    Interns the genres of every artist (a list of genre lists, None meaning no genres) to genre IDs, returning the
+    genre names and the artist x genre incidence matrix in CSR form: the genre IDs of artist i are
+    artist_genre_ids[artist_genre_offsets[i]:artist_genre_offsets[i + 1]], in their original order.
+    """
+    genre_index = {}
+    artist_genre_offsets = np.zeros(len(artist_genres) + 1, dtype=np.int64)
+    artist_genre_ids = []
+    for artist_i, genres in enumerate(artist_genres):
+        for genre in genres or ():
+            artist_genre_ids.append(genre_index.setdefault(genre, len(genre_index)))
+        artist_genre_offsets[artist_i + 1] = len(artist_genre_ids)
+    return list(genre_index), artist_genre_offsets, np.array(artist_genre_ids, dtype=np.int64)
+
+
+def calc_playlist_top_genres(playlist_offsets, playlist_track_rows, track_artists, genre_names, artist_genre_offsets,
+                             artist_genre_ids, top_n=3):
+    """
+    Returns the top_n genres of every playlist (given CSR style, as for calc_playlist_aggregates), counting each genre
+    of each track's artist once per playlist track.
+
+    Ties are broken by which genre comes first in the playlist (in track order, then in the artist's genre order), which
+    is the order heapq.nlargest would keep counting the genres one track at a time.
+    """
+    playlist_offsets = np.asarray(playlist_offsets, dtype=np.int64)
+    track_artists = np.asarray(track_artists, dtype=np.int64)
+    playlists_count = len(playlist_offsets) - 1
+    top_genres = [[] for _ in range(playlists_count)]
+
+    # The playlist and the artist of every playlist track, then the playlist and genre of every (playlist track,
+    # genre) pair, which is the playlist x track x artist x genre product without materializing the sparse matrices:
+    row_playlists = np.repeat(np.arange(playlists_count, dtype=np.int64), np.diff(playlist_offsets))
+    row_artists = track_artists[np.asarray(playlist_track_rows, dtype=np.int64)]
+    row_genre_starts = artist_genre_offsets[row_artists]
+    row_genre_counts = artist_genre_offsets[row_artists + 1] - row_genre_starts
+    pairs_count = int(row_genre_counts.sum())
+    if not pairs_count:
+        return top_genres
+    pair_row_starts = np.cumsum(row_genre_counts) - row_genre_counts
+    pair_genre_ids = artist_genre_ids[np.repeat(row_genre_starts - pair_row_starts, row_genre_counts)
+                                      + np.arange(pairs_count)]
+    pair_playlists = np.repeat(row_playlists, row_genre_counts)
+
+    keys, first_pair_indexes, genre_counts = np.unique(pair_playlists * len(genre_names) + pair_genre_ids,
+                                                       return_index=True, return_counts=True)
+    key_playlists = keys // len(genre_names)
+    # By playlist, then by count (descending), then by first occurrence:
+    order = np.lexsort((first_pair_indexes, -genre_counts, key_playlists))
+    key_playlists = key_playlists[order]
+    playlist_starts = np.searchsorted(key_playlists, key_playlists)
+    ranked = np.flatnonzero(np.arange(len(order)) - playlist_starts < top_n)
+    for playlist_i, genre_id in zip(key_playlists[ranked].tolist(), (keys[order][ranked] % len(genre_names)).tolist()):
+        top_genres[playlist_i].append(genre_names[genre_id])
+    return top_genres
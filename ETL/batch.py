@@ -0,0 +1,146 @@
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
+from bulk_load import PLAYLIST_COLUMNS, PLAYLIST_FEATURE_SUMS_COLUMNS, TRACK_COLUMNS
+from models import AGGREGATES, FEATURE_NAMES, RUNNING_SUMS, feature_aggregate_attr_name
+
+
+def unique_in_order(values):
+    """
+    The unique values of a NumPy array, in order of first occurrence.
+    """
+    _, first_indexes = np.unique(values, return_index=True)
+    return values[np.sort(first_indexes)]
+
+
+class NewTrack:
+    """
+    MPD data of a Track which isn't in the database yet, and its Spotify audio features (in FEATURE_NAMES order, which
+    include duration_ms) once they're pulled.
+    """
+    __slots__ = ('track_name', 'artist_name', 'album_id', 'album_name', 'features')
+
+    def __init__(self, mpd_track):
+        self.track_name = mpd_track.track_name
+        self.artist_name = mpd_track.artist_name
+        self.album_id = mpd_track.album_id
+        self.album_name = mpd_track.album_name
+        self.features = None
+
+
+class IngestBatch:
+    """
+    Compact in-memory representation of the slices being ingested, so that no ORM entity (or any other per playlist
+    track object) is made before the rows are loaded.
+
+    Track and Artist IDs are interned to int indexes, in order of first occurrence. The playlist tracks are stored CSR
+    style: the track indexes (and track positions) of playlist i are playlist_track_indexes[playlist_offsets[i]:
+    playlist_offsets[i + 1]]. These are int arrays while slices are added, and NumPy arrays once they're frozen.
+    """
+
+    def __init__(self):
+        self.track_ids = []
+        self.track_index = {}
+        # Artist index of every track index:
+        self.track_artists = array('i')
+        self.artist_ids = []
+        self.artist_index = {}
+        # Map of the track indexes which aren't in the database to their NewTrack:
+        self.new_tracks = {}
+
+        # Playlist column values, in slice order:
+        self.playlists = []
+        # Map of each slice number to its (start, stop) playlist indexes:
+        self.slice_playlist_ranges = OrderedDict()
+        # Map of each slice number to the (start, stop) track indexes of the tracks it is the first to have:
+        self.slice_track_ranges = OrderedDict()
+        self.playlist_offsets = array('q', [0])
+        self.playlist_track_indexes = array('i')
+        self.playlist_track_positions = array('i')
+
+    def intern_artist(self, artist_id):
+        artist_i = self.artist_index.get(artist_id)
+        if artist_i is None:
+            artist_i = self.artist_index[artist_id] = len(self.artist_ids)
+            self.artist_ids.append(artist_id)
+        return artist_i
+
+    def add_slice(self, slice_data):
+        playlists_start = len(self.playlists)
+        tracks_start = len(self.track_ids)
+        for playlist_values, playlist_track_ids in slice_data.playlists:
+            self.playlists.append(playlist_values)
+            for track_pos, track_id in playlist_track_ids:
+                track_i = self.track_index.get(track_id)
+                if track_i is None:
+                    # Only the first slice's data for a track is kept:
+                    mpd_track = slice_data.tracks[track_id]
+                    track_i = self.track_index[track_id] = len(self.track_ids)
+                    self.track_ids.append(track_id)
+                    self.track_artists.append(self.intern_artist(mpd_track.artist_id))
+                    self.new_tracks[track_i] = NewTrack(mpd_track)
+                self.playlist_track_indexes.append(track_i)
+                self.playlist_track_positions.append(track_pos)
+            self.playlist_offsets.append(len(self.playlist_track_indexes))
+        self.slice_playlist_ranges[slice_data.slice_i] = (playlists_start, len(self.playlists))
+        self.slice_track_ranges[slice_data.slice_i] = (tracks_start, len(self.track_ids))
+
+    def freeze(self):
+        """
+        Turns the playlist tracks into NumPy arrays, once every slice is added.
+        """
+        self.playlist_offsets = np.frombuffer(self.playlist_offsets, dtype=np.int64)
+        self.playlist_track_indexes = np.frombuffer(self.playlist_track_indexes, dtype=np.int32)
+        self.playlist_track_positions = np.frombuffer(self.playlist_track_positions, dtype=np.int32)
+
+    def remove_tracks(self, removed_tracks):
+        """
+        Removes the playlist tracks of the track indexes where the removed_tracks mask is true. The remaining playlist
+        tracks keep their positions.
+        """
+        playlist_offsets = np.frombuffer(self.playlist_offsets, dtype=np.int64)
+        playlist_track_indexes = np.frombuffer(self.playlist_track_indexes, dtype=np.int32)
+        kept = ~removed_tracks[playlist_track_indexes]
+        kept_before = np.concatenate(([0], np.cumsum(kept)))
+        self.playlist_offsets = kept_before[playlist_offsets]
+        self.playlist_track_indexes = playlist_track_indexes[kept]
+        self.playlist_track_positions = np.frombuffer(self.playlist_track_positions, dtype=np.int32)[kept]
+
+    def new_track_row(self, track_i):
+        new_track = self.new_tracks[track_i]
+        track_values = dict(zip(FEATURE_NAMES, new_track.features),
+                            track_id=self.track_ids[track_i],
+                            track_name=new_track.track_name,
+                            artist_id=self.artist_ids[self.track_artists[track_i]],
+                            artist_name=new_track.artist_name,
+                            album_id=new_track.album_id,
+                            album_name=new_track.album_name)
+        return tuple(track_values[column] for column in TRACK_COLUMNS)
+
+
+def playlist_row(playlist_values, top_genres, playlist_aggregates):
+    """
+    Row (in PLAYLIST_COLUMNS order) of a playlist from its MPD column values, its top genres (up to 3), and a map of
+    each aggregate name to its values in FEATURE_NAMES order.
+    """
+    row_values = dict(playlist_values)
+    for genre_i, genre in enumerate(top_genres):
+        row_values[f'top_genre_{genre_i + 1}'] = genre
+    for aggregate_name in AGGREGATES:
+        for feature_name, feature_value in zip(FEATURE_NAMES, playlist_aggregates[aggregate_name]):
+            row_values[feature_aggregate_attr_name(feature_name, aggregate_name)] = feature_value
+    return tuple(row_values.get(column) for column in PLAYLIST_COLUMNS)
+
+
+def playlist_feature_sums_row(playlist_mpd_id, track_count, playlist_running_sums):
+    """
+    Row (in PLAYLIST_FEATURE_SUMS_COLUMNS order) of a playlist's running sums, from a map of each running sum name to
+    its values in FEATURE_NAMES order.
+    """
+    row_values = dict(playlist_mpd_id=playlist_mpd_id, track_count=track_count)
+    for running_sum_name in RUNNING_SUMS:
+        for feature_name, feature_value in zip(FEATURE_NAMES, playlist_running_sums[running_sum_name]):
+            row_values[feature_aggregate_attr_name(feature_name, running_sum_name)] = feature_value
+    return tuple(row_values[column] for column in PLAYLIST_FEATURE_SUMS_COLUMNS)
@@ -0,0 +1,132 @@
+"""
+Benchmark of the ingestion stages on synthetic MPD slices (see synthetic_mpd.py), a fake Spotify API and SQLite:
+
+    python benchmark.py [--scales 1,8,64] [--save-baseline | --baseline benchmark_baseline.json]
+
+Every scale is a run of `python -m ingest` loading that many slices into a new SQLite database. The per-stage
+throughput and peak RSS are read from the run's instrumentation metrics (see instrument.py). Against a baseline (saved
+from an earlier benchmark on the same machine), it exits with an error if a stage's throughput dropped, or the peak RSS
+grew, by more than the tolerance.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from instrument import RUN_STAGE_NAME, read_runs, summarize_run
+from synthetic_mpd import write_synthetic_slices
+
+ETL_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# Stages which take less than this in the baseline are too noisy to compare:
+MIN_COMPARED_STAGE_SECONDS = 0.1
+
+
+def run_scale(work_dir, data_path, slices_count, workers):
+    """
+    Runs the ingestion of the first slices_count slices into a new database, returning the summary of its stages (see
+    instrument.summarize_run) and its peak RSS.
+    """
+    database_path = os.path.join(work_dir, f'benchmark_{slices_count}.sqlite3')
+    metrics_path = os.path.join(work_dir, f'benchmark_{slices_count}.jsonl')
+    for path in (database_path, metrics_path):
+        if os.path.exists(path):
+            os.remove(path)
+
+    print(f'Ingesting {slices_count} synthetic slices...')
+    environment = dict(os.environ,
+                       PYTHONPATH=os.pathsep.join(filter(None, [ETL_PATH, os.getenv('PYTHONPATH')])))
+    subprocess.run([sys.executable, '-m', 'ingest',
+                    '--db-url', 'sqlite:///' + database_path,
+                    '--data-path', data_path,
+                    '--start-slice', '0',
+                    '--slices', str(slices_count),
+                    '--workers', str(workers),
+                    '--fake-spotify',
+                    '--snapshot-dir', '',
+                    '--metrics-path', metrics_path],
+                   cwd=work_dir, env=environment, stdout=subprocess.DEVNULL, check=True)
+
+    records = next(iter(read_runs(metrics_path).values()))
+    run_record = next(record for record in records if record['stage'] == RUN_STAGE_NAME)
+    return {'wall_s': run_record['wall_s'],
+            'max_rss_mb': run_record['max_rss_mb'],
+            'stages': {stage_name: {'wall_s': stage['wall_s'],
+                                    'rows': int(stage['rows']),
+                                    'rows_per_s': stage['rows_per_s']}
+                       for stage_name, stage in summarize_run(records).items()}}
+
+
+def print_results(results):
+    for scale, result in results.items():
+        max_rss_mb = f'{result["max_rss_mb"]:.1f}' if result['max_rss_mb'] is not None else '-'
+        print(f'{scale} slices: {result["wall_s"]:.3f}s, peak RSS {max_rss_mb} MB')
+        print(f'  {"stage":<20}{"wall s":>11}{"rows":>11}{"rows/s":>13}')
+        for stage_name, stage in result['stages'].items():
+            print(f'  {stage_name:<20}{stage["wall_s"]:>11.3f}{stage["rows"]:>11}{stage["rows_per_s"]:>13.1f}')
+
+
+def find_regressions(results, baseline_results, tolerance):
+    regressions = []
+    for scale, result in results.items():
+        baseline_result = baseline_results.get(scale)
+        if baseline_result is None:
+            continue
+        if result['max_rss_mb'] is not None and baseline_result['max_rss_mb'] is not None \
+                and result['max_rss_mb'] > baseline_result['max_rss_mb'] * (1 + tolerance):
+            regressions.append(f'{scale} slices: peak RSS {result["max_rss_mb"]:.1f} MB, was '
+                               f'{baseline_result["max_rss_mb"]:.1f} MB')
+        for stage_name, stage in result['stages'].items():
+            baseline_stage = baseline_result['stages'].get(stage_name)
+            if baseline_stage is None or baseline_stage['wall_s'] < MIN_COMPARED_STAGE_SECONDS \
+                    or not baseline_stage['rows_per_s']:
+                continue
+            if stage['rows_per_s'] < baseline_stage['rows_per_s'] * (1 - tolerance):
+                regressions.append(f'{scale} slices: {stage_name} at {stage["rows_per_s"]:.1f} rows/s, was '
+                                   f'{baseline_stage["rows_per_s"]:.1f} rows/s')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the ingestion stages on synthetic MPD slices.')
+    parser.add_argument('--scales', default='1,8,64',
+                        help='Comma separated numbers of slices to ingest, one run each (default: 1,8,64).')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of worker processes of the ingestion (default: 1).')
+    parser.add_argument('--work-dir', default='benchmark',
+                        help='Directory of the synthetic slices, databases and metrics (default: benchmark).')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic slices (default: 0).')
+    parser.add_argument('--baseline', default='benchmark_baseline.json',
+                        help='Results to compare against, if the file exists (default: benchmark_baseline.json).')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Save the results as the baseline instead of comparing against it.')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Fraction by which a stage\'s throughput can drop, or the peak RSS grow, before it is a '
+                             'regression (default: 0.25).')
+    args = parser.parse_args()
+
+    scales = [int(scale) for scale in args.scales.split(',')]
+    work_dir = os.path.abspath(args.work_dir)
+    data_path = os.path.join(work_dir, f'data_{args.seed}')
+    write_synthetic_slices(data_path, range(max(scales)), args.seed)
+
+    # JSON keys are strings, so the scales are too:
+    results = {str(scale): run_scale(work_dir, data_path, scale, args.workers) for scale in scales}
+    print_results(results)
+    with open(os.path.join(work_dir, 'benchmark_results.json'), 'w') as results_file:
+        json.dump(results, results_file, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        print(f'Saved the results as the baseline {args.baseline}.')
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            regressions = find_regressions(results, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print(f'Regressions from the baseline {args.baseline}:')
+            for regression in regressions:
+                print('  ' + regression)
+            raise SystemExit(1)
+        print(f'No regressions from the baseline {args.baseline}.')
@@ -0,0 +1,120 @@
+from sqlalchemy import delete, select, tuple_
+
+from manifest import mark_slice_loaded
+from models import Artist, Playlist, PlaylistFeatureSums, PlaylistTrack, Track
+from serving import rebuild_serving_rows
+
+# Number of rows sent per executemany. Large enough that the per-statement overhead is negligible, small enough to stay
+# well under MySQL's max_allowed_packet.
+LOAD_BATCH_SIZE = 10000
+
+ARTIST_COLUMNS = [column.name for column in Artist.__table__.columns]
+TRACK_COLUMNS = [column.name for column in Track.__table__.columns]
+PLAYLIST_COLUMNS = [column.name for column in Playlist.__table__.columns]
+PLAYLIST_TRACK_COLUMNS = [column.name for column in PlaylistTrack.__table__.columns]
+PLAYLIST_FEATURE_SUMS_COLUMNS = [column.name for column in PlaylistFeatureSums.__table__.columns]
+
+PLAYLIST_MPD_ID_INDEX = PLAYLIST_COLUMNS.index('playlist_mpd_id')
+PLAYLIST_TRACK_KEY_INDEXES = (PLAYLIST_TRACK_COLUMNS.index('playlist_mpd_id'), PLAYLIST_TRACK_COLUMNS.index('track_pos'))
+
+
+def entity_row(entity, columns):
+    return tuple(getattr(entity, column) for column in columns)
+
+
+def upsert_statement(connection, table):
+    """
+    INSERT statement for the table which updates the existing row instead when the primary key is already taken.
+    """
+    key_columns = [column.name for column in table.primary_key.columns]
+    if connection.dialect.name == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        statement = insert(table)
+        return statement.on_duplicate_key_update({column.name: statement.inserted[column.name]
+                                                  for column in table.columns if column.name not in key_columns})
+
+    if connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    statement = insert(table)
+    return statement.on_conflict_do_update(index_elements=key_columns,
+                                           set_={column.name: statement.excluded[column.name]
+                                                 for column in table.columns if column.name not in key_columns})
+
+
+def upsert_rows(connection, table, columns, rows, batch_size=LOAD_BATCH_SIZE):
+    """
+    Upserts plain row tuples (in the order of columns) with one executemany per batch, bypassing the ORM unit of work.
+    """
+    statement = upsert_statement(connection, table)
+    batch = []
+    for row in rows:
+        batch.append(dict(zip(columns, row)))
+        if len(batch) == batch_size:
+            connection.execute(statement, batch)
+            batch = []
+    if batch:
+        connection.execute(statement, batch)
+
+
+def delete_stale_rows(connection, key_columns, existing_keys, loaded_keys, batch_size=LOAD_BATCH_SIZE):
+    """
+    Deletes the rows of the existing keys which aren't loaded keys, returning their (sorted) keys.
+    """
+    stale_keys = sorted(set(existing_keys) - set(loaded_keys))
+    for start_index in range(0, len(stale_keys), batch_size):
+        stale_keys_batch = stale_keys[start_index:start_index + batch_size]
+        connection.execute(delete(key_columns[0].table).where(tuple_(*key_columns).in_(stale_keys_batch)))
+    return stale_keys
+
+
+def load_slice(engine, slice_i, content_hash, min_pid, max_pid, artist_rows, track_rows, playlist_rows,
+               playlist_track_rows, playlist_feature_sums_rows=(), batch_size=LOAD_BATCH_SIZE):
+    """
+    Loads the rows of a slice (whose playlists are from min_pid to max_pid inclusive) in its own transaction, and marks
+    it as loaded in the manifest in that same transaction. The rows are upserted in dependency order, so reloading a
+    slice only rewrites its rows. The playlists (and their PlaylistTracks and PlaylistFeatureSums) of the slice which
+    are no longer in it are deleted. Last, the slice's rows of the serving table (see serving.py) are rebuilt from the
+    loaded ones, so they are never out of date with a loaded slice.
+
+    Returns the mpd_ids of the deleted playlists.
+    """
+    playlist_rows = list(playlist_rows)
+    playlist_track_rows = list(playlist_track_rows)
+    with engine.begin() as connection:
+        upsert_rows(connection, Artist.__table__, ARTIST_COLUMNS, artist_rows, batch_size)
+        upsert_rows(connection, Track.__table__, TRACK_COLUMNS, track_rows, batch_size)
+        upsert_rows(connection, Playlist.__table__, PLAYLIST_COLUMNS, playlist_rows, batch_size)
+        upsert_rows(connection, PlaylistTrack.__table__, PLAYLIST_TRACK_COLUMNS, playlist_track_rows, batch_size)
+        upsert_rows(connection, PlaylistFeatureSums.__table__, PLAYLIST_FEATURE_SUMS_COLUMNS,
+                    playlist_feature_sums_rows, batch_size)
+
+        playlist_track_key_columns = [PlaylistTrack.playlist_mpd_id, PlaylistTrack.track_pos]
+        existing_playlist_track_keys = connection.execute(
+            select(*playlist_track_key_columns).where(PlaylistTrack.playlist_mpd_id.between(min_pid, max_pid))).all()
+        stale_playlist_track_keys = delete_stale_rows(
+            connection, playlist_track_key_columns, map(tuple, existing_playlist_track_keys),
+            ((playlist_track_row[PLAYLIST_TRACK_KEY_INDEXES[0]], playlist_track_row[PLAYLIST_TRACK_KEY_INDEXES[1]])
+             for playlist_track_row in playlist_track_rows))
+
+        # Not every database enforces the ON DELETE CASCADE, so the sums of the stale playlists are deleted first:
+        existing_playlist_feature_sums_keys = connection.execute(
+            select(PlaylistFeatureSums.playlist_mpd_id)
+            .where(PlaylistFeatureSums.playlist_mpd_id.between(min_pid, max_pid))).all()
+        delete_stale_rows(connection, [PlaylistFeatureSums.playlist_mpd_id],
+                          map(tuple, existing_playlist_feature_sums_keys),
+                          ((playlist_row[PLAYLIST_MPD_ID_INDEX],) for playlist_row in playlist_rows))
+        existing_playlist_keys = connection.execute(
+            select(Playlist.playlist_mpd_id).where(Playlist.playlist_mpd_id.between(min_pid, max_pid))).all()
+        stale_playlist_keys = delete_stale_rows(
+            connection, [Playlist.playlist_mpd_id], map(tuple, existing_playlist_keys),
+            ((playlist_row[PLAYLIST_MPD_ID_INDEX],) for playlist_row in playlist_rows))
+
+        serving_rows_count = rebuild_serving_rows(connection, min_pid, max_pid)
+        mark_slice_loaded(connection, slice_i, content_hash, len(playlist_rows))
+
+    print(f'Loaded slice {slice_i} ({len(playlist_rows)} playlists, {len(playlist_track_rows)} playlist tracks, '
+          f'deleted {len(stale_playlist_keys)} stale playlists and {len(stale_playlist_track_keys)} stale playlist '
+          f'tracks, rebuilt {serving_rows_count} serving rows).')
+    return [stale_playlist_key[0] for stale_playlist_key in stale_playlist_keys]
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from spotify_api import MAX_SPOTIFY_ARTISTS_PER_REQ, MAX_SPOTIFY_TRACKS_PER_REQ
+
+FAKE_GENRES = ['pop', 'rock', 'hip hop', 'rap', 'dance pop', 'edm', 'indie rock', 'country', 'r&b', 'jazz', 'folk',
+               'classical', 'metal', 'latin', 'soul']
+
+
+def fake_fraction(spotify_id, salt):
+    # Deterministic pseudo-random value in [0, 1) for an ID, so every run (and every server) agrees on the fake data.
+    return int(hashlib.md5((salt + spotify_id).encode()).hexdigest()[:8], 16) / 0x100000000
+
+
+def fake_audio_features(track_id):
+    return {'id': track_id,
+            'acousticness': fake_fraction(track_id, 'acousticness'),
+            'danceability': fake_fraction(track_id, 'danceability'),
+            'duration_ms': 60000 + int(fake_fraction(track_id, 'duration_ms') * 300000),
+            'energy': fake_fraction(track_id, 'energy'),
+            'instrumentalness': fake_fraction(track_id, 'instrumentalness'),
+            'key': int(fake_fraction(track_id, 'key') * 12),
+            'liveness': fake_fraction(track_id, 'liveness'),
+            'loudness': -60 * fake_fraction(track_id, 'loudness'),
+            'mode': int(fake_fraction(track_id, 'mode') * 2),
+            'speechiness': fake_fraction(track_id, 'speechiness'),
+            'tempo': 60 + 140 * fake_fraction(track_id, 'tempo'),
+            'time_signature': 3 + int(fake_fraction(track_id, 'time_signature') * 3),
+            'valence': fake_fraction(track_id, 'valence')}
+
+
+def fake_artist(artist_id):
+    genres_count = int(fake_fraction(artist_id, 'genres_count') * 4)
+    genres = []
+    for genre_i in range(genres_count):
+        genre = FAKE_GENRES[int(fake_fraction(artist_id, f'genre_{genre_i}') * len(FAKE_GENRES))]
+        if genre not in genres:
+            genres.append(genre)
+    return {'id': artist_id,
+            'name': 'Artist ' + artist_id,
+            'genres': genres,
+            'followers': {'total': int(fake_fraction(artist_id, 'followers') * 1000000)},
+            'popularity': int(fake_fraction(artist_id, 'popularity') * 100)}
+
+
+class FakeSpotifyServer:
+    """
+    Local HTTP server standing in for the /audio-features and /artists endpoints of the Spotify Web API, for testing and
+    benchmarking the SpotifyFetcher without credentials. It can add latency to every response, answer every
+    rate_limit_every-th request with a 429 (with a Retry-After of retry_after seconds), stall every stall_every-th
+    request for stall_seconds (to time out), and treat missing_track_ids as deleted from Spotify (null audio features).
+
+    Use as a context manager; base_url is what to give the SpotifyFetcher.
+    """
+
+    def __init__(self, latency=0.0, rate_limit_every=0, retry_after=0, stall_every=0, stall_seconds=1.0,
+                 missing_track_ids=()):
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.stall_every = stall_every
+        self.stall_seconds = stall_seconds
+        self.missing_track_ids = set(missing_track_ids)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.rate_limited = 0
+        self.stalled = 0
+        self.max_in_flight = 0
+        self.in_flight = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}/v1'
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def respond(self, path, ids):
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            rate_limited = self.rate_limit_every > 0 and self.requests % self.rate_limit_every == 0
+            if rate_limited:
+                self.rate_limited += 1
+            stalled = self.stall_every > 0 and self.requests % self.stall_every == 0
+            if stalled:
+                self.stalled += 1
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if stalled:
+                time.sleep(self.stall_seconds)
+            if rate_limited:
+                return 429, {'Retry-After': str(self.retry_after)}, {'error': {'status': 429,
+                                                                               'message': 'API rate limit exceeded'}}
+            if path == '/v1/audio-features':
+                return 200, {}, {'audio_features': [None if track_id in self.missing_track_ids
+                                                    else fake_audio_features(track_id) for track_id in ids]}
+            if path == '/v1/artists':
+                return 200, {}, {'artists': [fake_artist(artist_id) for artist_id in ids]}
+            return 404, {}, {'error': {'status': 404, 'message': 'Service not found'}}
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def handler_class(self):
+        fake_server = self
+
+        class FakeSpotifyHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                ids = parse_qs(url.query).get('ids', [''])[0].split(',')
+                status, headers, body = fake_server.respond(url.path, ids)
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for header_name, header_value in headers.items():
+                    self.send_header(header_name, header_value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return FakeSpotifyHandler
+
+
+class FakeSpotifyClient:
+    """
+    In-process stand-in for a SpotifyFetcher (with the same audio_features and artists methods, and the same counters),
+    answering from the same fake data as the FakeSpotifyServer without any HTTP, so that benchmarks of the ingestion
+    aren't bound by the API.
+    """
+
+    def __init__(self, missing_track_ids=()):
+        self.missing_track_ids = set(missing_track_ids)
+        self.calls = 0
+        self.retries = 0
+        self.bytes_received = 0
+
+    def audio_features(self, track_ids):
+        return self.fetch_batches(track_ids, MAX_SPOTIFY_TRACKS_PER_REQ,
+                                  lambda track_id: None if track_id in self.missing_track_ids
+                                  else fake_audio_features(track_id))
+
+    def artists(self, artist_ids):
+        return self.fetch_batches(artist_ids, MAX_SPOTIFY_ARTISTS_PER_REQ, fake_artist)
+
+    def fetch_batches(self, ids, batch_size, fake_payload):
+        ids = list(ids)
+        results = []
+        for start_index in range(0, len(ids), batch_size):
+            batch_results = [fake_payload(spotify_id) for spotify_id in ids[start_index:start_index + batch_size]]
+            # The payloads go through JSON like a response's would:
+            response_body = json.dumps(batch_results)
+            self.calls += 1
+            self.bytes_received += len(response_body)
+            results.extend(json.loads(response_body))
+        return results
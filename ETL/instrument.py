@@ -0,0 +1,207 @@
+"""
+Instrumentation of the ingestion stages, written as JSON lines (one record per stage, per slice for per-slice stages,
+and a final "run" record), and a report which summarizes and compares runs:
+
+    python instrument.py ingest_metrics.jsonl [RUN_ID ...]
+
+Without run IDs, the last two runs of the file are compared.
+"""
+import argparse
+import datetime
+import json
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import OrderedDict, defaultdict
+
+from sqlalchemy import event
+
+try:
+    import resource
+except ImportError:  # Windows:
+    resource = None
+
+RUN_STAGE_NAME = 'run'
+
+
+def max_rss_mb():
+    """
+    Peak resident set size of the process so far (not of the current stage only), or None where it's unavailable.
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, and in kilobytes elsewhere:
+    return max_rss / (1024 * 1024) if sys.platform == 'darwin' else max_rss / 1024
+
+
+class Stage:
+    def __init__(self, instrumentation, name, slice_i):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.slice_i = slice_i
+        self.counters_start = instrumentation.counters()
+        self.tracemalloc_snapshot = None
+        self.traced_peak = 0
+        if instrumentation.tracemalloc_top:
+            instrumentation.reset_traced_peak()
+            self.tracemalloc_snapshot = tracemalloc.take_snapshot()
+        instrumentation.open_stages.append(self)
+        self.cpu_start = time.process_time()
+        self.wall_start = time.perf_counter()
+
+    def finish(self, rows=None, **extra):
+        wall_seconds = time.perf_counter() - self.wall_start
+        cpu_seconds = time.process_time() - self.cpu_start
+        counters = self.instrumentation.counters()
+        self.instrumentation.open_stages.remove(self)
+        record = OrderedDict(run_id=self.instrumentation.run_id,
+                             stage=self.name,
+                             slice=self.slice_i,
+                             wall_s=round(wall_seconds, 6),
+                             cpu_s=round(cpu_seconds, 6),
+                             max_rss_mb=max_rss_mb(),
+                             rows=rows,
+                             rows_per_s=round(rows / wall_seconds, 1) if rows is not None and wall_seconds else None)
+        for counter_name, counter_value in counters.items():
+            record[counter_name] = counter_value - self.counters_start[counter_name]
+        if self.tracemalloc_snapshot is not None:
+            traced_peak = max(self.traced_peak, tracemalloc.get_traced_memory()[1])
+            record['py_peak_mb'] = round(traced_peak / (1024 * 1024), 3)
+            top_stats = tracemalloc.take_snapshot().compare_to(self.tracemalloc_snapshot, 'lineno')
+            record['top_allocations'] = [
+                {'where': f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}',
+                 'size_diff_kb': round(stat.size_diff / 1024, 1),
+                 'count_diff': stat.count_diff}
+                for stat in top_stats[:self.instrumentation.tracemalloc_top]]
+        record.update(extra)
+        self.instrumentation.write(record)
+        return record
+
+    def cancel(self):
+        self.instrumentation.open_stages.remove(self)
+
+
+class Instrumentation:
+    """
+    Measures the wall time, CPU time (of this process, including its threads but not worker processes), peak RSS, rows
+    per second, Spotify API calls, retries and bytes, and database round trips (cursor executions, where an executemany
+    is one) of each stage, appending a JSON line per stage to path.
+
+    With tracemalloc_top > 0, the Python heap peak and the top allocating lines of each stage are recorded as well,
+    which slows the run down considerably.
+    """
+
+    def __init__(self, path, engine=None, spotify_fetcher=None, tracemalloc_top=0, run_id=None):
+        self.path = path
+        # The start time (to be readable), with a random suffix so that runs started in the same second get their own:
+        self.run_id = run_id or f'{datetime.datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}'
+        self.spotify_fetcher = spotify_fetcher
+        self.tracemalloc_top = tracemalloc_top
+        self.db_round_trips = 0
+        self.db_round_trips_lock = threading.Lock()
+        self.open_stages = []
+        if engine is not None:
+            event.listen(engine, 'before_cursor_execute', self.count_db_round_trip)
+        if tracemalloc_top and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def reset_traced_peak(self):
+        # Stages can be nested (e.g. every stage is in the run stage), so the peak of the stages which are still open is
+        # kept before it's reset:
+        traced_peak = tracemalloc.get_traced_memory()[1]
+        for stage in self.open_stages:
+            stage.traced_peak = max(stage.traced_peak, traced_peak)
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+    def count_db_round_trip(self, *args):
+        # The lookups execute from several threads at once:
+        with self.db_round_trips_lock:
+            self.db_round_trips += 1
+
+    def counters(self):
+        spotify_fetcher = self.spotify_fetcher
+        return OrderedDict(db_round_trips=self.db_round_trips,
+                           api_calls=spotify_fetcher.calls if spotify_fetcher is not None else 0,
+                           api_retries=spotify_fetcher.retries if spotify_fetcher is not None else 0,
+                           api_bytes=spotify_fetcher.bytes_received if spotify_fetcher is not None else 0)
+
+    def start_stage(self, name, slice_i=None):
+        return Stage(self, name, slice_i)
+
+    def write(self, record):
+        with open(self.path, 'a') as metrics_file:
+            metrics_file.write(json.dumps(record) + '\n')
+
+
+def read_runs(path):
+    runs = OrderedDict()
+    with open(path) as metrics_file:
+        for line in metrics_file:
+            if line.strip():
+                record = json.loads(line)
+                runs.setdefault(record['run_id'], []).append(record)
+    return runs
+
+
+def summarize_run(records):
+    """
+    Totals of each stage of a run (summed over its slices), in the order the stages first ran.
+    """
+    stages = OrderedDict()
+    for record in records:
+        if record['stage'] == RUN_STAGE_NAME:
+            continue
+        stage = stages.setdefault(record['stage'], defaultdict(float))
+        stage['count'] += 1
+        for key in ('wall_s', 'cpu_s', 'rows', 'db_round_trips', 'api_calls', 'api_bytes'):
+            stage[key] += record.get(key) or 0
+        stage['max_rss_mb'] = max(stage['max_rss_mb'], record.get('max_rss_mb') or 0)
+    for stage in stages.values():
+        stage['rows_per_s'] = stage['rows'] / stage['wall_s'] if stage['rows'] and stage['wall_s'] else 0
+    return stages
+
+
+def print_run(run_id, records):
+    print(f'Run {run_id}:')
+    print(f'{"stage":<20}{"slices":>7}{"wall s":>11}{"cpu s":>11}{"rows/s":>12}{"db trips":>10}{"api calls":>10}'
+          f'{"api MB":>9}{"max RSS MB":>12}')
+    for stage_name, stage in summarize_run(records).items():
+        print(f'{stage_name:<20}{int(stage["count"]):>7}{stage["wall_s"]:>11.3f}{stage["cpu_s"]:>11.3f}'
+              f'{stage["rows_per_s"]:>12.1f}{int(stage["db_round_trips"]):>10}{int(stage["api_calls"]):>10}'
+              f'{stage["api_bytes"] / (1024 * 1024):>9.2f}{stage["max_rss_mb"]:>12.1f}')
+
+
+def print_comparison(base_run_id, base_records, run_id, records):
+    print(f'Run {run_id} compared to run {base_run_id}:')
+    print(f'{"stage":<20}{"base wall s":>13}{"wall s":>11}{"change":>9}{"base rows/s":>13}{"rows/s":>12}')
+    base_stages = summarize_run(base_records)
+    for stage_name, stage in summarize_run(records).items():
+        base_stage = base_stages.get(stage_name)
+        if base_stage is None:
+            print(f'{stage_name:<20}{"-":>13}{stage["wall_s"]:>11.3f}')
+            continue
+        change = (stage['wall_s'] / base_stage['wall_s'] - 1) * 100 if base_stage['wall_s'] else 0
+        print(f'{stage_name:<20}{base_stage["wall_s"]:>13.3f}{stage["wall_s"]:>11.3f}{change:>+8.1f}%'
+              f'{base_stage["rows_per_s"]:>13.1f}{stage["rows_per_s"]:>12.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Summarize and compare ingestion runs from their metrics.')
+    parser.add_argument('metrics_path', help='JSON lines metrics file written by the ingestion.')
+    parser.add_argument('run_ids', nargs='*',
+                        help='Runs to summarize, where the later ones are compared to the first one (default: the '
+                             'last two runs).')
+    args = parser.parse_args()
+
+    runs = read_runs(args.metrics_path)
+    run_ids = args.run_ids or list(runs)[-2:]
+    for run_id in run_ids:
+        print_run(run_id, runs[run_id])
+        print()
+    for run_id in run_ids[1:]:
+        print_comparison(run_ids[0], runs[run_ids[0]], run_id, runs[run_id])
+        print()
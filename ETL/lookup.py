@@ -0,0 +1,30 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import select
+
+# IDs per IN list. Small enough for any max_allowed_packet and for MySQL to plan as a few index range lookups.
+LOOKUP_CHUNK_SIZE = 1000
+LOOKUP_MAX_WORKERS = 4
+
+
+def fetch_rows_by_id(engine, id_column, columns, ids, chunk_size=LOOKUP_CHUNK_SIZE, max_workers=LOOKUP_MAX_WORKERS):
+    """
+    Fetches the given columns of the rows whose id_column is in ids, returning a map of each found ID to its Row.
+
+    Instead of one huge IN list, the IDs are queried in bounded chunks, up to max_workers at a time (each on its own
+    pooled connection). Only the given columns are selected, and the rows are plain Core Rows rather than ORM entities.
+    """
+    ids = list(ids)
+    chunks = [ids[start_index:start_index + chunk_size] for start_index in range(0, len(ids), chunk_size)]
+    statement_columns = [id_column] + [column for column in columns if column is not id_column]
+
+    def fetch_chunk(chunk):
+        with engine.connect() as connection:
+            return connection.execute(select(*statement_columns).where(id_column.in_(chunk))).all()
+
+    rows_by_id = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for chunk_rows in executor.map(fetch_chunk, chunks):
+            for row in chunk_rows:
+                rows_by_id[row[0]] = row
+    return rows_by_id
@@ -0,0 +1,40 @@
+import datetime
+
+from sqlalchemy import delete, insert, select
+
+from models import SLICE_STATUS_LOADED, SLICE_STATUS_PENDING, IngestSlice
+
+
+def slices_to_load(engine, slice_hashes, force=False):
+    """
+    Returns the slices (of a map of slice numbers to content hashes) which aren't loaded with the same content yet, in
+    slice order. With force, every slice is returned.
+    """
+    if force:
+        return sorted(slice_hashes)
+    with engine.connect() as connection:
+        loaded_slice_hashes = dict(connection.execute(
+            select(IngestSlice.slice_i, IngestSlice.content_hash)
+            .where(IngestSlice.slice_i.in_(list(slice_hashes)), IngestSlice.status == SLICE_STATUS_LOADED)).all())
+    return sorted(slice_i for slice_i, content_hash in slice_hashes.items()
+                  if loaded_slice_hashes.get(slice_i) != content_hash)
+
+
+def set_slice_status(connection, slice_i, content_hash, status, playlists_count=None):
+    connection.execute(delete(IngestSlice).where(IngestSlice.slice_i == slice_i))
+    connection.execute(insert(IngestSlice).values(slice_i=slice_i,
+                                                  content_hash=content_hash,
+                                                  status=status,
+                                                  playlists_count=playlists_count,
+                                                  updated_at=datetime.datetime.utcnow()))
+
+
+def mark_slices_pending(engine, slice_hashes):
+    with engine.begin() as connection:
+        for slice_i, content_hash in slice_hashes.items():
+            set_slice_status(connection, slice_i, content_hash, SLICE_STATUS_PENDING)
+
+
+def mark_slice_loaded(connection, slice_i, content_hash, playlists_count):
+    # Called in the slice's load transaction, so the slice is only marked as loaded if all of its rows are.
+    set_slice_status(connection, slice_i, content_hash, SLICE_STATUS_LOADED, playlists_count)
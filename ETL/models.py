@@ -0,0 +1,177 @@
+from sqlalchemy.orm import declarative_base, relationship, backref
+from sqlalchemy import ForeignKey, Column, Integer, Date, DateTime, String, JSON, Boolean, Float, Double
+
+
+# Special encoding needed to be compatible with emojis which are in some playlist titles:
+class Base(object):
+    __table_args__ = {
+        'mysql_default_charset': 'utf8mb4',
+        'mysql_collate': 'utf8mb4_bin',
+    }
+
+
+Base = declarative_base(cls=Base)
+
+
+# Association/Junction table for the many-to-many relationship between playlists and songs:
+#   (See https://docs.sqlalchemy.org/en/20/orm/basic_relationships.html#association-object)
+class PlaylistTrack(Base):
+    __tablename__ = 'playlist_track'
+    playlist_mpd_id = Column(Integer, ForeignKey('playlist.playlist_mpd_id', ondelete='CASCADE'), primary_key=True)
+    # Indexed as the reverse (Track to playlists) index, which refresh.py finds the playlists of changed Tracks with:
+    track_id = Column(String(22), ForeignKey('track.track_id'), index=True)
+    track_pos = Column(Integer, primary_key=True)
+
+    track = relationship('Track', backref=backref('playlist_tracks', cascade="save-update, delete, delete-orphan"))
+
+
+SLICE_STATUS_PENDING = 'pending'
+SLICE_STATUS_LOADED = 'loaded'
+
+# Playlist aggregates of the Track features, calculated by aggregates.calc_playlist_aggregates:
+AGGREGATES = ['avg', 'min', 'max', 'std']
+
+# Running sums of every Track feature over the tracks of a playlist, which its avg and std are updated from when a Track's
+# features change (see refresh.py):
+RUNNING_SUMS = ['sum', 'sumsq']
+
+# Value of an aggregate which is undefined for a playlist (e.g. the std of a single track playlist):
+AGGREGATE_DEFAULT = -1000000
+
+FEATURE_NAMES = ['acousticness',
+                 'danceability',
+                 'duration_ms',
+                 'energy',
+                 'instrumentalness',
+                 'key',
+                 'liveness',
+                 'loudness',
+                 'mode',
+                 'speechiness',
+                 'tempo',
+                 'time_signature',
+                 'valence']
+
+
+def feature_aggregate_attr_name(feature_name, aggregate_name):
+    return feature_name + '_' + aggregate_name
+
+
+class Playlist(Base):
+    __tablename__ = 'playlist'
+
+    playlist_mpd_id = Column(Integer, primary_key=True, autoincrement=False, unique=True, nullable=False)
+    playlist_name = Column(String(300), nullable=False)
+    mpd_generated_at = Column(DateTime, nullable=False)
+    modified_at = Column(Date, nullable=False)
+    num_tracks = Column(Integer, nullable=False)
+    num_artists = Column(Integer, nullable=False)
+    num_albums = Column(Integer, nullable=False)
+    num_followers = Column(Integer, nullable=False)
+    num_edits = Column(Integer, nullable=False)
+    is_collaborative = Column(Boolean, nullable=False)
+    duration_ms_total = Column(Integer, nullable=False)
+
+    top_genre_1 = Column(String(50))
+    top_genre_2 = Column(String(50))
+    top_genre_3 = Column(String(50))
+
+    for aggregate_name in AGGREGATES:
+        for feature_name in FEATURE_NAMES:
+            vars()[feature_aggregate_attr_name(feature_name, aggregate_name)] = Column(Float, default=AGGREGATE_DEFAULT)
+
+    tracks = relationship('PlaylistTrack', backref='playlist', cascade="save-update, delete, delete-orphan")
+
+    def as_dict(self):
+        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
+
+class PlaylistFeatureSums(Base):
+    __tablename__ = 'playlist_feature_sums'
+
+    playlist_mpd_id = Column(Integer, ForeignKey('playlist.playlist_mpd_id', ondelete='CASCADE'), primary_key=True,
+                             autoincrement=False)
+    track_count = Column(Integer, nullable=False)
+
+    # Double precision even in MySQL (where Float is single precision), as the avg and std are derived from them:
+    for running_sum_name in RUNNING_SUMS:
+        for feature_name in FEATURE_NAMES:
+            vars()[feature_aggregate_attr_name(feature_name, running_sum_name)] = Column(Double, nullable=False)
+
+
+# Features whose playlist averages the backend's recommendation queries filter on (see audio_feature_query in
+# backend/QueryBuilder.py), which are indexed in the serving table:
+SERVING_FEATURE_NAMES = ['acousticness',
+                         'danceability',
+                         'energy',
+                         'instrumentalness',
+                         'liveness',
+                         'loudness',
+                         'speechiness',
+                         'tempo',
+                         'valence']
+
+
+# Denormalized playlist tracks (with the names and feature averages of their playlist) that the backend's recommendation
+# queries read, under the table name those were written against. Built from the other tables by serving.py:
+class ServingPlaylistTrack(Base):
+    __tablename__ = 'master2'
+
+    # The primary key leads with mpd_id, so it is also the index of the per-playlist lookups:
+    mpd_id = Column(Integer, primary_key=True, autoincrement=False)
+    track_pos = Column(Integer, primary_key=True, autoincrement=False)
+    pname = Column(String(300), nullable=False)
+    track_id = Column(String(22), nullable=False)
+    track_name = Column(String(300), nullable=False)
+    aname = Column(String(300), nullable=False, index=True)
+
+    for feature_name in FEATURE_NAMES:
+        vars()[feature_aggregate_attr_name(feature_name, 'avg')] = Column(
+            Float, default=AGGREGATE_DEFAULT, index=feature_name in SERVING_FEATURE_NAMES)
+
+
+class Track(Base):
+    __tablename__ = 'track'
+
+    track_id = Column(String(22), primary_key=True, unique=True, nullable=False, index=True)
+    track_name = Column(String(300), nullable=False)
+    artist_id = Column(String(22), ForeignKey('artist.artist_id'), nullable=False)
+    artist_name = Column(String(300), nullable=False)
+    album_id = Column(String(22), nullable=False)
+    album_name = Column(String(300), nullable=False)
+
+    artist = relationship('Artist', backref='tracks')
+
+    acousticness = Column(Float, nullable=False)
+    danceability = Column(Float, nullable=False)
+    duration_ms = Column(Integer, nullable=False)
+    energy = Column(Float, nullable=False)
+    instrumentalness = Column(Float, nullable=False)
+    key = Column(Integer, nullable=False)
+    liveness = Column(Float, nullable=False)
+    loudness = Column(Float, nullable=False)
+    mode = Column(Integer, nullable=False)
+    speechiness = Column(Float, nullable=False)
+    tempo = Column(Float, nullable=False)
+    time_signature = Column(Integer, nullable=False)
+    valence = Column(Float, nullable=False)
+
+
+class Artist(Base):
+    __tablename__ = 'artist'
+    artist_id = Column(String(22), primary_key=True, unique=True, nullable=False, index=True)
+    artist_name = Column(String(300), nullable=False)
+    genres = Column(JSON, nullable=False)
+    followers = Column(Integer, nullable=False)
+    popularity = Column(Integer, nullable=False)
+
+
+# Manifest of the ingested MPD slices, so that slices which are already loaded (and haven't changed since) are skipped,
+# and an interrupted ingestion only redoes the slices it didn't finish:
+class IngestSlice(Base):
+    __tablename__ = 'ingest_slice'
+    slice_i = Column(Integer, primary_key=True, autoincrement=False, nullable=False)
+    content_hash = Column(String(64), nullable=False)
+    status = Column(String(20), nullable=False)
+    playlists_count = Column(Integer)
+    updated_at = Column(DateTime, nullable=False)
@@ -0,0 +1,122 @@
+import datetime
+import hashlib
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import ijson
+
+SLICE_SIZE = 1000
+
+# The only parts of an MPD track's JSON that are needed to build its Track row. Keeping these instead of the raw dicts
+# (which also hold the URIs, pos, etc.) means a new track costs one small tuple until it is interned (see batch.py).
+MpdTrack = namedtuple('MpdTrack', ['track_name', 'artist_id', 'artist_name', 'album_id', 'album_name', 'duration_ms'])
+
+
+def uri_id(spotify_uri):
+    return spotify_uri[spotify_uri.rindex(':') + 1:]
+
+
+def slice_file_name(slice_i, slice_size=SLICE_SIZE):
+    start_playlist_i = slice_i * slice_size
+    end_playlist_i = ((slice_i + 1) * slice_size) - 1
+    return 'mpd.slice.' + str(start_playlist_i) + '-' + str(end_playlist_i) + '.json'
+
+
+def mpd_track(track):
+    return MpdTrack(track_name=track['track_name'],
+                    artist_id=uri_id(track['artist_uri']),
+                    artist_name=track['artist_name'],
+                    album_id=uri_id(track['album_uri']),
+                    album_name=track['album_name'],
+                    duration_ms=track['duration_ms'])
+
+
+def read_slice_generated_at(slice_file):
+    # The info object comes before the playlists in every MPD slice, so this stops after parsing the first few bytes.
+    slice_generated_on = next(ijson.items(slice_file, 'info.generated_on'))
+    return datetime.datetime.fromisoformat(slice_generated_on)
+
+
+def iter_slice_playlists(slice_path):
+    """
+    Yields (slice_generated_at, playlist) for every playlist in an MPD slice file. The file is parsed incrementally, so
+    only a single playlist's JSON is held in memory at a time rather than the whole ~30 MB slice.
+    """
+    with open(slice_path, 'rb') as slice_file:
+        slice_generated_at = read_slice_generated_at(slice_file)
+        slice_file.seek(0)
+        for playlist in ijson.items(slice_file, 'playlists.item', use_float=True):
+            yield slice_generated_at, playlist
+
+
+class SliceData:
+    """
+    The plain (picklable) result of parsing and transforming one MPD slice, so that slices can be transformed in worker
+    processes and merged back in the parent.
+    """
+    __slots__ = ('slice_i', 'playlists', 'tracks', 'min_pid', 'max_pid')
+
+    def __init__(self, slice_i):
+        self.slice_i = slice_i
+        # List of (playlist column values, [(track_pos, track_id), ...]) in slice order:
+        self.playlists = []
+        # Map of the slice's unique Track IDs to their MpdTrack data (first occurrence in the slice):
+        self.tracks = {}
+        self.min_pid = None
+        self.max_pid = None
+
+
+def transform_slice(slice_i, data_path, slice_size=SLICE_SIZE):
+    slice_data = SliceData(slice_i)
+    slice_path = os.path.join(data_path, slice_file_name(slice_i, slice_size))
+    for slice_generated_date_utc, playlist in iter_slice_playlists(slice_path):
+        playlist_pid = playlist['pid']
+        if slice_data.min_pid is None or playlist_pid < slice_data.min_pid:
+            slice_data.min_pid = playlist_pid
+        if slice_data.max_pid is None or playlist_pid > slice_data.max_pid:
+            slice_data.max_pid = playlist_pid
+        last_modified_epoch_seconds_utc = playlist['modified_at']
+        last_modified_date_utc = datetime.datetime.utcfromtimestamp(last_modified_epoch_seconds_utc).date()
+        playlist_values = dict(playlist_mpd_id=playlist_pid,
+                               playlist_name=playlist['name'],
+                               mpd_generated_at=slice_generated_date_utc,
+                               modified_at=last_modified_date_utc,
+                               num_tracks=playlist['num_tracks'],
+                               num_artists=playlist['num_artists'],
+                               num_albums=playlist['num_albums'],
+                               num_followers=playlist['num_followers'],
+                               num_edits=playlist['num_edits'],
+                               is_collaborative=(playlist['collaborative'] == 'true'),
+                               duration_ms_total=playlist['duration_ms'])
+        playlist_track_ids = []
+        for track in playlist['tracks']:
+            track_id = uri_id(track['track_uri'])
+            playlist_track_ids.append((track['pos'], track_id))
+            if track_id not in slice_data.tracks:
+                slice_data.tracks[track_id] = mpd_track(track)
+        slice_data.playlists.append((playlist_values, playlist_track_ids))
+    return slice_data
+
+
+def transform_slices(slice_range, data_path, slice_size=SLICE_SIZE, workers=1):
+    """
+    Yields the SliceData of every slice in slice_range, in slice order. With more than one worker the slices are parsed
+    and transformed in a process pool, but are still yielded in the same (deterministic) order.
+    """
+    if workers <= 1:
+        for slice_i in slice_range:
+            yield transform_slice(slice_i, data_path, slice_size)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(transform_slice, slice_range, repeat(data_path), repeat(slice_size))
+
+
+def slice_content_hash(slice_i, data_path, slice_size=SLICE_SIZE):
+    content_hash = hashlib.sha256()
+    with open(os.path.join(data_path, slice_file_name(slice_i, slice_size)), 'rb') as slice_file:
+        for chunk in iter(lambda: slice_file.read(1024 * 1024), b''):
+            content_hash.update(chunk)
+    return content_hash.hexdigest()
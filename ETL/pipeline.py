@@ -0,0 +1,461 @@
+"""
+Stages of the ingestion of MPD slices, which run_ingestion runs in order (see ingest.py for the command line). Each
+stage is a function of the engine and the IngestBatch (see batch.py) it works on, so the stages can be run, tested and
+benchmarked on their own.
+"""
+import os
+import time
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy_utils import create_database, database_exists
+
+from aggregates import artist_genre_matrix, calc_playlist_aggregates, calc_playlist_sums, calc_playlist_top_genres
+from batch import IngestBatch, playlist_feature_sums_row, playlist_row, unique_in_order
+from bulk_load import ARTIST_COLUMNS, LOAD_BATCH_SIZE, load_slice
+from instrument import RUN_STAGE_NAME, Instrumentation
+from lookup import LOOKUP_CHUNK_SIZE, LOOKUP_MAX_WORKERS, fetch_rows_by_id
+from manifest import mark_slices_pending, slices_to_load
+from models import AGGREGATES, FEATURE_NAMES, Artist, Base, Track
+from mpd import SLICE_SIZE, slice_content_hash, transform_slices
+from serving import migrate_legacy_serving_table, rebuild_loaded_slices
+from snapshot import Snapshot
+
+
+def create_database_engine(db_url, slice_size=SLICE_SIZE):
+    engine = create_engine(db_url)
+
+    # Create database if it does not exist.
+    if not database_exists(engine.url):
+        create_database(engine.url)
+
+    # create_all skips the tables which exist, so a serving table of the legacy schema is moved out of the way first:
+    serving_table_migrated = migrate_legacy_serving_table(engine)
+    # Ensure that the tables are created in the db:
+    Base.metadata.create_all(engine)
+    # create_all only creates the indexes of the tables it creates, so the ones added since (like the reverse index of
+    # playlist_track.track_id) are created on their own:
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    if serving_table_migrated:
+        rebuild_loaded_slices(engine, slice_size)
+    return engine
+
+
+def fetch_database_tracks(engine, batch, feature_matrix, track_indexes, chunk_size, max_workers):
+    """
+    Fills in the features (and artists) of the given track indexes of the batch which are already in the database, which
+    then aren't new tracks anymore. Returns the number of tracks found.
+    """
+    # The lookups are chunked (see lookup.py), and only fetch the columns that the genre and aggregate calculations
+    # need.
+    database_track_rows = fetch_rows_by_id(engine, Track.track_id,
+                                           [Track.artist_id] + [getattr(Track, name) for name in FEATURE_NAMES],
+                                           [batch.track_ids[track_i] for track_i in track_indexes], chunk_size,
+                                           max_workers)
+    for track_id, database_track_row in database_track_rows.items():
+        track_i = batch.track_index[track_id]
+        batch.track_artists[track_i] = batch.intern_artist(database_track_row.artist_id)
+        feature_matrix[track_i] = database_track_row[2:]
+        del batch.new_tracks[track_i]
+    return len(database_track_rows)
+
+
+def fetch_database_artists(engine, batch, artist_indexes, artist_genres, chunk_size, max_workers):
+    """
+    Fills in the genres (in artist_genres, by artist index) of the given artist indexes of the batch which are in the
+    database. Returns the IDs of those artists.
+    """
+    database_artist_rows = fetch_rows_by_id(engine, Artist.artist_id, [Artist.genres],
+                                            [batch.artist_ids[artist_i] for artist_i in artist_indexes], chunk_size,
+                                            max_workers)
+    for artist_id, database_artist_row in database_artist_rows.items():
+        artist_genres[batch.artist_index[artist_id]] = database_artist_row.genres
+    return set(database_artist_rows)
+
+
+def find_artists_to_pull(batch, new_track_indexes, known_artist_ids):
+    artist_ids_to_pull = set()
+    for track_i in new_track_indexes:
+        artist_id = batch.artist_ids[batch.track_artists[track_i]]
+        if artist_id not in known_artist_ids:
+            artist_ids_to_pull.add(artist_id)
+    return artist_ids_to_pull
+
+
+def create_spotify_client(fake=False, cache_path=None, cache_ttl_days=30, max_in_flight=8, requests_per_second=10):
+    """
+    Returns the Spotify client (a SpotifyFetcher, or a FakeSpotifyClient if fake) and its SpotifyCache (or None), which
+    the caller should close.
+    """
+    if fake:
+        from fake_spotify import FakeSpotifyClient
+        return FakeSpotifyClient(), None
+
+    from spotipy.oauth2 import SpotifyClientCredentials
+
+    from spotify_api import SPOTIFY_API_BASE_URL, SpotifyFetcher
+    from spotify_cache import SpotifyCache
+
+    spotify_credentials = SpotifyClientCredentials()
+    spotify_cache = SpotifyCache(cache_path, ttl_seconds=cache_ttl_days * 24 * 60 * 60) if cache_path else None
+    spotify = SpotifyFetcher(token_provider=lambda: spotify_credentials.get_access_token(as_dict=False),
+                             base_url=os.getenv('SPOTIFY_API_BASE_URL', SPOTIFY_API_BASE_URL),
+                             max_in_flight=max_in_flight,
+                             requests_per_second=requests_per_second,
+                             cache=spotify_cache)
+    return spotify, spotify_cache
+
+
+def pull_audio_features(spotify, batch, feature_matrix, track_indexes_to_pull, failed_tracks,
+                        failed_track_ids_path='failed_track_ids.txt'):
+    """
+    Pulls the audio features of the given new track indexes into their NewTrack and the feature_matrix. The tracks which
+    have none are set in the failed_tracks mask (which the caller removes from their playlists with
+    batch.remove_tracks, so they aren't loaded), and their IDs appended to failed_track_ids_path.
+    """
+    audio_features_response = spotify.audio_features(batch.track_ids[track_i] for track_i in track_indexes_to_pull)
+    for track_i, track_audio_features in zip(track_indexes_to_pull, audio_features_response):
+        # If track is not found in Spotify, then this probably means it was deleted from Spotify for whatever reason:
+        if track_audio_features is None:
+            track_id = batch.track_ids[track_i]
+            print(f"No audio features found for Track ID: {track_id}")
+            failed_tracks[track_i] = True
+            with open(failed_track_ids_path, "a+") as no_audio_features_file:
+                no_audio_features_file.write(f'{track_id}\n')
+            continue
+
+        # Fill Track Spotify Features:
+        new_track = batch.new_tracks[track_i]
+        new_track.features = tuple(track_audio_features[feature_name] for feature_name in FEATURE_NAMES)
+        feature_matrix[track_i] = new_track.features
+
+
+def pull_artists(spotify, batch, artist_ids, artist_genres):
+    """
+    Pulls the given artists, filling in their artist_genres. Returns the map of their artist indexes to their Artist
+    rows.
+    """
+    artist_ids = list(artist_ids)
+    pulled_artist_rows = dict()
+    for artist_id, artist_data in zip(artist_ids, spotify.artists(artist_ids)):
+        artist_genres[batch.artist_index[artist_id]] = artist_data['genres']
+        artist_values = dict(artist_id=artist_id,
+                             artist_name=artist_data['name'],
+                             genres=artist_data['genres'],
+                             followers=artist_data['followers']['total'],
+                             popularity=artist_data['popularity'])
+        pulled_artist_rows[batch.artist_index[artist_id]] = tuple(artist_values[column] for column in ARTIST_COLUMNS)
+    return pulled_artist_rows
+
+
+def calc_slice_genres_and_aggregates(batch, slice_i, track_artists, feature_matrix, artist_genres):
+    """
+    Returns the top genres of every playlist of a slice of the batch (after its failed tracks are removed), the map of
+    each aggregate name to its (playlists x features) matrix, and the same for each running sum name (see
+    models.RUNNING_SUMS). track_artists is the batch's as a NumPy array.
+    """
+    playlists_start, playlists_stop = batch.slice_playlist_ranges[slice_i]
+    slice_playlist_offsets = batch.playlist_offsets[playlists_start:playlists_stop + 1]
+    slice_track_rows = batch.playlist_track_indexes[slice_playlist_offsets[0]:slice_playlist_offsets[-1]]
+    slice_playlist_offsets = slice_playlist_offsets - slice_playlist_offsets[0]
+
+    # The genres of the slice's artists are interned to genre IDs on their own, so a slice only costs its own artists
+    # (the genre IDs don't change the top genres, whose ties are broken by first occurrence), and counted for every
+    # playlist of the slice at once:
+    slice_artists, slice_track_artists = np.unique(track_artists[slice_track_rows], return_inverse=True)
+    genre_names, artist_genre_offsets, artist_genre_ids = artist_genre_matrix(
+        [artist_genres[artist_i] for artist_i in slice_artists.tolist()])
+    playlist_top_genres = calc_playlist_top_genres(slice_playlist_offsets, np.arange(len(slice_track_rows)),
+                                                   slice_track_artists, genre_names, artist_genre_offsets,
+                                                   artist_genre_ids)
+
+    # The aggregates are calculated over the matrix of the Track features, a slice of playlists at a time so that the
+    # (extended precision) temporary matrices stay small:
+    playlist_aggregates = calc_playlist_aggregates(feature_matrix, slice_playlist_offsets, slice_track_rows)
+    _, playlist_running_sums = calc_playlist_sums(feature_matrix, slice_playlist_offsets, slice_track_rows)
+    return playlist_top_genres, playlist_aggregates, playlist_running_sums
+
+
+class SliceRows:
+    __slots__ = ('track_indexes', 'new_track_indexes', 'artist_rows', 'playlist_rows', 'playlist_track_rows',
+                 'playlist_feature_sums_rows')
+
+    def __init__(self, track_indexes, new_track_indexes, artist_rows, playlist_rows, playlist_track_rows,
+                 playlist_feature_sums_rows):
+        # Every track of the slice, including the ones already in the database, in order of first occurrence:
+        self.track_indexes = track_indexes
+        # The new tracks the slice is the first to have, which are loaded with it (as are their pulled artists):
+        self.new_track_indexes = new_track_indexes
+        self.artist_rows = artist_rows
+        self.playlist_rows = playlist_rows
+        self.playlist_track_rows = playlist_track_rows
+        self.playlist_feature_sums_rows = playlist_feature_sums_rows
+
+
+class SliceRowsBuilder:
+    """
+    Builds the rows of the batch's slices, one slice at a time, so the rows only exist while their slice is loaded.
+    Each new track (and pulled artist) is in the rows of the first slice to have it.
+    """
+
+    def __init__(self, batch, pulled_artist_rows):
+        self.batch = batch
+        self.pulled_artist_rows = pulled_artist_rows
+        self.loaded_tracks = np.zeros(len(batch.track_ids), dtype=bool)
+        self.loaded_artists = set()
+
+    def slice_rows(self, slice_i, playlist_top_genres, playlist_aggregates, playlist_running_sums):
+        """
+        Returns the SliceRows of a slice, from the top genres, aggregates and running sums of its playlists (see
+        calc_slice_genres_and_aggregates).
+        """
+        batch = self.batch
+        playlists_start, playlists_stop = batch.slice_playlist_ranges[slice_i]
+        # Python lists index faster than the NumPy arrays, one element at a time:
+        playlist_offsets = batch.playlist_offsets[playlists_start:playlists_stop + 1].tolist()
+        slice_track_indexes = batch.playlist_track_indexes[playlist_offsets[0]:playlist_offsets[-1]]
+        slice_track_positions = batch.playlist_track_positions[playlist_offsets[0]:playlist_offsets[-1]].tolist()
+        track_indexes = unique_in_order(slice_track_indexes)
+        slice_track_indexes = slice_track_indexes.tolist()
+
+        new_track_indexes = [track_i for track_i in track_indexes.tolist()
+                             if track_i in batch.new_tracks and not self.loaded_tracks[track_i]]
+        self.loaded_tracks[new_track_indexes] = True
+        artist_rows = []
+        for track_i in new_track_indexes:
+            artist_i = batch.track_artists[track_i]
+            if artist_i in self.pulled_artist_rows and artist_i not in self.loaded_artists:
+                self.loaded_artists.add(artist_i)
+                artist_rows.append(self.pulled_artist_rows[artist_i])
+
+        playlist_rows = []
+        playlist_track_rows = []
+        playlist_feature_sums_rows = []
+        for slice_playlist_i, playlist_values in enumerate(batch.playlists[playlists_start:playlists_stop]):
+            playlist_mpd_id = playlist_values['playlist_mpd_id']
+            start = playlist_offsets[slice_playlist_i] - playlist_offsets[0]
+            stop = playlist_offsets[slice_playlist_i + 1] - playlist_offsets[0]
+            playlist_rows.append(playlist_row(
+                playlist_values, playlist_top_genres[slice_playlist_i],
+                {aggregate_name: aggregate_values[slice_playlist_i].tolist()
+                 for aggregate_name, aggregate_values in playlist_aggregates.items()}))
+            playlist_track_rows.extend((playlist_mpd_id, batch.track_ids[track_i], track_pos)
+                                       for track_i, track_pos in zip(slice_track_indexes[start:stop],
+                                                                     slice_track_positions[start:stop]))
+            playlist_feature_sums_rows.append(playlist_feature_sums_row(
+                playlist_mpd_id, stop - start,
+                {running_sum_name: running_sum_values[slice_playlist_i].tolist()
+                 for running_sum_name, running_sum_values in playlist_running_sums.items()}))
+        return SliceRows(track_indexes, new_track_indexes, artist_rows, playlist_rows, playlist_track_rows,
+                         playlist_feature_sums_rows)
+
+
+def snapshot_slice(snapshot, batch, slice_i, slice_rows, feature_matrix, playlist_aggregates, deleted_playlist_mpd_ids):
+    """
+    Upserts a slice into the snapshot, with the aggregates of its playlists (see calc_slice_genres_and_aggregates).
+    """
+    playlists_start, playlists_stop = batch.slice_playlist_ranges[slice_i]
+    snapshot.upsert_slice([batch.track_ids[track_i] for track_i in slice_rows.track_indexes.tolist()],
+                          feature_matrix[slice_rows.track_indexes],
+                          [playlist_values['playlist_mpd_id']
+                           for playlist_values in batch.playlists[playlists_start:playlists_stop]],
+                          np.hstack([playlist_aggregates[aggregate_name] for aggregate_name in AGGREGATES]),
+                          deleted_playlist_mpd_ids)
+
+
+def run_ingestion(options):
+    """
+    Ingests the slices of the (parsed command line, see ingest.py) options into the database, stage by stage. The
+    batch sizes which are None default to the ones of bulk_load.py and lookup.py.
+    """
+    load_batch_size = options.load_batch_size or LOAD_BATCH_SIZE
+    lookup_chunk_size = options.lookup_chunk_size or LOOKUP_CHUNK_SIZE
+    lookup_workers = options.lookup_workers or LOOKUP_MAX_WORKERS
+
+    engine = create_database_engine(options.db_url, options.slice_size)
+    instrumentation = Instrumentation(options.metrics_path, engine=engine, tracemalloc_top=options.trace_malloc)
+    slice_size = options.slice_size
+
+    # The slices are held in a compact IngestBatch (see batch.py) until they're loaded, instead of ORM entities:
+    batch = IngestBatch()
+
+    loaded_playlist_min_pid = (options.start_slice + options.slices) * slice_size
+    loaded_playlist_max_pid = 0
+
+    total_time_counter_start = time.perf_counter()
+    run_stage = instrumentation.start_stage(RUN_STAGE_NAME)
+
+    # Slices which are already loaded, from the same file content, are skipped. The rest are marked as pending until
+    # they are loaded, so if the ingestion is interrupted, running it again redoes only the slices it didn't finish.
+    slice_hashes = {}
+    for slice_i in range(options.start_slice, options.start_slice + options.slices):
+        hash_slices_stage = instrumentation.start_stage('hash_slices', slice_i)
+        slice_hashes[slice_i] = slice_content_hash(slice_i, options.data_path, slice_size)
+        hash_slices_stage.finish(rows=1)
+    slice_range = slices_to_load(engine, slice_hashes, force=options.force)
+    print(f'Skipping {len(slice_hashes) - len(slice_range)} already loaded slices, loading slices {slice_range}...')
+    if not slice_range:
+        run_stage.cancel()
+        print('All slices are already loaded.')
+        return
+    mark_slices_pending(engine, {slice_i: slice_hashes[slice_i] for slice_i in slice_range})
+
+    # The transform stage of a slice is timed from the end of the previous slice's, so with worker processes it only
+    # measures the time spent waiting for the slice and merging it:
+    transform_stage = instrumentation.start_stage('transform')
+    # Slices are parsed and transformed independently (in worker processes if --workers > 1), then merged here in
+    # slice order so that the playlists, the Track deduplication and everything after it is the same for any number
+    # of workers.
+    for slice_data in transform_slices(slice_range, options.data_path, slice_size, options.workers):
+        print(f'Merging MPD slice {slice_data.slice_i}...')
+        transform_stage.slice_i = slice_data.slice_i
+        loaded_playlist_min_pid = min(slice_data.min_pid, loaded_playlist_min_pid)
+        loaded_playlist_max_pid = max(slice_data.max_pid, loaded_playlist_max_pid)
+        batch.add_slice(slice_data)
+        transform_stage.finish(rows=len(slice_data.playlists))
+        transform_stage = instrumentation.start_stage('transform')
+    transform_stage.cancel()
+
+    batch.freeze()
+    playlists_count_stat = len(batch.playlists)
+    playlist_tracks_count_stat = len(batch.playlist_track_indexes)
+    unique_tracks_count_stat = len(batch.track_ids)
+    unique_artists_count_stat = len(batch.artist_ids)
+
+    # The features of every track index, from the database or the Spotify API. The rows of failed tracks stay NaN, but
+    # are removed from the playlists before the aggregates are calculated:
+    feature_matrix = np.full((unique_tracks_count_stat, len(FEATURE_NAMES)), np.nan)
+    # The artist index of every track index, which the lookups of the database tracks update:
+    track_artists = np.frombuffer(batch.track_artists, dtype=np.int32)
+
+    # The genres of every artist index (None until they're found), from the database or the Spotify API. The lookups
+    # intern the artists of the database tracks, so it grows with them:
+    artist_genres = []
+    # IDs of the artists which are in the database, or already pulled:
+    known_artist_ids = set()
+    # Rows of the pulled Artists, which are loaded along with the first slice to have one of their tracks:
+    pulled_artist_rows = dict()
+    # The failed tracks are removed from their playlists, and aren't loaded:
+    failed_tracks = np.zeros(unique_tracks_count_stat, dtype=bool)
+    looked_up_artists_count = 0
+    database_tracks_count = tracks_to_pull_count_stat = artists_to_pull_count_stat = 0
+
+    spotify, spotify_cache = create_spotify_client(options.fake_spotify, options.spotify_cache,
+                                                   options.spotify_cache_ttl_days, options.spotify_max_in_flight,
+                                                   options.spotify_requests_per_second)
+    instrumentation.spotify_fetcher = spotify
+
+    s = time.perf_counter()
+
+    # Each slice is ingested end to end before the next one: its existing Tracks and Artists are looked up, its new
+    # ones (the ones it is the first to have) pulled from the Spotify API, its playlists aggregated, and its rows
+    # loaded through Core (and committed, with its manifest entry) along with the new Tracks and Artists. So if the
+    # ingestion is interrupted, only the slice it was on (and the ones after it) are still pending. The rows are only
+    # made here, a slice at a time:
+    slice_rows_builder = SliceRowsBuilder(batch, pulled_artist_rows)
+    snapshot = Snapshot(options.snapshot_dir) if options.snapshot_dir else None
+    for slice_i, (tracks_start, tracks_stop) in batch.slice_track_ranges.items():
+        slice_track_indexes = range(tracks_start, tracks_stop)
+        print(f"Fetching the existing database Tracks of slice {slice_i} (need {len(slice_track_indexes)})...")
+        fetch_db_tracks_stage = instrumentation.start_stage('fetch_db_tracks', slice_i)
+        database_tracks_count += fetch_database_tracks(engine, batch, feature_matrix, slice_track_indexes,
+                                                       lookup_chunk_size, lookup_workers)
+        fetch_db_tracks_stage.finish(rows=len(slice_track_indexes))
+
+        # The artists interned since the previous slice's lookup, including the ones of the database Tracks:
+        slice_artist_indexes = range(looked_up_artists_count, len(batch.artist_ids))
+        looked_up_artists_count = len(batch.artist_ids)
+        artist_genres.extend([None] * len(slice_artist_indexes))
+        fetch_db_artists_stage = instrumentation.start_stage('fetch_db_artists', slice_i)
+        known_artist_ids |= fetch_database_artists(engine, batch, slice_artist_indexes, artist_genres,
+                                                   lookup_chunk_size, lookup_workers)
+        fetch_db_artists_stage.finish(rows=len(slice_artist_indexes))
+
+        build_new_tracks_stage = instrumentation.start_stage('build_new_tracks', slice_i)
+        slice_new_track_indexes = [track_i for track_i in slice_track_indexes if track_i in batch.new_tracks]
+        artist_ids_to_pull = find_artists_to_pull(batch, slice_new_track_indexes, known_artist_ids)
+        build_new_tracks_stage.finish(rows=len(slice_new_track_indexes))
+
+        print(f'Pulling the {len(slice_new_track_indexes)} new Tracks and {len(artist_ids_to_pull)} new Artists of '
+              f'slice {slice_i} from Spotify API...')
+        api_tracks_stage = instrumentation.start_stage('api_tracks', slice_i)
+        pull_audio_features(spotify, batch, feature_matrix, slice_new_track_indexes, failed_tracks)
+        api_tracks_stage.finish(rows=len(slice_new_track_indexes))
+
+        api_artists_stage = instrumentation.start_stage('api_artists', slice_i)
+        pulled_artist_rows.update(pull_artists(spotify, batch, artist_ids_to_pull, artist_genres))
+        known_artist_ids |= artist_ids_to_pull
+        api_artists_stage.finish(rows=len(artist_ids_to_pull))
+
+        tracks_to_pull_count_stat += len(slice_new_track_indexes)
+        artists_to_pull_count_stat += len(artist_ids_to_pull)
+
+        # The failed tracks of the slice are new to it, so they're only in its playlists and the later slices':
+        if failed_tracks[tracks_start:tracks_stop].any():
+            batch.remove_tracks(failed_tracks)
+
+        playlists_start, playlists_stop = batch.slice_playlist_ranges[slice_i]
+        aggregates_stage = instrumentation.start_stage('aggregates', slice_i)
+        playlist_top_genres, playlist_aggregates, playlist_running_sums = calc_slice_genres_and_aggregates(
+            batch, slice_i, track_artists, feature_matrix, artist_genres)
+        aggregates_stage.finish(rows=playlists_stop - playlists_start)
+
+        slice_rows = slice_rows_builder.slice_rows(slice_i, playlist_top_genres, playlist_aggregates,
+                                                   playlist_running_sums)
+        load_stage = instrumentation.start_stage('load', slice_i)
+        deleted_playlist_mpd_ids = load_slice(
+            engine,
+            slice_i,
+            slice_hashes[slice_i],
+            slice_i * slice_size,
+            (slice_i + 1) * slice_size - 1,
+            artist_rows=slice_rows.artist_rows,
+            track_rows=(batch.new_track_row(track_i) for track_i in slice_rows.new_track_indexes),
+            playlist_rows=slice_rows.playlist_rows,
+            playlist_track_rows=slice_rows.playlist_track_rows,
+            playlist_feature_sums_rows=slice_rows.playlist_feature_sums_rows,
+            batch_size=load_batch_size)
+        load_stage.finish(rows=len(slice_rows.artist_rows) + len(slice_rows.new_track_indexes)
+                          + len(slice_rows.playlist_rows) + len(slice_rows.playlist_track_rows),
+                          playlists=len(slice_rows.playlist_rows),
+                          playlist_tracks=len(slice_rows.playlist_track_rows),
+                          tracks=len(slice_rows.new_track_indexes),
+                          artists=len(slice_rows.artist_rows))
+
+        # Only written once the slice is committed, so the snapshot never has rows that aren't in the database:
+        if snapshot is not None:
+            snapshot_stage = instrumentation.start_stage('snapshot', slice_i)
+            snapshot_slice(snapshot, batch, slice_i, slice_rows, feature_matrix, playlist_aggregates,
+                           deleted_playlist_mpd_ids)
+            snapshot_stage.finish(rows=len(slice_rows.track_indexes) + len(slice_rows.playlist_rows))
+
+    if spotify_cache is not None:
+        spotify_cache.close()
+    print(f'\nFinished loading to database. Loaded {str(options.slices)} MPD slices (PIDs'
+          f' {loaded_playlist_min_pid}'
+          f'-{loaded_playlist_max_pid}), filled in from existing database data. There is a total of '
+          f'{playlists_count_stat} playlists, '
+          f'{playlist_tracks_count_stat} playlist tracks, '
+          f'{unique_tracks_count_stat} unique tracks ({database_tracks_count} from the database), '
+          f'{tracks_to_pull_count_stat} pulled new tracks, '
+          f'and {artists_to_pull_count_stat} pulled artists. (Took {time.perf_counter() - s}s).\n')
+
+    run_stage.finish(rows=playlists_count_stat,
+                     start_slice=options.start_slice,
+                     slices=slice_range,
+                     workers=options.workers,
+                     load_batch_size=load_batch_size,
+                     lookup_chunk_size=lookup_chunk_size,
+                     lookup_workers=lookup_workers,
+                     spotify_max_in_flight=options.spotify_max_in_flight,
+                     spotify_requests_per_second=options.spotify_requests_per_second,
+                     playlist_tracks=playlist_tracks_count_stat,
+                     unique_tracks=unique_tracks_count_stat,
+                     tracks_to_pull=tracks_to_pull_count_stat,
+                     unique_artists=unique_artists_count_stat,
+                     artists_to_pull=artists_to_pull_count_stat)
+    print(f'Appended the metrics of run {instrumentation.run_id} to {options.metrics_path}.')
+
+    print(f'Finished full ingestion of slices. (Took {time.perf_counter() - total_time_counter_start}s).')
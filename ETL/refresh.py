@@ -0,0 +1,310 @@
+"""
+Refresh of the playlist aggregates of Tracks whose audio features changed, without reloading their slices:
+
+    python -m refresh TRACK_IDS_FILE [--db-url URL] [--batch-size 10000] [--fake-spotify] [--snapshot-dir snapshot]
+
+The audio features of the Tracks (one ID per line, like failed_track_ids.txt) are pulled from the Spotify API again,
+and only the playlists which have one of the changed Tracks are updated, which are found through the index of
+playlist_track.track_id. Their avg and std are updated from their running sums (see models.PlaylistFeatureSums) with
+the difference of the changed features, and their min and max from the changed values, so their other tracks aren't
+read. Only the playlists whose min or max changed away from a changed Track (or which have no running sums yet) are
+recalculated from all of their tracks. The averages of their rows in the serving table (see serving.py) are updated
+too.
+
+The top genres only depend on the Tracks' artists, which don't change, so they are kept. Tracks which aren't in the
+database (e.g. the ones that failed to pull when their slice was ingested) aren't in any loaded playlist, and need
+their slices reloaded with `python -m ingest --force`.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import bindparam, func, select, update
+
+from aggregates import aggregates_from_sums
+from batch import playlist_feature_sums_row
+from bulk_load import PLAYLIST_FEATURE_SUMS_COLUMNS, upsert_rows
+from lookup import LOOKUP_CHUNK_SIZE
+from models import (AGGREGATES, FEATURE_NAMES, Playlist, PlaylistFeatureSums, PlaylistTrack, Track,
+                    feature_aggregate_attr_name)
+from pipeline import create_database_engine, create_spotify_client
+from serving import update_serving_averages
+from snapshot import Snapshot
+
+# Number of Tracks refreshed (and committed) at once:
+REFRESH_BATCH_SIZE = 10000
+
+FEATURE_COLUMNS = [getattr(Track, feature_name) for feature_name in FEATURE_NAMES]
+
+
+def aggregate_columns(model, aggregate_name):
+    return [getattr(model, feature_aggregate_attr_name(feature_name, aggregate_name)) for feature_name in FEATURE_NAMES]
+
+
+def features_changed(old_values, new_values):
+    """
+    Mask of the (tracks x features) rows of new_values which differ from old_values. They're compared at single
+    precision, which MySQL stores the Float columns in, so the features read back from it still equal the ones they were
+    stored from.
+    """
+    return (old_values.astype(np.float32) != new_values.astype(np.float32)).any(axis=1)
+
+
+def select_in_chunks(connection, statement, id_column, ids, chunk_size=LOOKUP_CHUNK_SIZE):
+    """
+    Rows of the statement where id_column is in ids, queried in bounded chunks on the given connection (so unlike
+    lookup.fetch_rows_by_id, they include the changes of its transaction).
+    """
+    ids = list(ids)
+    rows = []
+    for start_index in range(0, len(ids), chunk_size):
+        rows.extend(connection.execute(statement.where(id_column.in_(ids[start_index:start_index + chunk_size]))))
+    return rows
+
+
+class PlaylistsState:
+    """
+    Track counts, running sums, min and max (as (playlists x features) matrices) of a set of playlists.
+    """
+
+    def __init__(self, playlist_ids):
+        playlists_shape = (len(playlist_ids), len(FEATURE_NAMES))
+        self.playlist_ids = playlist_ids
+        self.playlist_index = {playlist_id: playlist_i for playlist_i, playlist_id in enumerate(playlist_ids)}
+        self.counts = np.zeros(len(playlist_ids), dtype=np.int64)
+        self.sums = np.zeros(playlists_shape)
+        self.sums_of_squares = np.zeros(playlists_shape)
+        self.mins = np.zeros(playlists_shape)
+        self.maxs = np.zeros(playlists_shape)
+        # Playlists loaded before the running sums existed don't have them:
+        self.has_sums = np.zeros(len(playlist_ids), dtype=bool)
+        # Playlists which have to be recalculated from all of their tracks:
+        self.rescanned = np.zeros(len(playlist_ids), dtype=bool)
+
+    def read(self, connection):
+        for row in select_in_chunks(connection,
+                                    select(Playlist.playlist_mpd_id, *aggregate_columns(Playlist, 'min'),
+                                           *aggregate_columns(Playlist, 'max')),
+                                    Playlist.playlist_mpd_id, self.playlist_ids):
+            playlist_i = self.playlist_index[row[0]]
+            self.mins[playlist_i] = row[1:1 + len(FEATURE_NAMES)]
+            self.maxs[playlist_i] = row[1 + len(FEATURE_NAMES):]
+
+        for row in select_in_chunks(connection,
+                                    select(PlaylistFeatureSums.playlist_mpd_id, PlaylistFeatureSums.track_count,
+                                           *aggregate_columns(PlaylistFeatureSums, 'sum'),
+                                           *aggregate_columns(PlaylistFeatureSums, 'sumsq')),
+                                    PlaylistFeatureSums.playlist_mpd_id, self.playlist_ids):
+            playlist_i = self.playlist_index[row[0]]
+            self.has_sums[playlist_i] = True
+            self.counts[playlist_i] = row[1]
+            self.sums[playlist_i] = row[2:2 + len(FEATURE_NAMES)]
+            self.sums_of_squares[playlist_i] = row[2 + len(FEATURE_NAMES):]
+        self.rescanned |= ~self.has_sums
+
+    def apply_changes(self, occurrence_playlists, occurrence_counts, old_values, new_values):
+        """
+        Updates the state with the change of the features of some tracks from old_values to new_values (one row per
+        occurrence of a track in a playlist, with the number of times the track is in it). Playlists whose min or max
+        can't be told without their other tracks are marked as rescanned.
+        """
+        occurrence_counts = occurrence_counts[:, np.newaxis]
+        np.add.at(self.sums, occurrence_playlists, occurrence_counts * (new_values - old_values))
+        np.add.at(self.sums_of_squares, occurrence_playlists,
+                  occurrence_counts * (new_values * new_values - old_values * old_values))
+
+        for extremes, reduce, is_beyond in ((self.mins, np.minimum, np.less_equal),
+                                            (self.maxs, np.maximum, np.greater_equal)):
+            # The new extreme is the changed tracks' if it's beyond the current one, otherwise it's the current one
+            # unless that was one of the changed tracks' old values:
+            changed_extremes = np.full(extremes.shape, np.inf if reduce is np.minimum else -np.inf)
+            reduce.at(changed_extremes, occurrence_playlists, new_values)
+            held_by_changed = np.zeros(extremes.shape, dtype=bool)
+            np.logical_or.at(held_by_changed, occurrence_playlists,
+                             is_beyond(old_values, extremes[occurrence_playlists]))
+            beyond = is_beyond(changed_extremes, extremes)
+            self.rescanned |= (held_by_changed & ~beyond).any(axis=1)
+            extremes[beyond] = changed_extremes[beyond]
+
+    def rescan(self, connection):
+        """
+        Recalculates the rescanned playlists from all of their tracks, in the database. Only their min and max are
+        recalculated if they have running sums.
+        """
+        features_count = len(FEATURE_NAMES)
+        extreme_columns = [func.min(column) for column in FEATURE_COLUMNS] + \
+                          [func.max(column) for column in FEATURE_COLUMNS]
+        sum_columns = [func.count()] + [func.sum(column) for column in FEATURE_COLUMNS] + \
+                      [func.sum(column * column) for column in FEATURE_COLUMNS]
+        for rescanned, columns in ((self.rescanned & self.has_sums, extreme_columns),
+                                   (self.rescanned & ~self.has_sums, extreme_columns + sum_columns)):
+            statement = select(PlaylistTrack.playlist_mpd_id, *columns) \
+                .join(Track, Track.track_id == PlaylistTrack.track_id) \
+                .group_by(PlaylistTrack.playlist_mpd_id)
+            rescanned_playlist_ids = [self.playlist_ids[playlist_i] for playlist_i in np.flatnonzero(rescanned)]
+            for row in select_in_chunks(connection, statement, PlaylistTrack.playlist_mpd_id, rescanned_playlist_ids):
+                playlist_i = self.playlist_index[row[0]]
+                self.mins[playlist_i] = row[1:1 + features_count]
+                self.maxs[playlist_i] = row[1 + features_count:1 + 2 * features_count]
+                if len(row) > 1 + 2 * features_count:
+                    self.counts[playlist_i] = row[1 + 2 * features_count]
+                    self.sums[playlist_i] = row[2 + 2 * features_count:2 + 3 * features_count]
+                    self.sums_of_squares[playlist_i] = row[2 + 3 * features_count:]
+
+    def aggregates(self):
+        """
+        Map of each aggregate name to its (playlists x features) matrix.
+        """
+        return dict(aggregates_from_sums(self.counts, self.sums, self.sums_of_squares), min=self.mins, max=self.maxs)
+
+
+class RefreshedBatch:
+    __slots__ = ('track_ids', 'track_features', 'playlist_ids', 'playlist_aggregates', 'rescanned_count')
+
+    def __init__(self, track_ids, track_features, playlist_ids, playlist_aggregates, rescanned_count):
+        self.track_ids = track_ids
+        self.track_features = track_features
+        self.playlist_ids = playlist_ids
+        # (playlists x features) matrix of each aggregate name:
+        self.playlist_aggregates = playlist_aggregates
+        self.rescanned_count = rescanned_count
+
+
+def refresh_batch(engine, track_features):
+    """
+    Updates the Tracks of a map of track IDs to their new features (in FEATURE_NAMES order), and the aggregates of
+    their playlists, in one transaction. Returns the RefreshedBatch of the Tracks whose features changed.
+    """
+    with engine.begin() as connection:
+        old_track_rows = select_in_chunks(connection, select(Track.track_id, *FEATURE_COLUMNS), Track.track_id,
+                                          track_features)
+        features_shape = (len(old_track_rows), len(FEATURE_NAMES))
+        old_values = np.array([old_track_row[1:] for old_track_row in old_track_rows],
+                              dtype=np.float64).reshape(features_shape)
+        new_values = np.array([track_features[old_track_row[0]] for old_track_row in old_track_rows],
+                              dtype=np.float64).reshape(features_shape)
+        changed = features_changed(old_values, new_values)
+        track_ids = [old_track_rows[track_i][0] for track_i in np.flatnonzero(changed).tolist()]
+        if not track_ids:
+            return RefreshedBatch([], np.zeros((0, len(FEATURE_NAMES))), [], {}, 0)
+        track_index = {track_id: track_i for track_i, track_id in enumerate(track_ids)}
+        old_values = old_values[changed]
+        new_values = new_values[changed]
+
+        # The playlists of the changed Tracks, through the reverse index, with how many times each Track is in each:
+        occurrences = select_in_chunks(connection,
+                                       select(PlaylistTrack.playlist_mpd_id, PlaylistTrack.track_id, func.count())
+                                       .group_by(PlaylistTrack.playlist_mpd_id, PlaylistTrack.track_id),
+                                       PlaylistTrack.track_id, track_ids)
+        playlists = PlaylistsState(sorted({occurrence[0] for occurrence in occurrences}))
+        playlists.read(connection)
+        occurrence_playlists = np.array([playlists.playlist_index[occurrence[0]] for occurrence in occurrences],
+                                        dtype=np.int64)
+        occurrence_tracks = np.array([track_index[occurrence[1]] for occurrence in occurrences], dtype=np.int64)
+        playlists.apply_changes(occurrence_playlists,
+                                np.array([occurrence[2] for occurrence in occurrences], dtype=np.float64),
+                                old_values[occurrence_tracks], new_values[occurrence_tracks])
+
+        track_table = Track.__table__
+        # The SET clauses of these are the other keys of the parameters:
+        connection.execute(update(track_table).where(track_table.c.track_id == bindparam('changed_track_id')),
+                           [dict(zip(FEATURE_NAMES, track_features[track_id]), changed_track_id=track_id)
+                            for track_id in track_ids])
+
+        # Only once the Tracks are updated, so the rescanned playlists have their new features:
+        playlists.rescan(connection)
+        playlist_aggregates = playlists.aggregates()
+
+        playlist_table = Playlist.__table__
+        aggregate_attr_names = [feature_aggregate_attr_name(feature_name, aggregate_name)
+                                for aggregate_name in AGGREGATES for feature_name in FEATURE_NAMES]
+        aggregate_rows = np.hstack([playlist_aggregates[aggregate_name] for aggregate_name in AGGREGATES]).tolist()
+        connection.execute(update(playlist_table)
+                           .where(playlist_table.c.playlist_mpd_id == bindparam('changed_playlist_mpd_id')),
+                           [dict(zip(aggregate_attr_names, aggregate_row), changed_playlist_mpd_id=playlist_id)
+                            for playlist_id, aggregate_row in zip(playlists.playlist_ids, aggregate_rows)])
+        upsert_rows(connection, PlaylistFeatureSums.__table__, PLAYLIST_FEATURE_SUMS_COLUMNS,
+                    (playlist_feature_sums_row(playlist_id, int(playlists.counts[playlist_i]),
+                                               {'sum': playlists.sums[playlist_i].tolist(),
+                                                'sumsq': playlists.sums_of_squares[playlist_i].tolist()})
+                     for playlist_i, playlist_id in enumerate(playlists.playlist_ids)))
+        update_serving_averages(connection, playlists.playlist_ids, playlist_aggregates['avg'])
+
+    return RefreshedBatch(track_ids, new_values, playlists.playlist_ids, playlist_aggregates,
+                          int(playlists.rescanned.sum()))
+
+
+def refresh_track_features(engine, track_features, batch_size=REFRESH_BATCH_SIZE, snapshot=None):
+    """
+    Refreshes the Tracks of a map of track IDs to their new features (in FEATURE_NAMES order) in batches of batch_size
+    Tracks, each committed on its own (and then upserted into the snapshot, if given). Returns the numbers of changed
+    Tracks, updated playlists and rescanned playlists.
+    """
+    track_ids = list(track_features)
+    changed_tracks_count = playlists_count = rescanned_count = 0
+    for start_index in range(0, len(track_ids), batch_size):
+        refreshed = refresh_batch(engine, {track_id: track_features[track_id]
+                                           for track_id in track_ids[start_index:start_index + batch_size]})
+        if snapshot is not None and refreshed.track_ids:
+            snapshot.upsert_slice(refreshed.track_ids, refreshed.track_features, refreshed.playlist_ids,
+                                  np.hstack([refreshed.playlist_aggregates[aggregate_name]
+                                             for aggregate_name in AGGREGATES]))
+        changed_tracks_count += len(refreshed.track_ids)
+        playlists_count += len(refreshed.playlist_ids)
+        rescanned_count += refreshed.rescanned_count
+        print(f'Refreshed {min(start_index + batch_size, len(track_ids))}/{len(track_ids)} Tracks '
+              f'({changed_tracks_count} changed, {playlists_count} playlists updated, {rescanned_count} rescanned).')
+    return changed_tracks_count, playlists_count, rescanned_count
+
+
+def read_track_ids(path):
+    with open(path) as track_ids_file:
+        return list(dict.fromkeys(line.strip() for line in track_ids_file if line.strip()))
+
+
+def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Refresh the audio features of Tracks, and the aggregates of their '
+                                                 'playlists.')
+    parser.add_argument('track_ids_path', help='File of the IDs of the Tracks to refresh, one per line.')
+    parser.add_argument('--db-url', default=os.getenv('SQL_CONN_STRING'),
+                        help='SQLAlchemy URL of the database (default: the SQL_CONN_STRING environment variable).')
+    parser.add_argument('--batch-size', type=int, default=REFRESH_BATCH_SIZE,
+                        help=f'Number of Tracks refreshed per transaction (default: {REFRESH_BATCH_SIZE}).')
+    parser.add_argument('--spotify-max-in-flight', type=int, default=8,
+                        help='Maximum number of concurrent Spotify API requests (default: 8).')
+    parser.add_argument('--spotify-requests-per-second', type=float, default=10,
+                        help='Average Spotify API request rate limit (default: 10).')
+    parser.add_argument('--fake-spotify', action='store_true',
+                        help='Answer the Spotify API requests from fake data in process (see fake_spotify.py).')
+    parser.add_argument('--snapshot-dir', default='snapshot',
+                        help='Directory of the columnar .npy snapshots to update, or an empty string to not update '
+                             'them (default: snapshot).')
+    options = parser.parse_args(argv)
+    if not options.db_url:
+        parser.error('the database URL is required, with --db-url or the SQL_CONN_STRING environment variable')
+
+    start_time = time.perf_counter()
+    engine = create_database_engine(options.db_url)
+    track_ids = read_track_ids(options.track_ids_path)
+
+    print(f'Pulling the audio features of {len(track_ids)} Tracks from Spotify API...')
+    # Without the cache, which would answer with the features that are being refreshed:
+    spotify, _ = create_spotify_client(options.fake_spotify, None, max_in_flight=options.spotify_max_in_flight,
+                                       requests_per_second=options.spotify_requests_per_second)
+    track_features = {}
+    for track_id, track_audio_features in zip(track_ids, spotify.audio_features(track_ids)):
+        if track_audio_features is None:
+            print(f"No audio features found for Track ID: {track_id}")
+            continue
+        track_features[track_id] = tuple(track_audio_features[feature_name] for feature_name in FEATURE_NAMES)
+
+    snapshot = Snapshot(options.snapshot_dir) if options.snapshot_dir else None
+    refresh_track_features(engine, track_features, options.batch_size, snapshot)
+    print(f'Finished refreshing Tracks. (Took {time.perf_counter() - start_time}s).')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Maintenance of the denormalized serving table (master2, see models.ServingPlaylistTrack) that the backend's
+recommendation queries read. The ingestion rebuilds the rows of every slice it loads, in the slice's load transaction
+(see bulk_load.load_slice), and refresh.py updates the averages of the playlists it refreshes. For databases loaded
+before the ingestion built it,
+
+    python -m serving [--db-url URL] [--slice-size 1000]
+
+rebuilds the rows of every loaded slice. A master2 table of the schema built by hand before (without track_pos, or with
+another primary key) is renamed to master2_legacy by pipeline.create_database_engine, which then builds this one.
+"""
+import argparse
+import os
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy import bindparam, delete, insert, inspect, select, text, update
+
+from models import (FEATURE_NAMES, SLICE_STATUS_LOADED, IngestSlice, Playlist, PlaylistTrack, ServingPlaylistTrack,
+                    Track, feature_aggregate_attr_name)
+from mpd import SLICE_SIZE
+
+AVG_ATTR_NAMES = [feature_aggregate_attr_name(feature_name, 'avg') for feature_name in FEATURE_NAMES]
+LEGACY_TABLE_SUFFIX = '_legacy'
+
+
+def migrate_legacy_serving_table(engine):
+    """
+    Renames a serving table which has another schema than ServingPlaylistTrack's key (like the master2 built by hand
+    before the ingestion built it, which has no track_pos), so that create_all creates the ingestion's. Returns whether
+    it was renamed.
+    """
+    table_name = ServingPlaylistTrack.__tablename__
+    inspector = inspect(engine)
+    if not inspector.has_table(table_name):
+        return False
+    primary_key_names = [column.name for column in ServingPlaylistTrack.__table__.primary_key.columns]
+    if inspector.get_pk_constraint(table_name)['constrained_columns'] == primary_key_names:
+        return False
+
+    legacy_table_name = table_name + LEGACY_TABLE_SUFFIX
+    if inspector.has_table(legacy_table_name):
+        raise RuntimeError(f'The {table_name} table has a legacy schema (without the primary key {primary_key_names}), '
+                           f'but it cannot be renamed to {legacy_table_name}, which already exists. Drop or rename '
+                           f'one of them.')
+    with engine.begin() as connection:
+        connection.execute(text(f'ALTER TABLE {table_name} RENAME TO {legacy_table_name}'))
+    print(f'Renamed the {table_name} table of the legacy schema to {legacy_table_name}.')
+    return True
+
+
+def rebuild_serving_rows(connection, min_pid, max_pid):
+    """
+    Rebuilds the serving rows of the playlists from min_pid to max_pid inclusive, in the database (with one INSERT ...
+    SELECT). Returns the number of rows.
+    """
+    connection.execute(delete(ServingPlaylistTrack).where(ServingPlaylistTrack.mpd_id.between(min_pid, max_pid)))
+    serving_rows_select = select(PlaylistTrack.playlist_mpd_id,
+                                 PlaylistTrack.track_pos,
+                                 Playlist.playlist_name,
+                                 PlaylistTrack.track_id,
+                                 Track.track_name,
+                                 Track.artist_name,
+                                 *[getattr(Playlist, attr_name) for attr_name in AVG_ATTR_NAMES]) \
+        .join(Playlist, Playlist.playlist_mpd_id == PlaylistTrack.playlist_mpd_id) \
+        .join(Track, Track.track_id == PlaylistTrack.track_id) \
+        .where(PlaylistTrack.playlist_mpd_id.between(min_pid, max_pid))
+    return connection.execute(insert(ServingPlaylistTrack).from_select(
+        ['mpd_id', 'track_pos', 'pname', 'track_id', 'track_name', 'aname'] + AVG_ATTR_NAMES,
+        serving_rows_select)).rowcount
+
+
+def update_serving_averages(connection, playlist_ids, playlist_averages):
+    """
+    Updates the averages of the serving rows of the given playlists, from their (playlists x features) matrix.
+    """
+    serving_table = ServingPlaylistTrack.__table__
+    # The SET clause is the other keys of the parameters:
+    connection.execute(update(serving_table).where(serving_table.c.mpd_id == bindparam('changed_mpd_id')),
+                       [dict(zip(AVG_ATTR_NAMES, averages), changed_mpd_id=playlist_id)
+                        for playlist_id, averages in zip(playlist_ids, playlist_averages.tolist())])
+
+
+def rebuild_loaded_slices(engine, slice_size=SLICE_SIZE):
+    with engine.connect() as connection:
+        slice_range = connection.execute(select(IngestSlice.slice_i).where(IngestSlice.status == SLICE_STATUS_LOADED)
+                                         .order_by(IngestSlice.slice_i)).scalars().all()
+    for slice_i in slice_range:
+        with engine.begin() as connection:
+            rows_count = rebuild_serving_rows(connection, slice_i * slice_size, (slice_i + 1) * slice_size - 1)
+        print(f'Rebuilt the serving rows of slice {slice_i} ({rows_count} rows).')
+
+
+if __name__ == '__main__':
+    from pipeline import create_database_engine
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Rebuild the serving table of every loaded MPD slice.')
+    parser.add_argument('--db-url', default=os.getenv('SQL_CONN_STRING'),
+                        help='SQLAlchemy URL of the database (default: the SQL_CONN_STRING environment variable).')
+    parser.add_argument('--slice-size', type=int, default=SLICE_SIZE,
+                        help=f'Number of playlists per MPD slice (default: {SLICE_SIZE}).')
+    args = parser.parse_args()
+    if not args.db_url:
+        parser.error('the database URL is required, with --db-url or the SQL_CONN_STRING environment variable')
+
+    start_time = time.perf_counter()
+    rebuild_loaded_slices(create_database_engine(args.db_url, args.slice_size), args.slice_size)
+    print(f'Finished rebuilding the serving table. (Took {time.perf_counter() - start_time}s).')
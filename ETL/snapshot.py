@@ -0,0 +1,158 @@
+"""
+Columnar snapshots of the Track features and Playlist aggregates, for analytics and serving without joining the tables.
+
+Each snapshot table is three files in the snapshot directory:
+    <name>.json         {"columns": [...], "count": N}
+    <name>.ids.npy      IDs of the rows (int64 playlist MPD IDs, or S22 Track IDs)
+    <name>.values.npy   float64 (rows x columns) matrix of the values
+
+The .npy files are preallocated with spare capacity and only their first `count` rows are valid, so that a slice's rows
+can be written in place. Readers should use read_snapshot_table (or np.load(mmap_mode='r') and slice off `count` rows
+themselves), which memory maps the files instead of reading them.
+
+New rows are written past `count` and only become visible with the metadata, which is replaced atomically. The rows of a
+reloaded slice are overwritten in place though, and deleted rows are replaced by the last ones, so a reader which maps
+the files while a slice is reloaded can see some of its rows half-written (or twice): read the snapshot between
+ingestion runs, or copy it, when that matters.
+"""
+import json
+import os
+
+import numpy as np
+
+from models import AGGREGATES, FEATURE_NAMES, feature_aggregate_attr_name
+
+TRACK_SNAPSHOT_NAME = 'track'
+TRACK_SNAPSHOT_COLUMNS = FEATURE_NAMES
+PLAYLIST_SNAPSHOT_NAME = 'playlist'
+PLAYLIST_SNAPSHOT_COLUMNS = [feature_aggregate_attr_name(feature_name, aggregate_name)
+                             for aggregate_name in AGGREGATES for feature_name in FEATURE_NAMES]
+
+MIN_SNAPSHOT_CAPACITY = 1024
+
+
+def snapshot_paths(snapshot_dir, name):
+    return (os.path.join(snapshot_dir, name + '.json'),
+            os.path.join(snapshot_dir, name + '.ids.npy'),
+            os.path.join(snapshot_dir, name + '.values.npy'))
+
+
+def read_snapshot_table(snapshot_dir, name):
+    """
+    Returns the (ids, values, columns) of a snapshot table, with ids and values memory mapped read-only.
+    """
+    meta_path, ids_path, values_path = snapshot_paths(snapshot_dir, name)
+    with open(meta_path) as meta_file:
+        meta = json.load(meta_file)
+    count = meta['count']
+    ids = np.load(ids_path, mmap_mode='r')[:count]
+    values = np.load(values_path, mmap_mode='r')[:count]
+    return ids, values, meta['columns']
+
+
+class SnapshotTable:
+    """
+    Writer of a snapshot table, which upserts and deletes rows by ID. The metadata (and so the row count readers see) is
+    replaced atomically after the rows are written, so readers never see part of the new rows of a slice (but can see
+    the existing rows it overwrites half-written, see above).
+    """
+
+    def __init__(self, snapshot_dir, name, id_dtype, columns):
+        os.makedirs(snapshot_dir, exist_ok=True)
+        self.meta_path, self.ids_path, self.values_path = snapshot_paths(snapshot_dir, name)
+        self.id_dtype = np.dtype(id_dtype)
+        self.columns = list(columns)
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as meta_file:
+                meta = json.load(meta_file)
+            if meta['columns'] != self.columns:
+                raise ValueError(f'Snapshot {self.meta_path} has columns {meta["columns"]}, expected {self.columns}.')
+            self.count = meta['count']
+            self.ids = np.load(self.ids_path, mmap_mode='r+')
+            self.values = np.load(self.values_path, mmap_mode='r+')
+        else:
+            self.count = 0
+            self.ids = np.lib.format.open_memmap(self.ids_path, mode='w+', dtype=self.id_dtype,
+                                                 shape=(MIN_SNAPSHOT_CAPACITY,))
+            self.values = np.lib.format.open_memmap(self.values_path, mode='w+', dtype=np.float64,
+                                                    shape=(MIN_SNAPSHOT_CAPACITY, len(self.columns)))
+        self.id_to_row = {row_id: row for row, row_id in enumerate(self.ids[:self.count].tolist())}
+
+    def grow(self, capacity):
+        # Doubling keeps the cost of copying the files amortized constant per row.
+        new_capacity = max(capacity, 2 * len(self.ids))
+        for attr_name, path in (('ids', self.ids_path), ('values', self.values_path)):
+            old_array = getattr(self, attr_name)
+            new_array = np.lib.format.open_memmap(path + '.tmp', mode='w+', dtype=old_array.dtype,
+                                                  shape=(new_capacity,) + old_array.shape[1:])
+            new_array[:self.count] = old_array[:self.count]
+            new_array.flush()
+            del old_array
+            setattr(self, attr_name, None)
+            del new_array
+            os.replace(path + '.tmp', path)
+            setattr(self, attr_name, np.load(path, mmap_mode='r+'))
+
+    def upsert(self, ids, values):
+        ids = np.asarray(ids, dtype=self.id_dtype)
+        values = np.asarray(values, dtype=np.float64).reshape(len(ids), len(self.columns))
+        rows = np.empty(len(ids), dtype=np.int64)
+        new_rows_count = 0
+        for i, row_id in enumerate(ids.tolist()):
+            row = self.id_to_row.get(row_id)
+            if row is None:
+                row = self.count + new_rows_count
+                self.id_to_row[row_id] = row
+                new_rows_count += 1
+            rows[i] = row
+        if self.count + new_rows_count > len(self.ids):
+            self.grow(self.count + new_rows_count)
+
+        self.ids[rows] = ids
+        self.values[rows] = values
+        self.ids.flush()
+        self.values.flush()
+        self.count += new_rows_count
+        self.write_meta()
+
+    def delete(self, ids):
+        """
+        Deletes the rows of the IDs (ignoring the ones which aren't in the table), moving the last rows into their place
+        so the valid rows stay the first count ones.
+        """
+        for row_id in np.asarray(ids, dtype=self.id_dtype).tolist():
+            row = self.id_to_row.pop(row_id, None)
+            if row is None:
+                continue
+            self.count -= 1
+            if row != self.count:
+                last_id = self.ids[self.count:self.count + 1].tolist()[0]
+                self.ids[row] = self.ids[self.count]
+                self.values[row] = self.values[self.count]
+                self.id_to_row[last_id] = row
+        self.ids.flush()
+        self.values.flush()
+        self.write_meta()
+
+    def write_meta(self):
+        with open(self.meta_path + '.tmp', 'w') as meta_file:
+            json.dump({'columns': self.columns, 'count': self.count}, meta_file)
+        os.replace(self.meta_path + '.tmp', self.meta_path)
+
+
+class Snapshot:
+    def __init__(self, snapshot_dir):
+        self.tracks = SnapshotTable(snapshot_dir, TRACK_SNAPSHOT_NAME, 'S22', TRACK_SNAPSHOT_COLUMNS)
+        self.playlists = SnapshotTable(snapshot_dir, PLAYLIST_SNAPSHOT_NAME, np.int64, PLAYLIST_SNAPSHOT_COLUMNS)
+
+    def upsert_slice(self, track_ids, track_features, playlist_mpd_ids, playlist_aggregates,
+                     deleted_playlist_mpd_ids=()):
+        """
+        Upserts the features (in TRACK_SNAPSHOT_COLUMNS order) of a slice's tracks and the aggregates (in
+        PLAYLIST_SNAPSHOT_COLUMNS order) of its playlists, and deletes the playlists which are no longer in it (see
+        bulk_load.load_slice).
+        """
+        self.tracks.upsert(track_ids, track_features)
+        if len(deleted_playlist_mpd_ids):
+            self.playlists.delete(deleted_playlist_mpd_ids)
+        self.playlists.upsert(playlist_mpd_ids, playlist_aggregates)
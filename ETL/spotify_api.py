@@ -0,0 +1,134 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+SPOTIFY_API_BASE_URL = 'https://api.spotify.com/v1'
+
+MAX_SPOTIFY_TRACKS_PER_REQ = 100
+MAX_SPOTIFY_ARTISTS_PER_REQ = 50
+
+# Status codes which mean the request should be retried (after waiting for Retry-After if the response has it):
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket allowing up to `rate` acquisitions per second on average, in bursts of up to `capacity`.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_seconds = (1 - self.tokens) / self.rate
+            time.sleep(wait_seconds)
+
+
+class SpotifyFetcher:
+    """
+    Fetches Track audio features and Artists from the Spotify Web API in batches, keeping up to max_in_flight requests
+    in flight while staying under requests_per_second. Rate limited (429) and server error responses are retried,
+    waiting for their Retry-After when they have one. Results are returned in the same order as the requested IDs.
+
+    token_provider is called for the access token of every request (e.g. a spotipy SpotifyClientCredentials'
+    get_access_token, which caches and refreshes the token itself), or can be None for an API that needs no auth.
+
+    With a SpotifyCache, only the IDs which aren't cached are requested, and their payloads (including nulls) are cached.
+    """
+
+    def __init__(self, token_provider=None, base_url=SPOTIFY_API_BASE_URL, max_in_flight=8, requests_per_second=10,
+                 max_retries=5, timeout=30, cache=None):
+        self.token_provider = token_provider
+        self.cache = cache
+        self.base_url = base_url.rstrip('/')
+        self.max_in_flight = max_in_flight
+        self.rate_limiter = TokenBucket(requests_per_second)
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.thread_local = threading.local()
+        self.stats_lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.bytes_received = 0
+
+    def audio_features(self, track_ids):
+        return self.fetch_batches('audio-features', 'audio_features', track_ids, MAX_SPOTIFY_TRACKS_PER_REQ)
+
+    def artists(self, artist_ids):
+        return self.fetch_batches('artists', 'artists', artist_ids, MAX_SPOTIFY_ARTISTS_PER_REQ)
+
+    def fetch_batches(self, path, response_key, ids, batch_size):
+        ids = list(ids)
+        if self.cache is None:
+            return self.request_batches(path, response_key, ids, batch_size)
+
+        payloads = self.cache.get_many(response_key, ids)
+        ids_to_request = list(dict.fromkeys(spotify_id for spotify_id in ids if spotify_id not in payloads))
+        print(f'{len(ids) - len(ids_to_request)} of {len(ids)} {response_key} are cached, requesting '
+              f'{len(ids_to_request)}...')
+        requested_payloads = dict(zip(ids_to_request,
+                                      self.request_batches(path, response_key, ids_to_request, batch_size)))
+        self.cache.put_many(response_key, requested_payloads)
+        payloads.update(requested_payloads)
+        return [payloads[spotify_id] for spotify_id in ids]
+
+    def request_batches(self, path, response_key, ids, batch_size):
+        batches = [ids[start_index:start_index + batch_size] for start_index in range(0, len(ids), batch_size)]
+        results = []
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            # map keeps the batches in order, however the requests complete:
+            for batch_results in executor.map(lambda batch: self.get(path, batch)[response_key], batches):
+                results.extend(batch_results)
+        return results
+
+    def session(self):
+        # requests Sessions aren't guaranteed to be thread-safe, so each worker thread gets its own:
+        if not hasattr(self.thread_local, 'session'):
+            self.thread_local.session = requests.Session()
+        return self.thread_local.session
+
+    def get(self, path, ids):
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            headers = {}
+            if self.token_provider is not None:
+                headers['Authorization'] = 'Bearer ' + self.token_provider()
+            with self.stats_lock:
+                self.calls += 1
+            try:
+                response = self.session().get(f'{self.base_url}/{path}', params={'ids': ','.join(ids)},
+                                              headers=headers, timeout=self.timeout)
+            # Timeouts (of the connection or of a stalled response) are retried like the connection errors:
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+                retry_after = None
+            else:
+                with self.stats_lock:
+                    self.bytes_received += len(response.content)
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    response.raise_for_status()
+                    return response.json()
+                retry_after = response.headers.get('Retry-After')
+
+            attempt += 1
+            with self.stats_lock:
+                self.retries += 1
+            wait_seconds = float(retry_after) if retry_after is not None else min(2 ** attempt, 60)
+            print(f'Retrying Spotify API /{path} request in {wait_seconds}s (attempt {attempt})...')
+            time.sleep(wait_seconds)
@@ -0,0 +1,57 @@
+import json
+import sqlite3
+import time
+
+# SQLite's default limit on the number of ? parameters is 999 in older versions:
+MAX_IDS_PER_QUERY = 500
+
+
+class SpotifyCache:
+    """
+    Local on-disk cache of raw Spotify API payloads, keyed by the kind of payload ('audio_features', 'artists') and the
+    Spotify ID. Negative results (null payloads, e.g. the audio features of a track deleted from Spotify) are cached too,
+    so they aren't requested again on every run. Entries older than ttl_seconds count as missing.
+    """
+
+    def __init__(self, path, ttl_seconds=30 * 24 * 60 * 60):
+        self.ttl_seconds = ttl_seconds
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS spotify_payload ('
+                                'kind TEXT NOT NULL, '
+                                'spotify_id TEXT NOT NULL, '
+                                'payload TEXT, '
+                                'fetched_at REAL NOT NULL, '
+                                'PRIMARY KEY (kind, spotify_id)) WITHOUT ROWID')
+        self.connection.commit()
+
+    def get_many(self, kind, spotify_ids):
+        """
+        Returns a map of the given IDs which are cached (and not expired) to their payloads, which are None for cached
+        negative results.
+        """
+        spotify_ids = list(spotify_ids)
+        oldest_fetched_at = time.time() - self.ttl_seconds
+        cached = {}
+        for start_index in range(0, len(spotify_ids), MAX_IDS_PER_QUERY):
+            id_batch = spotify_ids[start_index:start_index + MAX_IDS_PER_QUERY]
+            rows = self.connection.execute(
+                f'SELECT spotify_id, payload FROM spotify_payload '
+                f'WHERE kind = ? AND fetched_at >= ? AND spotify_id IN ({",".join("?" * len(id_batch))})',
+                [kind, oldest_fetched_at] + id_batch)
+            for spotify_id, payload in rows:
+                cached[spotify_id] = None if payload is None else json.loads(payload)
+        return cached
+
+    def put_many(self, kind, payloads):
+        """
+        Caches a map of Spotify IDs to their payloads (None for negative results).
+        """
+        fetched_at = time.time()
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO spotify_payload (kind, spotify_id, payload, fetched_at) VALUES (?, ?, ?, ?)',
+                ((kind, spotify_id, None if payload is None else json.dumps(payload), fetched_at)
+                 for spotify_id, payload in payloads.items()))
+
+    def close(self):
+        self.connection.close()
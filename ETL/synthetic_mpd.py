@@ -0,0 +1,136 @@
+"""
+Generator of synthetic Million Playlist Dataset slices, with the same file names and JSON schema as the real ones, for
+benchmarking and testing the ingestion without the dataset:
+
+    python synthetic_mpd.py DATA_PATH [--start-slice 0] [--slices 8] [--seed 0]
+
+Track and artist popularity follow a power law (Zipf-Mandelbrot), like in the MPD where a few thousand tracks are in a
+large share of the playlists, and playlist lengths are log-normal between 5 and 250 tracks. The same seed always generates
+the same catalog and slices, and every slice can be generated on its own.
+"""
+import argparse
+import datetime
+import json
+import os
+
+import numpy as np
+
+from mpd import SLICE_SIZE, slice_file_name
+
+SYNTHETIC_TRACKS_COUNT = 2000000
+SYNTHETIC_ARTISTS_COUNT = 300000
+SYNTHETIC_ALBUM_SIZE = 10
+# Zipf-Mandelbrot (exponent, offset) of the track and artist popularity. The tracks' give the most popular track about
+# 0.1% of the playlist tracks, and about 40k unique tracks per slice, which are close to the MPD's:
+TRACK_POPULARITY = (1.0, 100)
+ARTIST_POPULARITY = (1.1, 10)
+MIN_PLAYLIST_TRACKS = 5
+MAX_PLAYLIST_TRACKS = 250
+
+SYNTHETIC_GENERATED_ON = '2017-12-03 08:41:42.057563'
+PLAYLIST_NAME_WORDS = ['chill', 'workout', 'party', 'road trip', 'throwback', 'summer', 'study', 'sad', 'country',
+                       'rap', 'rock', 'jams', 'vibes', 'gym', 'sleep', 'christmas', 'oldies', 'car', 'worship', '✨']
+
+
+def synthetic_id(kind, index):
+    # 22 characters, like a Spotify base62 ID:
+    return f'{kind}{index:021d}'
+
+
+def zipf_cdf(count, popularity):
+    exponent, offset = popularity
+    weights = 1.0 / (np.arange(1, count + 1, dtype=np.float64) + offset) ** exponent
+    cdf = np.cumsum(weights)
+    return cdf / cdf[-1]
+
+
+class SyntheticCatalog:
+    """
+    The tracks (and their albums and artists) that the synthetic playlists are drawn from. Track i is the (i + 1)th
+    most popular track, and the artist of each album is drawn by artist popularity.
+    """
+
+    def __init__(self, seed=0, tracks_count=SYNTHETIC_TRACKS_COUNT, artists_count=SYNTHETIC_ARTISTS_COUNT):
+        rng = np.random.default_rng([seed, 0])
+        self.track_cdf = zipf_cdf(tracks_count, TRACK_POPULARITY)
+        albums_count = (tracks_count + SYNTHETIC_ALBUM_SIZE - 1) // SYNTHETIC_ALBUM_SIZE
+        album_artists = np.searchsorted(zipf_cdf(artists_count, ARTIST_POPULARITY), rng.random(albums_count))
+        # The artists are shuffled, so that the popular tracks aren't all by the popular artists:
+        self.album_artists = rng.permutation(artists_count)[album_artists]
+        # Tracks are shuffled into albums the same way:
+        self.track_albums = rng.permutation(tracks_count) // SYNTHETIC_ALBUM_SIZE
+
+    def sample_tracks(self, rng, count):
+        return np.searchsorted(self.track_cdf, rng.random(count)).tolist()
+
+    def track_json(self, track_i, pos):
+        album_i = int(self.track_albums[track_i])
+        artist_i = int(self.album_artists[album_i])
+        return {'pos': pos,
+                'artist_name': f'Artist {artist_i}',
+                'track_uri': 'spotify:track:' + synthetic_id('T', track_i),
+                'artist_uri': 'spotify:artist:' + synthetic_id('A', artist_i),
+                'track_name': f'Track {track_i}',
+                'album_uri': 'spotify:album:' + synthetic_id('L', album_i),
+                'duration_ms': 90000 + (track_i * 7919) % 240000,
+                'album_name': f'Album {album_i}'}
+
+
+def synthetic_slice(catalog, slice_i, seed=0, slice_size=SLICE_SIZE):
+    rng = np.random.default_rng([seed, 1, slice_i])
+    playlists = []
+    modified_at_start = int(datetime.datetime(2010, 1, 1, tzinfo=datetime.timezone.utc).timestamp())
+    modified_at_end = int(datetime.datetime(2017, 11, 1, tzinfo=datetime.timezone.utc).timestamp())
+    for pid in range(slice_i * slice_size, (slice_i + 1) * slice_size):
+        num_tracks = int(np.clip(rng.lognormal(np.log(45), 0.8), MIN_PLAYLIST_TRACKS, MAX_PLAYLIST_TRACKS))
+        tracks = [catalog.track_json(track_i, pos)
+                  for pos, track_i in enumerate(catalog.sample_tracks(rng, num_tracks))]
+        name_words = rng.choice(len(PLAYLIST_NAME_WORDS), size=1 + int(rng.integers(3)), replace=False)
+        playlists.append({'name': ' '.join(PLAYLIST_NAME_WORDS[word_i] for word_i in name_words),
+                          'collaborative': 'true' if rng.random() < 0.02 else 'false',
+                          'pid': pid,
+                          'modified_at': int(rng.integers(modified_at_start, modified_at_end)),
+                          'num_tracks': num_tracks,
+                          'num_albums': len({track['album_uri'] for track in tracks}),
+                          'num_followers': 1 + int(rng.zipf(2.5)),
+                          'tracks': tracks,
+                          'num_edits': 1 + int(rng.integers(30)),
+                          'duration_ms': sum(track['duration_ms'] for track in tracks),
+                          'num_artists': len({track['artist_uri'] for track in tracks})})
+    start_pid = slice_i * slice_size
+    return {'info': {'generated_on': SYNTHETIC_GENERATED_ON,
+                     'slice': f'{start_pid}-{start_pid + slice_size - 1}',
+                     'version': 'v1-synthetic'},
+            'playlists': playlists}
+
+
+def write_synthetic_slices(data_path, slice_range, seed=0, slice_size=SLICE_SIZE, overwrite=False):
+    """
+    Writes the synthetic slices of slice_range to data_path. Slices which already exist are kept unless overwrite, as
+    they're the same for the same seed.
+    """
+    os.makedirs(data_path, exist_ok=True)
+    catalog = None
+    for slice_i in slice_range:
+        slice_path = os.path.join(data_path, slice_file_name(slice_i, slice_size))
+        if os.path.exists(slice_path) and not overwrite:
+            continue
+        if catalog is None:
+            catalog = SyntheticCatalog(seed)
+        print(f'Writing synthetic MPD slice {slice_i}...')
+        with open(slice_path + '.tmp', 'w') as slice_file:
+            json.dump(synthetic_slice(catalog, slice_i, seed, slice_size), slice_file)
+        os.replace(slice_path + '.tmp', slice_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write synthetic Million Playlist Dataset slices.')
+    parser.add_argument('data_path', help='Directory to write the slice files to.')
+    parser.add_argument('--start-slice', type=int, default=0, help='Number of the first slice (default: 0).')
+    parser.add_argument('--slices', type=int, default=8, help='Number of slices to write (default: 8).')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the generated data (default: 0).')
+    parser.add_argument('--overwrite', action='store_true', help='Rewrite slices which already exist.')
+    args = parser.parse_args()
+
+    write_synthetic_slices(args.data_path, range(args.start_slice, args.start_slice + args.slices), args.seed,
+                           overwrite=args.overwrite)
@@ -0,0 +1,89 @@
+import heapq
+import math
+import random
+import statistics
+from collections import defaultdict
+
+import numpy as np
+
+from aggregates import (aggregates_from_sums, artist_genre_matrix, calc_playlist_aggregates, calc_playlist_sums,
+                        calc_playlist_top_genres)
+from models import AGGREGATE_DEFAULT
+
+
+def random_playlists(tracks_count, sizes):
+    rng = random.Random(351)
+    return [[rng.randrange(tracks_count) for _ in range(size)] for size in sizes]
+
+
+def csr(playlists):
+    playlist_offsets = [0]
+    playlist_track_rows = []
+    for playlist in playlists:
+        playlist_track_rows.extend(playlist)
+        playlist_offsets.append(len(playlist_track_rows))
+    return playlist_offsets, playlist_track_rows
+
+
+def test_aggregates_match_statistics():
+    rng = np.random.default_rng(351)
+    # Mix of fractional features, large ones (like duration_ms) and integer ones (like key):
+    feature_matrix = np.column_stack([rng.random(500), rng.random(500) * 300000, rng.integers(0, 12, 500)])
+    playlists = random_playlists(500, [2, 3, 5, 10, 50, 250, 2, 7])
+
+    aggregates = calc_playlist_aggregates(feature_matrix, *csr(playlists))
+
+    # statistics rounds the exact (fraction) avg and std to float64 once, while the extended precision ones are rounded
+    # twice, so the rare near ties round the other way, by one ulp (far below the precision of the Float columns):
+    differences_count = 0
+    for playlist_i, playlist in enumerate(playlists):
+        for feature_i in range(feature_matrix.shape[1]):
+            values = [float(feature_matrix[track_row, feature_i]) for track_row in playlist]
+            assert aggregates['min'][playlist_i, feature_i] == min(values)
+            assert aggregates['max'][playlist_i, feature_i] == max(values)
+            for aggregate_name, expected in (('avg', statistics.mean(values)), ('std', statistics.stdev(values))):
+                assert abs(aggregates[aggregate_name][playlist_i, feature_i] - expected) <= math.ulp(expected)
+                differences_count += aggregates[aggregate_name][playlist_i, feature_i] != expected
+    assert differences_count <= 1
+
+
+def test_undefined_aggregates_are_default():
+    feature_matrix = np.array([[1.0, 2.0], [3.0, 4.0]])
+    # An empty playlist between a single track playlist and a two track one:
+    aggregates = calc_playlist_aggregates(feature_matrix, [0, 1, 1, 3], [1, 0, 1])
+
+    assert aggregates['avg'].tolist() == [[3.0, 4.0], [AGGREGATE_DEFAULT] * 2, [2.0, 3.0]]
+    assert aggregates['min'].tolist() == [[3.0, 4.0], [AGGREGATE_DEFAULT] * 2, [1.0, 2.0]]
+    assert aggregates['std'].tolist() == [[AGGREGATE_DEFAULT] * 2, [AGGREGATE_DEFAULT] * 2,
+                                          [math.sqrt(2), math.sqrt(2)]]
+
+
+def test_top_genres_match_nlargest():
+    rng = random.Random(351)
+    # Few genres, so that there are plenty of ties:
+    artist_genres = [rng.sample('abcdef', rng.randrange(4)) for _ in range(30)] + [None]
+    track_artists = [rng.randrange(len(artist_genres)) for _ in range(100)]
+    playlists = random_playlists(100, [0, 1, 2, 3, 5, 10, 50, 7, 1, 4] * 5)
+
+    top_genres = calc_playlist_top_genres(*csr(playlists), track_artists, *artist_genre_matrix(artist_genres))
+
+    for playlist, playlist_top_genres in zip(playlists, top_genres):
+        genre_counts = defaultdict(float)
+        for track_row in playlist:
+            for genre in artist_genres[track_artists[track_row]] or []:
+                genre_counts[genre] += 1
+        assert playlist_top_genres == [genre for genre, _ in heapq.nlargest(3, genre_counts.items(), key=lambda x: x[1])]
+
+
+def test_aggregates_from_sums_match_aggregates():
+    rng = np.random.default_rng(351)
+    feature_matrix = np.column_stack([rng.random(500), rng.random(500) * 300000, rng.integers(0, 12, 500)])
+    playlist_offsets, playlist_track_rows = csr(random_playlists(500, [2, 0, 1, 10, 250]))
+
+    aggregates = calc_playlist_aggregates(feature_matrix, playlist_offsets, playlist_track_rows)
+    counts, running_sums = calc_playlist_sums(feature_matrix, playlist_offsets, playlist_track_rows)
+    aggregates_from_running_sums = aggregates_from_sums(counts, running_sums['sum'], running_sums['sumsq'])
+
+    assert counts.tolist() == [2, 0, 1, 10, 250]
+    for aggregate_name in ('avg', 'std'):
+        assert np.allclose(aggregates_from_running_sums[aggregate_name], aggregates[aggregate_name], rtol=1e-12)
@@ -0,0 +1,33 @@
+import numpy as np
+
+from batch import IngestBatch, unique_in_order
+from mpd import MpdTrack, SliceData
+
+
+def slice_data(slice_i, playlists):
+    data = SliceData(slice_i)
+    for pid, track_ids in playlists:
+        data.playlists.append(({'playlist_mpd_id': pid}, list(enumerate(track_ids))))
+        for track_id in track_ids:
+            data.tracks.setdefault(track_id, MpdTrack(f'{track_id} {slice_i}', 'artist ' + track_id[0], '', '', '', 0))
+    return data
+
+
+def test_batch_interns_and_removes_tracks():
+    batch = IngestBatch()
+    batch.add_slice(slice_data(1, [(1000, ['a1', 'b1', 'a1']), (1001, [])]))
+    batch.add_slice(slice_data(2, [(2000, ['b1', 'a2'])]))
+
+    assert batch.track_ids == ['a1', 'b1', 'a2']
+    assert batch.artist_ids == ['artist a', 'artist b']
+    assert list(batch.track_artists) == [0, 1, 0]
+    # The first slice's data of a track is kept:
+    assert batch.new_tracks[1].track_name == 'b1 1'
+    assert batch.slice_playlist_ranges == {1: (0, 2), 2: (2, 3)}
+    assert list(batch.playlist_offsets) == [0, 3, 3, 5]
+
+    batch.remove_tracks(np.array([False, True, False]))
+    assert batch.playlist_offsets.tolist() == [0, 2, 2, 3]
+    assert batch.playlist_track_indexes.tolist() == [0, 0, 2]
+    assert batch.playlist_track_positions.tolist() == [0, 2, 1]
+    assert unique_in_order(np.array([3, 1, 3, 2, 1])).tolist() == [3, 1, 2]
@@ -0,0 +1,26 @@
+from benchmark import find_regressions
+
+
+def result(max_rss_mb, **stages_rows_per_s):
+    return {'wall_s': 10.0, 'max_rss_mb': max_rss_mb,
+            'stages': {stage_name: {'wall_s': 1.0, 'rows': int(rows_per_s), 'rows_per_s': rows_per_s}
+                       for stage_name, rows_per_s in stages_rows_per_s.items()}}
+
+
+def test_find_regressions():
+    baseline_results = {'1': result(100.0, load=1000.0, aggregates=500.0, api_tracks=200.0, snapshot=0.0),
+                        '8': result(None, load=1000.0)}
+    # Too short in the baseline to compare:
+    baseline_results['1']['stages']['api_tracks']['wall_s'] = 0.01
+    results = {'1': result(130.0, load=740.0, aggregates=600.0, api_tracks=1.0, snapshot=10.0, transform=1.0),
+               '8': result(500.0, load=760.0),
+               '64': result(900.0, load=1.0)}
+
+    assert find_regressions(results, baseline_results, tolerance=0.25) == [
+        '1 slices: peak RSS 130.0 MB, was 100.0 MB',
+        '1 slices: load at 740.0 rows/s, was 1000.0 rows/s']
+    # Within the tolerance, and without the stages (or scales) which aren't in both:
+    assert find_regressions(results, baseline_results, tolerance=0.3) == []
+    assert find_regressions({'1': result(90.0, load=1000.0)}, baseline_results, tolerance=0.25) == []
+    assert find_regressions({'1': result(None, aggregates=100.0)}, baseline_results, tolerance=0.25) == [
+        '1 slices: aggregates at 100.0 rows/s, was 500.0 rows/s']
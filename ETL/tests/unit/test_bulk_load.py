@@ -0,0 +1,71 @@
+import datetime
+
+from sqlalchemy import select
+
+from batch import playlist_feature_sums_row, playlist_row
+from bulk_load import ARTIST_COLUMNS, TRACK_COLUMNS, load_slice
+from models import (AGGREGATES, FEATURE_NAMES, RUNNING_SUMS, IngestSlice, Playlist, PlaylistFeatureSums, PlaylistTrack,
+                    ServingPlaylistTrack)
+from pipeline import create_database_engine
+
+TRACK_IDS = ['track_a', 'track_b', 'track_c']
+
+
+def artist_rows():
+    values = dict(artist_id='artist', artist_name='Artist', genres=['pop'], followers=1, popularity=1)
+    return [tuple(values[column] for column in ARTIST_COLUMNS)]
+
+
+def track_rows():
+    return [tuple(dict(dict.fromkeys(FEATURE_NAMES, track_i), track_id=track_id, track_name=f'Track {track_i}',
+                       artist_id='artist', artist_name='Artist', album_id='album', album_name='Album')[column]
+                  for column in TRACK_COLUMNS)
+            for track_i, track_id in enumerate(TRACK_IDS)]
+
+
+def load_playlists(engine, playlist_tracks, content_hash):
+    """
+    Loads slice 0 (of playlists 0 to 9) with the playlists of the map of mpd_ids to their track IDs, whose aggregates
+    and sums are their mpd_id. Returns the mpd_ids of the deleted playlists.
+    """
+    playlist_rows = [
+        playlist_row(dict(playlist_mpd_id=mpd_id, playlist_name=f'Playlist {mpd_id} {content_hash}',
+                          mpd_generated_at=datetime.datetime(2017, 12, 3), modified_at=datetime.date(2017, 1, 1),
+                          num_tracks=len(track_ids), num_artists=1, num_albums=1, num_followers=1, num_edits=1,
+                          is_collaborative=False, duration_ms_total=0),
+                     ['pop'], dict.fromkeys(AGGREGATES, [float(mpd_id)] * len(FEATURE_NAMES)))
+        for mpd_id, track_ids in playlist_tracks.items()]
+    return load_slice(engine, 0, content_hash, 0, 9, artist_rows(), track_rows(), playlist_rows,
+               [(mpd_id, track_id, track_pos) for mpd_id, track_ids in playlist_tracks.items()
+                for track_pos, track_id in enumerate(track_ids)],
+               [playlist_feature_sums_row(mpd_id, len(track_ids),
+                                          dict.fromkeys(RUNNING_SUMS, [float(mpd_id)] * len(FEATURE_NAMES)))
+                for mpd_id, track_ids in playlist_tracks.items()],
+               batch_size=2)
+
+
+def test_reloading_a_slice_replaces_its_rows(tmp_path):
+    engine = create_database_engine('sqlite:///' + str(tmp_path / 'load.sqlite3'))
+    assert load_playlists(engine, {0: ['track_a', 'track_b', 'track_c'], 1: ['track_a'], 2: ['track_b', 'track_c']},
+                          'v1') == []
+    # Playlist 2 is removed, playlist 0 loses its last track, and playlist 1 gains one:
+    assert load_playlists(engine, {0: ['track_c', 'track_a'], 1: ['track_b', 'track_a']}, 'v2') == [2]
+
+    with engine.connect() as connection:
+        assert connection.execute(select(Playlist.playlist_mpd_id, Playlist.playlist_name, Playlist.num_tracks,
+                                         Playlist.energy_avg).order_by(Playlist.playlist_mpd_id)).all() \
+            == [(0, 'Playlist 0 v2', 2, 0.0), (1, 'Playlist 1 v2', 2, 1.0)]
+        assert connection.execute(select(PlaylistTrack.playlist_mpd_id, PlaylistTrack.track_pos, PlaylistTrack.track_id)
+                                  .order_by(PlaylistTrack.playlist_mpd_id, PlaylistTrack.track_pos)).all() \
+            == [(0, 0, 'track_c'), (0, 1, 'track_a'), (1, 0, 'track_b'), (1, 1, 'track_a')]
+        assert connection.execute(select(PlaylistFeatureSums.playlist_mpd_id, PlaylistFeatureSums.track_count,
+                                         PlaylistFeatureSums.energy_sum)
+                                  .order_by(PlaylistFeatureSums.playlist_mpd_id)).all() == [(0, 2, 0.0), (1, 2, 1.0)]
+        assert connection.execute(select(ServingPlaylistTrack.mpd_id, ServingPlaylistTrack.track_pos,
+                                         ServingPlaylistTrack.pname, ServingPlaylistTrack.track_id,
+                                         ServingPlaylistTrack.track_name, ServingPlaylistTrack.energy_avg)
+                                  .order_by(ServingPlaylistTrack.mpd_id, ServingPlaylistTrack.track_pos)).all() \
+            == [(0, 0, 'Playlist 0 v2', 'track_c', 'Track 2', 0.0), (0, 1, 'Playlist 0 v2', 'track_a', 'Track 0', 0.0),
+                (1, 0, 'Playlist 1 v2', 'track_b', 'Track 1', 1.0), (1, 1, 'Playlist 1 v2', 'track_a', 'Track 0', 1.0)]
+        assert connection.execute(select(IngestSlice.slice_i, IngestSlice.content_hash, IngestSlice.status,
+                                         IngestSlice.playlists_count)).all() == [(0, 'v2', 'loaded', 2)]
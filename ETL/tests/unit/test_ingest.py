@@ -0,0 +1,145 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from sqlalchemy import create_engine, func, select
+
+import pipeline
+from ingest import main
+from manifest import set_slice_status
+from models import (SLICE_STATUS_LOADED, SLICE_STATUS_PENDING, Base, IngestSlice, Playlist, PlaylistTrack,
+                    ServingPlaylistTrack)
+from mpd import slice_content_hash
+from synthetic_mpd import write_synthetic_slices
+
+ETL_PATH = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_import_has_no_heavy_dependencies():
+    imported = subprocess.run([sys.executable, '-c', 'import sys, ingest; print(" ".join(sorted(sys.modules)))'],
+                              cwd=ETL_PATH, capture_output=True, text=True, check=True).stdout.split()
+    assert not {'numpy', 'sqlalchemy', 'spotipy', 'requests', 'pipeline'} & set(imported)
+
+
+def test_main_ingests_synthetic_slices(tmp_path, capsys):
+    data_path = str(tmp_path / 'data')
+    write_synthetic_slices(data_path, [2, 3], slice_size=20)
+    db_url = 'sqlite:///' + str(tmp_path / 'ingest.sqlite3')
+    argv = ['--db-url', db_url, '--data-path', data_path, '--start-slice', '2', '--slices', '2', '--slice-size', '20',
+            '--fake-spotify', '--load-batch-size', '7', '--lookup-chunk-size', '5',
+            '--snapshot-dir', str(tmp_path / 'snapshot'), '--metrics-path', str(tmp_path / 'metrics.jsonl')]
+    main(argv)
+
+    with create_engine(db_url).connect() as connection:
+        assert connection.execute(select(func.min(Playlist.playlist_mpd_id), func.max(Playlist.playlist_mpd_id),
+                                         func.count())).one() == (40, 79, 40)
+        playlist_tracks_count = connection.execute(select(func.count()).select_from(PlaylistTrack)).scalar()
+        assert playlist_tracks_count > 40 * 5
+        assert connection.execute(select(func.count()).select_from(ServingPlaylistTrack)).scalar() \
+            == playlist_tracks_count
+
+    # Every stage but the run's is recorded per slice:
+    with open(str(tmp_path / 'metrics.jsonl')) as metrics_file:
+        stage_slices = [(record['stage'], record['slice']) for record in map(json.loads, metrics_file)]
+    stage_names = ['hash_slices', 'transform', 'fetch_db_tracks', 'fetch_db_artists', 'build_new_tracks', 'api_tracks',
+                   'api_artists', 'aggregates', 'load', 'snapshot']
+    assert sorted(stage_slices[:-1]) == sorted((stage_name, slice_i)
+                                               for stage_name in stage_names for slice_i in [2, 3])
+    assert stage_slices[-1] == ('run', None)
+
+    main(argv)
+    assert 'All slices are already loaded.' in capsys.readouterr().out
+
+
+def table_rows(db_url):
+    with create_engine(db_url).connect() as connection:
+        return {table.name: sorted(connection.execute(select(*[column for column in table.columns
+                                                               if column.name != 'updated_at'])).all(), key=repr)
+                for table in Base.metadata.sorted_tables}
+
+
+def loaded_slices(metrics_path):
+    with open(metrics_path) as metrics_file:
+        return [record['slice'] for record in map(json.loads, metrics_file) if record['stage'] == 'load']
+
+
+def test_main_loads_the_same_rows_with_any_number_of_workers(tmp_path):
+    data_path = str(tmp_path / 'data')
+    write_synthetic_slices(data_path, [4, 5, 6], slice_size=20)
+    runs_rows = []
+    for workers in [1, 3]:
+        db_url = 'sqlite:///' + str(tmp_path / f'workers_{workers}.sqlite3')
+        metrics_path = str(tmp_path / f'metrics_{workers}.jsonl')
+        main(['--db-url', db_url, '--data-path', data_path, '--start-slice', '4', '--slices', '3', '--slice-size', '20',
+              '--fake-spotify', '--workers', str(workers), '--snapshot-dir', '', '--metrics-path', metrics_path])
+        assert loaded_slices(metrics_path) == [4, 5, 6]
+        runs_rows.append(table_rows(db_url))
+
+    assert runs_rows[0]['playlist_track'] and runs_rows[0]['ingest_slice']
+    assert runs_rows[1] == runs_rows[0]
+
+
+def test_main_reloads_only_the_unfinished_and_changed_slices(tmp_path):
+    data_path = str(tmp_path / 'data')
+    write_synthetic_slices(data_path, [0, 1, 2], slice_size=20)
+    db_url = 'sqlite:///' + str(tmp_path / 'resume.sqlite3')
+
+    def run(run_name, *options):
+        metrics_path = str(tmp_path / f'metrics_{run_name}.jsonl')
+        main(['--db-url', db_url, '--data-path', data_path, '--start-slice', '0', '--slices', '3', '--slice-size', '20',
+              '--fake-spotify', '--snapshot-dir', '', '--metrics-path', metrics_path, *options])
+        return loaded_slices(metrics_path) if os.path.exists(metrics_path) else []
+
+    assert run('first') == [0, 1, 2]
+    # Interrupted before slice 1 was loaded:
+    engine = create_engine(db_url)
+    with engine.begin() as connection:
+        set_slice_status(connection, 1, slice_content_hash(1, data_path, 20), SLICE_STATUS_PENDING)
+    assert run('interrupted') == [1]
+    write_synthetic_slices(data_path, [2], seed=2, slice_size=20, overwrite=True)
+    assert run('changed') == [2]
+    assert run('loaded') == []
+    assert run('forced', '--force') == [0, 1, 2]
+    with engine.connect() as connection:
+        assert connection.execute(select(IngestSlice.slice_i, IngestSlice.content_hash, IngestSlice.status)
+                                  .order_by(IngestSlice.slice_i)).all() \
+            == [(slice_i, slice_content_hash(slice_i, data_path, 20), SLICE_STATUS_LOADED) for slice_i in range(3)]
+
+
+def test_main_reloads_only_the_slices_from_the_one_it_crashed_on(tmp_path, monkeypatch):
+    data_path = str(tmp_path / 'data')
+    write_synthetic_slices(data_path, [0, 1, 2], slice_size=20)
+    db_url = 'sqlite:///' + str(tmp_path / 'crash.sqlite3')
+
+    def run(run_name):
+        metrics_path = str(tmp_path / f'metrics_{run_name}.jsonl')
+        main(['--db-url', db_url, '--data-path', data_path, '--start-slice', '0', '--slices', '3', '--slice-size', '20',
+              '--fake-spotify', '--snapshot-dir', '', '--metrics-path', metrics_path])
+        return loaded_slices(metrics_path)
+
+    pull_audio_features = pipeline.pull_audio_features
+    pulls = []
+
+    def crash_pulling_slice_1(spotify, batch, feature_matrix, track_indexes_to_pull, failed_tracks):
+        pulls.append(track_indexes_to_pull)
+        # The pulls are one per slice, in slice order:
+        if len(pulls) == 2:
+            raise ConnectionError('the Spotify API went away')
+        pull_audio_features(spotify, batch, feature_matrix, track_indexes_to_pull, failed_tracks)
+    monkeypatch.setattr(pipeline, 'pull_audio_features', crash_pulling_slice_1)
+
+    with pytest.raises(ConnectionError):
+        run('crashed')
+    assert loaded_slices(str(tmp_path / 'metrics_crashed.jsonl')) == [0]
+    with create_engine(db_url).connect() as connection:
+        assert connection.execute(select(IngestSlice.slice_i, IngestSlice.status).order_by(IngestSlice.slice_i)).all() \
+            == [(0, SLICE_STATUS_LOADED), (1, SLICE_STATUS_PENDING), (2, SLICE_STATUS_PENDING)]
+
+    monkeypatch.setattr(pipeline, 'pull_audio_features', pull_audio_features)
+    assert run('restarted') == [1, 2]
+    crashed_rows = table_rows(db_url)
+    db_url = 'sqlite:///' + str(tmp_path / 'uninterrupted.sqlite3')
+    assert run('uninterrupted') == [0, 1, 2]
+    assert table_rows(db_url) == crashed_rows
@@ -0,0 +1,46 @@
+import json
+import os
+import subprocess
+import sys
+
+from instrument import RUN_STAGE_NAME, Instrumentation, read_runs, summarize_run
+
+ETL_PATH = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def record_run(metrics_path, rows_per_slice):
+    instrumentation = Instrumentation(metrics_path)
+    run_stage = instrumentation.start_stage(RUN_STAGE_NAME)
+    for slice_i, rows in enumerate(rows_per_slice):
+        instrumentation.start_stage('load', slice_i).finish(rows=rows, playlists=rows)
+    instrumentation.start_stage('canceled', 0).cancel()
+    run_stage.finish(rows=sum(rows_per_slice), slices=list(range(len(rows_per_slice))))
+    return instrumentation.run_id
+
+
+def test_stage_records_and_report(tmp_path):
+    metrics_path = str(tmp_path / 'metrics.jsonl')
+    base_run_id = record_run(metrics_path, [10, 20])
+    run_id = record_run(metrics_path, [30, 40, 50])
+
+    assert base_run_id != run_id
+    with open(metrics_path) as metrics_file:
+        records = [json.loads(line) for line in metrics_file]
+    assert [(record['run_id'], record['stage'], record['slice'], record['rows']) for record in records] == [
+        (base_run_id, 'load', 0, 10), (base_run_id, 'load', 1, 20), (base_run_id, RUN_STAGE_NAME, None, 30),
+        (run_id, 'load', 0, 30), (run_id, 'load', 1, 40), (run_id, 'load', 2, 50), (run_id, RUN_STAGE_NAME, None, 120)]
+    assert records[0]['playlists'] == 10 and records[2]['slices'] == [0, 1]
+    assert {'wall_s', 'cpu_s', 'max_rss_mb', 'rows_per_s', 'db_round_trips', 'api_calls'} <= set(records[0])
+
+    runs = read_runs(metrics_path)
+    assert list(runs) == [base_run_id, run_id]
+    load_stage = summarize_run(runs[run_id])['load']
+    assert (load_stage['count'], load_stage['rows']) == (3, 120)
+    assert set(summarize_run(runs[run_id])) == {'load'}
+
+    report = subprocess.run([sys.executable, 'instrument.py', metrics_path], cwd=ETL_PATH, capture_output=True,
+                            text=True, check=True).stdout
+    assert f'Run {base_run_id}:' in report and f'Run {run_id}:' in report
+    assert f'Run {run_id} compared to run {base_run_id}:' in report
+    # The slices counts of the load stage, of each run:
+    assert [line.split()[1] for line in report.splitlines() if line.startswith('load')][:2] == ['2', '3']
@@ -0,0 +1,30 @@
+import random
+
+from sqlalchemy import insert, select
+
+from lookup import fetch_rows_by_id
+from models import Artist
+from pipeline import create_database_engine
+
+
+def test_chunked_lookup_matches_single_query(tmp_path):
+    engine = create_database_engine('sqlite:///' + str(tmp_path / 'lookup.sqlite3'))
+    with engine.begin() as connection:
+        connection.execute(insert(Artist), [dict(artist_id=f'artist{artist_i:03d}', artist_name=f'Artist {artist_i}',
+                                                 genres=['pop'] * (artist_i % 3), followers=artist_i, popularity=1)
+                                            for artist_i in range(0, 100, 2)])
+    # Every other ID is missing:
+    artist_ids = [f'artist{artist_i:03d}' for artist_i in range(60)]
+    random.Random(351).shuffle(artist_ids)
+
+    rows_by_id = fetch_rows_by_id(engine, Artist.artist_id, [Artist.genres, Artist.followers], artist_ids,
+                                  chunk_size=7, max_workers=3)
+
+    with engine.connect() as connection:
+        expected_rows = connection.execute(select(Artist.artist_id, Artist.genres, Artist.followers)
+                                           .where(Artist.artist_id.in_(artist_ids))).all()
+    assert rows_by_id == {expected_row.artist_id: expected_row for expected_row in expected_rows}
+    assert sorted(rows_by_id) == [f'artist{artist_i:03d}' for artist_i in range(0, 60, 2)]
+    assert rows_by_id['artist004'].genres == ['pop'] and rows_by_id['artist004'].followers == 4
+    assert fetch_rows_by_id(engine, Artist.artist_id, [Artist.genres], artist_ids, chunk_size=len(artist_ids)) \
+        == fetch_rows_by_id(engine, Artist.artist_id, [Artist.genres], artist_ids, chunk_size=7)
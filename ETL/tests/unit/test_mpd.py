@@ -0,0 +1,40 @@
+import datetime
+import json
+
+import pytest
+
+import mpd
+from mpd import iter_slice_playlists, slice_file_name
+
+
+def mpd_playlist(pid, tracks_count):
+    return {'name': f'Playlist {pid}', 'collaborative': 'false', 'pid': pid, 'modified_at': 1500000000,
+            'num_tracks': tracks_count, 'num_albums': 1, 'num_followers': 1, 'num_edits': 1, 'num_artists': 1,
+            'duration_ms': 1000 * tracks_count,
+            'tracks': [{'pos': pos, 'artist_name': 'Artist', 'track_uri': f'spotify:track:{pid:011d}{pos:011d}',
+                        'artist_uri': 'spotify:artist:a', 'track_name': f'Track {pos}',
+                        'album_uri': 'spotify:album:b', 'duration_ms': 1000, 'album_name': 'Album'}
+                       for pos in range(tracks_count)]}
+
+
+def test_iter_slice_playlists_streams_the_playlists(tmp_path, monkeypatch):
+    slice_json = json.dumps({'info': {'generated_on': '2017-12-03 08:41:42.057563', 'slice': '0-2', 'version': 'v1'},
+                             'playlists': [mpd_playlist(pid, pid + 1) for pid in range(3)]})
+    slice_path = tmp_path / slice_file_name(0, 3)
+    # Cut off in the last playlist, which a whole file parse would fail on before yielding any:
+    slice_path.write_text(slice_json[:slice_json.rindex('"Track 2"')])
+
+    def fail_to_load(*args, **kwargs):
+        raise AssertionError('the slice file is parsed whole')
+    monkeypatch.setattr(json, 'load', fail_to_load)
+    monkeypatch.setattr(json, 'loads', fail_to_load)
+
+    playlists = iter_slice_playlists(str(slice_path))
+    streamed = [next(playlists), next(playlists)]
+    with pytest.raises(Exception):
+        next(playlists)
+
+    assert {slice_generated_at for slice_generated_at, _ in streamed} == {
+        datetime.datetime(2017, 12, 3, 8, 41, 42, 57563)}
+    assert [playlist for _, playlist in streamed] == [mpd_playlist(0, 1), mpd_playlist(1, 2)]
+    assert mpd.uri_id(streamed[1][1]['tracks'][1]['track_uri']) == f'{1:011d}{1:011d}'
@@ -0,0 +1,96 @@
+import numpy as np
+from sqlalchemy import bindparam, create_engine, func, select, update
+
+from aggregates import calc_playlist_aggregates
+from fake_spotify import fake_audio_features
+from ingest import main
+from models import (AGGREGATES, FEATURE_NAMES, Playlist, PlaylistTrack, ServingPlaylistTrack, Track,
+                    feature_aggregate_attr_name)
+from refresh import FEATURE_COLUMNS, refresh_track_features
+from synthetic_mpd import write_synthetic_slices
+
+
+def recalculated_aggregates(connection):
+    track_rows = connection.execute(select(Track.track_id, *FEATURE_COLUMNS)).all()
+    track_index = {track_row[0]: track_i for track_i, track_row in enumerate(track_rows)}
+    playlist_track_rows = connection.execute(select(PlaylistTrack.playlist_mpd_id, PlaylistTrack.track_id)
+                                             .order_by(PlaylistTrack.playlist_mpd_id, PlaylistTrack.track_pos)).all()
+    playlist_ids = sorted({playlist_track_row[0] for playlist_track_row in playlist_track_rows})
+    playlist_offsets = np.searchsorted([playlist_track_row[0] for playlist_track_row in playlist_track_rows],
+                                       playlist_ids + [playlist_ids[-1] + 1])
+    aggregates = calc_playlist_aggregates(np.array([track_row[1:] for track_row in track_rows], dtype=np.float64),
+                                          playlist_offsets,
+                                          [track_index[playlist_track_row[1]] for playlist_track_row in
+                                           playlist_track_rows])
+    return playlist_ids, np.hstack([aggregates[aggregate_name] for aggregate_name in AGGREGATES])
+
+
+def test_refresh_matches_recalculated_aggregates(tmp_path):
+    data_path = str(tmp_path / 'data')
+    write_synthetic_slices(data_path, [0, 1], slice_size=20)
+    db_url = 'sqlite:///' + str(tmp_path / 'refresh.sqlite3')
+    main(['--db-url', db_url, '--data-path', data_path, '--start-slice', '0', '--slices', '2', '--slice-size', '20',
+          '--fake-spotify', '--snapshot-dir', '', '--metrics-path', str(tmp_path / 'metrics.jsonl')])
+    engine = create_engine(db_url)
+
+    with engine.connect() as connection:
+        track_rows = connection.execute(select(Track.track_id, *FEATURE_COLUMNS).order_by(Track.track_id)).all()
+    rng = np.random.default_rng(351)
+    # Changes which move the features both ways, so some playlists' min and max tracks change away from them:
+    track_features = {track_row[0]: tuple(int(value) + 1 if isinstance(value, int) else value * rng.uniform(0.5, 1.5)
+                                          for value in track_row[1:])
+                      for track_row in track_rows[::7]}
+    changed_tracks_count, playlists_count, rescanned_count = refresh_track_features(engine, track_features,
+                                                                                    batch_size=50)
+
+    assert changed_tracks_count == len(track_features)
+    assert 0 < rescanned_count < playlists_count
+    aggregate_columns = [getattr(Playlist, feature_aggregate_attr_name(feature_name, aggregate_name))
+                         for aggregate_name in AGGREGATES for feature_name in FEATURE_NAMES]
+    with engine.connect() as connection:
+        playlist_ids, expected_aggregates = recalculated_aggregates(connection)
+        playlist_rows = connection.execute(select(Playlist.playlist_mpd_id, *aggregate_columns)
+                                           .order_by(Playlist.playlist_mpd_id)).all()
+        # The serving rows have the averages of their playlist:
+        assert not connection.execute(
+            select(func.count()).select_from(ServingPlaylistTrack)
+            .join(Playlist, Playlist.playlist_mpd_id == ServingPlaylistTrack.mpd_id)
+            .where(ServingPlaylistTrack.energy_avg != Playlist.energy_avg)).scalar()
+    assert [playlist_row[0] for playlist_row in playlist_rows] == playlist_ids
+    assert np.allclose([playlist_row[1:] for playlist_row in playlist_rows], expected_aggregates, rtol=1e-12)
+
+    # Refreshing with the same features changes nothing:
+    assert refresh_track_features(engine, track_features) == (0, 0, 0)
+
+
+def test_refresh_skips_tracks_only_rounded_to_single_precision(tmp_path):
+    data_path = str(tmp_path / 'data')
+    write_synthetic_slices(data_path, [0], slice_size=20)
+    db_url = 'sqlite:///' + str(tmp_path / 'refresh.sqlite3')
+    main(['--db-url', db_url, '--data-path', data_path, '--start-slice', '0', '--slices', '1', '--slice-size', '20',
+          '--fake-spotify', '--snapshot-dir', '', '--metrics-path', str(tmp_path / 'metrics.jsonl')])
+    engine = create_engine(db_url)
+
+    # The features as MySQL stores them, in its single precision Float columns:
+    with engine.begin() as connection:
+        track_rows = connection.execute(select(Track.track_id, *FEATURE_COLUMNS).order_by(Track.track_id)).all()
+        connection.execute(update(Track.__table__).where(Track.__table__.c.track_id == bindparam('rounded_track_id')),
+                           [dict(zip(FEATURE_NAMES, np.float32(track_row[1:]).tolist()), rounded_track_id=track_row[0])
+                            for track_row in track_rows])
+        playlist_rows = connection.execute(select(Playlist).order_by(Playlist.playlist_mpd_id)).all()
+    track_features = {track_row[0]: tuple(fake_audio_features(track_row[0])[feature_name]
+                                          for feature_name in FEATURE_NAMES)
+                      for track_row in track_rows}
+    assert any(np.float32(features).tolist() != list(features) for features in track_features.values())
+    changed_track_id = track_rows[0][0]
+    track_features[changed_track_id] = (track_features[changed_track_id][0] / 2,) + track_features[changed_track_id][1:]
+
+    assert refresh_track_features(engine, track_features)[0] == 1
+    with engine.connect() as connection:
+        changed_playlist_ids = set(connection.execute(select(PlaylistTrack.playlist_mpd_id)
+                                                      .where(PlaylistTrack.track_id == changed_track_id)).scalars())
+        refreshed_playlist_rows = connection.execute(select(Playlist).order_by(Playlist.playlist_mpd_id)).all()
+    # Only the playlists of the changed track are updated:
+    assert [playlist_row for playlist_row in refreshed_playlist_rows
+            if playlist_row.playlist_mpd_id not in changed_playlist_ids] \
+        == [playlist_row for playlist_row in playlist_rows if playlist_row.playlist_mpd_id not in changed_playlist_ids]
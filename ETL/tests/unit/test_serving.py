@@ -0,0 +1,30 @@
+from sqlalchemy import create_engine, func, inspect, select, text
+
+from ingest import main
+from models import PlaylistTrack, ServingPlaylistTrack
+from pipeline import create_database_engine
+from synthetic_mpd import write_synthetic_slices
+
+
+def test_legacy_serving_table_is_renamed_and_rebuilt(tmp_path):
+    data_path = str(tmp_path / 'data')
+    write_synthetic_slices(data_path, [0, 1], slice_size=20)
+    db_url = 'sqlite:///' + str(tmp_path / 'serving.sqlite3')
+    main(['--db-url', db_url, '--data-path', data_path, '--start-slice', '0', '--slices', '2', '--slice-size', '20',
+          '--fake-spotify', '--snapshot-dir', '', '--metrics-path', str(tmp_path / 'metrics.jsonl')])
+    # The master2 table as it was built by hand, without track_pos:
+    with create_engine(db_url).begin() as connection:
+        connection.execute(text('DROP TABLE master2'))
+        connection.execute(text('CREATE TABLE master2 (mpd_id INTEGER, pname TEXT, track_id TEXT, track_name TEXT, '
+                                'aname TEXT, energy_avg FLOAT)'))
+        connection.execute(text("INSERT INTO master2 VALUES (1, 'Legacy', 'track', 'Track', 'Artist', 0.5)"))
+
+    engine = create_database_engine(db_url, slice_size=20)
+
+    with engine.connect() as connection:
+        assert connection.execute(text('SELECT pname FROM master2_legacy')).scalars().all() == ['Legacy']
+        assert 'track_pos' in {column['name'] for column in inspect(connection).get_columns('master2')}
+        assert connection.execute(select(func.count()).select_from(ServingPlaylistTrack)).scalar() \
+            == connection.execute(select(func.count()).select_from(PlaylistTrack)).scalar() > 0
+    # Only once:
+    create_database_engine(db_url, slice_size=20)
@@ -0,0 +1,41 @@
+import numpy as np
+
+from snapshot import MIN_SNAPSHOT_CAPACITY, SnapshotTable, read_snapshot_table
+
+
+def test_snapshot_table_upserts_grows_and_reopens(tmp_path):
+    table = SnapshotTable(str(tmp_path), 'table', 'S22', ['a', 'b'])
+    ids = [f'track{i}' for i in range(MIN_SNAPSHOT_CAPACITY + 10)]
+    table.upsert(ids[:5], [[i, -i] for i in range(5)])
+    # More rows than the initial capacity, some of which replace existing ones:
+    table.upsert(ids[3:], [[i * 10, 0] for i in range(3, len(ids))])
+
+    snapshot_ids, values, columns = read_snapshot_table(str(tmp_path), 'table')
+    assert columns == ['a', 'b']
+    assert [snapshot_id.decode() for snapshot_id in snapshot_ids.tolist()] == ids
+    assert values[:3].tolist() == [[0, 0], [1, -1], [2, -2]]
+    assert np.array_equal(values[3:, 0], np.arange(3, len(ids)) * 10)
+
+    reopened_table = SnapshotTable(str(tmp_path), 'table', 'S22', ['a', 'b'])
+    reopened_table.upsert(['track0', 'new'], [[7, 7], [8, 8]])
+    snapshot_ids, values, _ = read_snapshot_table(str(tmp_path), 'table')
+    assert len(snapshot_ids) == len(ids) + 1
+    assert snapshot_ids[-1] == b'new'
+    assert values[0].tolist() == [7, 7]
+
+
+def test_snapshot_table_deletes_rows(tmp_path):
+    table = SnapshotTable(str(tmp_path), 'table', np.int64, ['a'])
+    table.upsert(range(6), [[i] for i in range(6)])
+    table.delete([1, 5, 9])
+    table.delete([])
+
+    snapshot_ids, values, _ = read_snapshot_table(str(tmp_path), 'table')
+    # The last row took the place of the first deleted one:
+    assert snapshot_ids.tolist() == [0, 4, 2, 3]
+    assert values[:, 0].tolist() == [0, 4, 2, 3]
+
+    reopened_table = SnapshotTable(str(tmp_path), 'table', np.int64, ['a'])
+    reopened_table.upsert([4, 1], [[40], [10]])
+    snapshot_ids, values, _ = read_snapshot_table(str(tmp_path), 'table')
+    assert dict(zip(snapshot_ids.tolist(), values[:, 0].tolist())) == {0: 0, 1: 10, 2: 2, 3: 3, 4: 40}
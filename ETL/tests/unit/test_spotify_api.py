@@ -0,0 +1,92 @@
+import time
+import types
+
+import pytest
+import requests
+
+import spotify_api
+from fake_spotify import FakeSpotifyServer, fake_artist, fake_audio_features
+from spotify_api import SpotifyFetcher, TokenBucket
+from spotify_cache import SpotifyCache
+
+
+def test_fetches_in_order_with_retries():
+    track_ids = [f'track{track_i:05d}' for track_i in range(1050)]
+    with FakeSpotifyServer(latency=0.02, rate_limit_every=4, missing_track_ids={'track00007'}) as server:
+        fetcher = SpotifyFetcher(base_url=server.base_url, max_in_flight=4, requests_per_second=1000)
+        audio_features = fetcher.audio_features(track_ids)
+
+    expected = [None if track_id == 'track00007' else fake_audio_features(track_id) for track_id in track_ids]
+    assert audio_features == expected
+    assert server.rate_limited > 0
+    assert fetcher.retries == server.rate_limited
+    assert fetcher.calls == 11 + server.rate_limited
+    assert server.max_in_flight > 1
+
+
+def test_timeouts_are_retried(monkeypatch):
+    # Without the backoff waits:
+    monkeypatch.setattr(spotify_api, 'time',
+                        types.SimpleNamespace(monotonic=time.monotonic, sleep=lambda seconds: None))
+    artist_ids = [f'artist{artist_i}' for artist_i in range(120)]
+    with FakeSpotifyServer(stall_every=2, stall_seconds=1.0) as server:
+        fetcher = SpotifyFetcher(base_url=server.base_url, max_in_flight=1, requests_per_second=1000, timeout=0.1)
+        artists = fetcher.artists(artist_ids)
+
+        assert artists == [fake_artist(artist_id) for artist_id in artist_ids]
+        assert server.stalled == fetcher.retries == 2
+
+        # The 6th request stalls too, and isn't retried:
+        fetcher = SpotifyFetcher(base_url=server.base_url, requests_per_second=1000, max_retries=0, timeout=0.1)
+        with pytest.raises(requests.Timeout):
+            fetcher.artists(artist_ids[:50])
+
+
+def test_artists_are_batched_by_50():
+    artist_ids = [f'artist{artist_i}' for artist_i in range(120)]
+    with FakeSpotifyServer() as server:
+        fetcher = SpotifyFetcher(base_url=server.base_url, requests_per_second=1000)
+        artists = fetcher.artists(artist_ids)
+
+    assert artists == [fake_artist(artist_id) for artist_id in artist_ids]
+    assert server.requests == 3
+
+
+def test_token_bucket_limits_rate():
+    token_bucket = TokenBucket(rate=50, capacity=1)
+    start = time.monotonic()
+    for _ in range(11):
+        token_bucket.acquire()
+    # The first token is available immediately, the other 10 take 1/50s each:
+    assert time.monotonic() - start >= 0.19
+
+
+def test_cached_ids_are_not_requested_again(tmp_path):
+    track_ids = [f'track{track_i}' for track_i in range(150)]
+    with FakeSpotifyServer(missing_track_ids={'track3'}) as server:
+        cache = SpotifyCache(str(tmp_path / 'spotify_cache.sqlite3'))
+        first_audio_features = SpotifyFetcher(base_url=server.base_url, cache=cache).audio_features(track_ids)
+        cache.close()
+        requests_after_first_fetch = server.requests
+
+        cache = SpotifyCache(str(tmp_path / 'spotify_cache.sqlite3'))
+        fetcher = SpotifyFetcher(base_url=server.base_url, cache=cache)
+        # Overlapping IDs, including the negative result for track3:
+        second_audio_features = fetcher.audio_features(track_ids[:120] + ['track150'])
+        cache.close()
+
+    assert first_audio_features[3] is None
+    assert second_audio_features == first_audio_features[:120] + [fake_audio_features('track150')]
+    assert server.requests == requests_after_first_fetch + 1
+    assert fetcher.calls == 1
+
+
+def test_expired_entries_are_requested_again(tmp_path):
+    with FakeSpotifyServer() as server:
+        cache = SpotifyCache(str(tmp_path / 'spotify_cache.sqlite3'), ttl_seconds=-1)
+        fetcher = SpotifyFetcher(base_url=server.base_url, cache=cache)
+        fetcher.artists(['artist1'])
+        fetcher.artists(['artist1'])
+        cache.close()
+
+    assert server.requests == 2
@@ -0,0 +1,13 @@
+from mpd import transform_slice
+from synthetic_mpd import write_synthetic_slices
+
+
+def test_synthetic_slice_is_transformed_like_an_mpd_slice(tmp_path):
+    write_synthetic_slices(str(tmp_path), [3], seed=1, slice_size=20)
+
+    slice_data = transform_slice(3, str(tmp_path), slice_size=20)
+    assert (slice_data.min_pid, slice_data.max_pid) == (60, 79)
+    for playlist_values, playlist_track_ids in slice_data.playlists:
+        assert playlist_values['num_tracks'] == len(playlist_track_ids) >= 5
+        assert [track_pos for track_pos, _ in playlist_track_ids] == list(range(len(playlist_track_ids)))
+    assert all(len(track_id) == 22 for track_id in slice_data.tracks)
@@ -1,7 +1,13 @@
+from functools import lru_cache
 from pprint import pprint
 
+from sqlalchemy import Integer, bindparam, column, desc, func, or_, select, table
+from sqlalchemy.sql import text
+
 MAGIC = 0.2
 LIMIT = 10
+# Number of distinct songs returned per playlist:
+SONGS_LIMIT = 12
 
 # LIAM JESKE
 
@@ -18,62 +24,80 @@ example =  {'acousticness': 0,
             'valence': 0}
 
 
-def audio_feature_query(k, v):
-    playlist_k = k + "_avg"
-    if v == 0:
-        return ""
-    if v == -1:
-        return f"{playlist_k} < {MAGIC}"
-    if v == 1:
-        return f"{playlist_k} >= {MAGIC}"
+# nl2features calls the liveness feature "liveliness", but the master2 columns are named after the Track features:
+FEATURE_COLUMN_NAMES = {'liveliness': 'liveness'}
 
 
-def sepOR(conds):
-    if len(conds) > 1:
-        ret = ""
-        for i in conds[:-1]:
-            ret += i + "  OR "
+AUDIO_FEATURES = ["acousticness", "danceability", "energy", "instrumentalness", "liveliness", "loudness",
+                  "speechiness", "tempo", "valence"]
 
-        return ret + conds[-1]
-    else:
-        return conds
+master2 = table('master2', column('mpd_id'), column('pname'), column('aname'),
+                *[column(FEATURE_COLUMN_NAMES.get(k, k) + "_avg") for k in AUDIO_FEATURES])
 
 
-def build_query(example, MAGIC = 0.2, LIMIT = 10):
-    conds = []
-    for i in example.keys():
-        if i not in ['genres', 'artists']:
-            b = example.get(i)
-            if b != 0:
-                conds.append(audio_feature_query(i, b))
-        
-    if len(example['artists']) > 1:
-        conds.append(f"aname in {str(tuple(example['artists']))} ")
-    if len(example['artists']) == 1:
-        conds.append(f"aname in ('{example['artists'][0]}')")
+def audio_feature_query(k, v):
+    playlist_k = master2.c[FEATURE_COLUMN_NAMES.get(k, k) + "_avg"]
+    if v == -1:
+        return playlist_k < bindparam('magic')
+    if v == 1:
+        return playlist_k >= bindparam('magic')
 
 
+@lru_cache(maxsize=1024)
+def shape_query(feature_signs, artists_count):
+    """
+    Returns the statement of a query shape: the features which are -1 or 1 (as (feature, sign) pairs, in order), and the
+    number of artists. The statements are cached, so a shape is built (and compiled, by SQLAlchemy's compiled cache)
+    once, and always has the same SQL.
+    """
+    conds = [audio_feature_query(k, v) for k, v in feature_signs]
+    if artists_count:
+        conds.append(master2.c.aname.in_([bindparam(f'artist_{artist_i}') for artist_i in range(artists_count)]))
 
     # GENRES NOT INCORPORATED YET
 
-    if len(conds) > 0:
-        base = fr"""
-                SELECT mpd_id, pname
-                FROM master2
-                WHERE {sepOR(conds)}
-                GROUP BY mpd_id, pname
-                ORDER BY count(aname) desc
-                LIMIT {LIMIT}
-                """
-    else: 
-        base = fr"""
-                SELECT mpd_id, pname
-                FROM master2
-                GROUP BY mpd_id, pname
-                ORDER BY count(aname) desc
-                LIMIT {LIMIT}
-                """
-    return base
+    base = select(master2.c.mpd_id, master2.c.pname)
+    if conds:
+        base = base.where(or_(*conds))
+    return base.group_by(master2.c.mpd_id, master2.c.pname) \
+        .order_by(desc(func.count(master2.c.aname))) \
+        .limit(bindparam('limit', type_=Integer))
 
 
-print(build_query(example))
\ No newline at end of file
+def build_query(example, MAGIC = 0.2, LIMIT = 10):
+    """
+    Returns the statement that finds the playlists of the features (from nl2features), and its parameters.
+    """
+    feature_signs = tuple((i, int(example[i])) for i in example.keys()
+                          if i not in ['genres', 'artists'] and example[i] in (-1, 1))
+    parameters = {'magic': MAGIC, 'limit': LIMIT}
+    for artist_i, artist in enumerate(example['artists']):
+        parameters[f'artist_{artist_i}'] = artist
+    return shape_query(feature_signs, len(example['artists'])), parameters
+
+
+# The tracks of all the playlists found by build_query, in one query instead of one per playlist:
+playlist_songs_query = text("""
+                SELECT mpd_id, track_id, track_name, aname
+                FROM master2
+                WHERE mpd_id IN :mpd_ids
+                ORDER BY mpd_id, track_pos
+                """).bindparams(bindparam('mpd_ids', expanding=True))
+
+
+def group_playlist_songs(rows, songs_limit=SONGS_LIMIT):
+    """
+    Groups the rows of playlist_songs_query into {mpd_id: songs}, with the first songs_limit distinct songs of each
+    playlist.
+    """
+    playlist_songs = {}
+    seen_songs = set()
+    for mpd_id, track_id, track_name, aname in rows:
+        songs = playlist_songs.setdefault(mpd_id, [])
+        if len(songs) < songs_limit and (mpd_id, track_id, track_name, aname) not in seen_songs:
+            seen_songs.add((mpd_id, track_id, track_name, aname))
+            songs.append({'track_name': track_name, 'aname': aname, 'track_id': track_id})
+    return playlist_songs
+
+
+print(build_query(example)[0])
\ No newline at end of file
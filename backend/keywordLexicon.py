@@ -0,0 +1,244 @@
+### KEYWORD LEXICON OF nl2features
+
+# The keywords that nl2features scores the audio features with are expanded with their WordNet synonyms and antonyms,
+# which needs the WordNet corpora (and downloading them) and takes a while. So the expanded keywords are compiled once
+# into a lexicon file of lemma -> (category, polarity) entries, preferably as a build step before the backend starts:
+#
+#     python keywordLexicon.py [--force]
+#
+# which nlpForSpotify loads in milliseconds, without nltk or the network. The file records a hash of the keywords below,
+# and when it is missing, unreadable or doesn't match them, nlpForSpotify rebuilds (and rewrites) it, so editing the
+# keywords never serves a stale lexicon. It only fails to start when it can't rebuild it (without nltk or WordNet).
+
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+
+LEXICON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "keywordLexicon.json")
+
+CATEGORIES = ["acousticness",
+              "danceability",
+              "energy",
+              "instrumentalness",
+              "liveliness",
+              "loudness",
+              "speechiness",
+              "tempo",
+              "valence"]
+
+KEYWORDS_POS = {"acousticness" : set(["musical", "choral", "acoustic", "cappella", "air", "chamber", "classical", "classic", "folk", "harmonic", "resonant", "rustic", "clean", "classic"]),
+               "danceability" : set(["groovy", "funky", "funk", "catchy", "listenable", "dance", "danceable", "hummable", "tuneful", "jangly", "rhythmic"]),
+               "energy" : set(["inciting", "glorious", "exciting", "exhilarating", "energetic", "motivational", "frantic", "work", "workout", "powerful", "snappy", "zestful", "tireless", "spirited", "kinetic", "speedy", "sprightly", "active", "brisk", "peppy", "fast", "exercise", "pump", "pumped", "dance", "danceable", "party", "lively", "peppy", "agressive", "dynamic"]),
+               "instrumentalness" : set(["instrumental", "folk", "rustic", "clean", "classic", "chamber"]),
+               "liveliness" : set(["frantic", "lively", "peppy", "active", "upbeat", "brisk", "snappy", "active", "happy"]),
+               "loudness" : set(["glorious", "sonic", "fortissimo", "dramatic", "hard", "frantic", "loud", "booming", "noisy", "clamorous", "intense"]),
+               "speechiness" : set(["poetic", "lyrical", "motivational", "breathy", "speechy", "verbal", "capella", "singing", "sing"]),
+               "tempo" : set(["glorious", "frantic", "fast", "uptempo", "party", "soaring", "hyper"]),
+               "valence" : set(["romantic", "uplifting", "inspiring", "healing", "soothing", "warm", "motivational", "happy", "breathtaking", "glad", "good", "beautiful", "beach", "paradise", "relaxing"])}
+
+KEYWORDS_NEG = {"acousticness" : set(["electric", "electronic", "beeping", "chiptune", "computer", "computerized"]),
+               "danceability" : set(["sophisticated", "enigmatic", "irregular", "strange", "contemporary", "relaxing"]),
+               "energy" : set(["rainy", "rain", "slow", "sleepy", "tired", "rest", "restful", "lullaby", "beach", "relaxing", "forest"]),
+               "instrumentalness" : set(["simple", "choral", "choir", "speechy", "verbal", "capella", "singing", "sing"]),
+               "liveliness" : set(["stufy", "rain", "sleepy", "tired", "rest", "restful", "lullaby", "chill", "calm", "beach", "paradise"]),
+               "loudness" : set(["light", "gentle", "faint", "soft", "smooth", "study", "quiet", "sneaky", "calm"]),
+               "speechiness" : set(["instrumental", "folk", "rustic", "clean", "classic", "chamber"]),
+               "tempo" : set(["romantic", "mellow", "soothing", "warm", "smooth", "slow", "slowed", "chill", "calm," "downtempo", "calm"]),
+               "valence" : set(["emotional", "moody", "somber", "melancholy", "sad", "mournful", "bad", "blue", "depressing"])}
+
+KEYWORDS_INCREASE = set(["very", "extremely", "really"])
+KEYWORDS_REVERSE = set(["not", "no"])
+
+
+def keywords_hash():
+    """
+    Hash of the keywords (and categories) that the lexicon is expanded from.
+    """
+    keywords = [CATEGORIES,
+                {category: sorted(KEYWORDS_POS[category]) for category in CATEGORIES},
+                {category: sorted(KEYWORDS_NEG[category]) for category in CATEGORIES},
+                sorted(KEYWORDS_INCREASE),
+                sorted(KEYWORDS_REVERSE)]
+    return hashlib.sha256(json.dumps(keywords, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def expand_keywords():
+    """
+    Returns the keywords (positive and negative of each category, increase and reverse) with their WordNet synonyms,
+    and the antonyms of the positive keywords as negative ones and vice versa.
+    """
+    import nltk
+    nltk.download("wordnet")
+    nltk.download("omw-1.4")
+    from nltk.corpus import wordnet
+
+    keywords_pos = {category: set(keywords) for category, keywords in KEYWORDS_POS.items()}
+    keywords_neg = {category: set(keywords) for category, keywords in KEYWORDS_NEG.items()}
+    for category in CATEGORIES:
+        pos = set()
+        neg = set()
+        for word in KEYWORDS_POS[category]:
+            for syn in wordnet.synsets(word):
+                for lm in syn.lemmas():
+                    pos.add(lm.name())
+                    if lm.antonyms():
+                        neg.add(lm.antonyms()[0].name())
+        for word in KEYWORDS_NEG[category]:
+            for syn in wordnet.synsets(word):
+                for lm in syn.lemmas():
+                    neg.add(lm.name())
+                    if lm.antonyms():
+                        pos.add(lm.antonyms()[0].name())
+        keywords_pos[category].update(pos)
+        keywords_neg[category].update(neg)
+
+    keywords_increase = set(KEYWORDS_INCREASE)
+    keywords_reverse = set(KEYWORDS_REVERSE)
+    for word in KEYWORDS_INCREASE:
+        for syn in wordnet.synsets(word):
+            for lm in syn.lemmas():
+                keywords_increase.add(lm.name())
+    for word in KEYWORDS_REVERSE:
+        for syn in wordnet.synsets(word):
+            for lm in syn.lemmas():
+                keywords_reverse.add(lm.name())
+    return keywords_pos, keywords_neg, keywords_increase, keywords_reverse
+
+
+def compile_lexicon(keywords_pos, keywords_neg, keywords_increase, keywords_reverse):
+    """
+    Compiles the keywords into a lexicon of lemma -> (((category index, polarity), ...), reverses, increases), with
+    the (category, polarity) entries in the order that nl2features scored them in (categories in order, positive
+    before negative).
+    """
+    lemmas = set(keywords_increase) | set(keywords_reverse)
+    for category in CATEGORIES:
+        lemmas.update(keywords_pos[category], keywords_neg[category])
+    lexicon = {}
+    for lemma in sorted(lemmas):
+        entries = []
+        for category_i, category in enumerate(CATEGORIES):
+            if lemma in keywords_pos[category]:
+                entries.append((category_i, 1))
+            if lemma in keywords_neg[category]:
+                entries.append((category_i, -1))
+        lexicon[lemma] = (tuple(entries), lemma in keywords_reverse, lemma in keywords_increase)
+    return lexicon
+
+
+def build_lexicon():
+    return compile_lexicon(*expand_keywords())
+
+
+def write_lexicon(lexicon, path=LEXICON_PATH):
+    """
+    Writes the lexicon to a temporary file next to path, which then replaces it, so a reader never sees it half written.
+    """
+    lexicon_file = tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=os.path.dirname(os.path.abspath(path)),
+                                               prefix=os.path.basename(path) + ".", suffix=".tmp", delete=False)
+    try:
+        with lexicon_file:
+            json.dump({"keywords_hash": keywords_hash(),
+                       "lemmas": {lemma: [[list(entry) for entry in entries], reverses, increases]
+                                  for lemma, (entries, reverses, increases) in lexicon.items()}},
+                      lexicon_file, separators=(",", ":"))
+        os.replace(lexicon_file.name, path)
+    except BaseException:
+        os.remove(lexicon_file.name)
+        raise
+
+
+def read_lexicon(path=LEXICON_PATH):
+    """
+    Reads the lexicon file. Raises OSError if it can't be read, and ValueError if it isn't a lexicon of the current
+    keywords.
+    """
+    with open(path, encoding="utf-8") as lexicon_file:
+        lexicon_json = json.load(lexicon_file)
+    try:
+        if lexicon_json["keywords_hash"] != keywords_hash():
+            raise ValueError("the keywords changed since it was built")
+        return {lemma: (tuple(tuple(entry) for entry in entries), reverses, increases)
+                for lemma, (entries, reverses, increases) in lexicon_json["lemmas"].items()}
+    except (KeyError, TypeError) as error:
+        raise ValueError(f"it is not a keyword lexicon ({error!r})") from error
+
+
+def load_lexicon(path=LEXICON_PATH, rebuild=True):
+    """
+    Loads the lexicon file. When it is missing, unreadable or stale, it is rebuilt (which needs nltk, and the network to
+    download WordNet) and rewritten if rebuild. A RuntimeError saying how to build it is raised when it can't be loaded
+    and isn't rebuilt, or can't be rebuilt.
+    """
+    try:
+        return read_lexicon(path)
+    except (OSError, ValueError) as error:
+        if not rebuild:
+            raise RuntimeError(f"The keyword lexicon {path} can't be loaded: {error}. Build it with "
+                               f"`python keywordLexicon.py` before starting the backend.") from error
+        print(f"The keyword lexicon {path} can't be loaded ({error}), building it.")
+    try:
+        lexicon = build_lexicon()
+    except (ImportError, LookupError) as error:
+        # Without nltk, or the WordNet corpora (which nltk.download doesn't raise for):
+        raise RuntimeError(f"The keyword lexicon {path} can't be built without nltk and WordNet: {error}. Build it "
+                           f"with `python keywordLexicon.py` where they are available.") from error
+    try:
+        write_lexicon(lexicon, path)
+    except OSError as error:
+        print(f"Could not write the keyword lexicon: {error}")
+    return lexicon
+
+
+def score_lemmas(lemmas, lexicon):
+    """
+    Returns the score of each category of the lemmas (of a query's tokens), like nl2features did by checking every
+    category for every token: a keyword adds (or subtracts) the multiplier to its categories, which "increase" words
+    raise and "reverse" words negate. As the multiplier is reset to 1 after the first category of a token that isn't an
+    "increase" or "reverse" word, it only applies to the first category (acousticness) of the next keyword.
+    """
+    scores = [0] * len(CATEGORIES)
+    mult = 1
+    for lemma in lemmas:
+        entries, reverses, increases = lexicon.get(lemma, ((), False, False))
+        if not (reverses or increases):
+            for category_i, polarity in entries:
+                if category_i:
+                    mult = 1
+                scores[category_i] += polarity * mult
+                mult = 1
+            mult = 1
+            continue
+
+        # The multiplier of "increase" and "reverse" words changes at every category:
+        category_polarities = dict.fromkeys(range(len(CATEGORIES)), ())
+        for category_i, polarity in entries:
+            category_polarities[category_i] += (polarity,)
+        for category_i, polarities in category_polarities.items():
+            for polarity in polarities:
+                scores[category_i] += polarity * mult
+                mult = 1
+            if reverses:
+                mult = -1 * mult
+            if increases:
+                mult = mult + mult / abs(mult)
+    return scores
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the keyword lexicon file of nl2features.")
+    parser.add_argument("--path", default=LEXICON_PATH, help="Path of the lexicon file.")
+    parser.add_argument("--force", action="store_true", help="Rebuild the lexicon even if the file is up to date.")
+    args = parser.parse_args()
+
+    try:
+        lexicon = None if args.force else read_lexicon(args.path)
+    except (OSError, ValueError) as error:
+        print(f"The keyword lexicon {args.path} can't be loaded ({error}), building it.")
+        lexicon = None
+    if lexicon is None:
+        # Unlike at the backend's start, failing to write it is an error:
+        write_lexicon(build_lexicon(), args.path)
+    print(f"The keyword lexicon {args.path} is up to date.")
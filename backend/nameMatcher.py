@@ -0,0 +1,139 @@
+### MATCHING ARTIST AND GENRE NAMES IN QUERIES
+
+from bisect import bisect_right
+from collections import defaultdict
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton of a list of patterns, which finds every occurrence of all of them in a single pass over a
+    text, in time proportional to the text's length (and the number of occurrences) rather than to the patterns'.
+
+    The transitions are one dict of (state, character) pairs, which is much smaller than a dict per state.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self.goto = {}
+        children = [[]]
+        outputs = [[]]
+        for pattern_i, pattern in enumerate(self.patterns):
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                next_state = self.goto.get((state, char))
+                if next_state is None:
+                    next_state = self.goto[(state, char)] = len(outputs)
+                    children[state].append((char, next_state))
+                    children.append([])
+                    outputs.append([])
+                state = next_state
+            outputs[state].append(pattern_i)
+
+        # Breadth first, so the fail state (the longest proper suffix which is a prefix of a pattern) of every state is
+        # complete before its children's. The outputs of a state include its fail state's:
+        self.fail = [0] * len(outputs)
+        queue = [child for _, child in children[0]]
+        for state in queue:
+            for char, child in children[state]:
+                fail = self.fail[state]
+                while fail and (fail, char) not in self.goto:
+                    fail = self.fail[fail]
+                self.fail[child] = self.goto.get((fail, char), 0)
+                outputs[child].extend(outputs[self.fail[child]])
+                queue.append(child)
+        self.outputs = [tuple(state_outputs) for state_outputs in outputs]
+
+    def find_all(self, text):
+        """
+        Returns the (start, pattern index) of every occurrence of the patterns in the text, in order of their end.
+        """
+        goto = self.goto
+        fail = self.fail
+        outputs = self.outputs
+        patterns = self.patterns
+        occurrences = []
+        state = 0
+        for end, char in enumerate(text, 1):
+            while state and (state, char) not in goto:
+                state = fail[state]
+            state = goto.get((state, char), 0)
+            for pattern_i in outputs[state]:
+                occurrences.append((end - len(patterns[pattern_i]), pattern_i))
+        return occurrences
+
+
+class NameMatcher:
+    """
+    Finds the names of a dictionary (like artist or genre names) in queries, case insensitively, with one pass over the
+    query. It matches what checking every name in dictionary order did:
+
+        for name in names:
+            if name.lower() in query.lower():
+                index = query.lower().index(name.lower())
+                if <the characters around index are not letters>:
+                    found.append(name)
+                    query = query[:index] + query[index + len(name):]  # (only when removing the found names)
+
+    so only the first occurrence of a name (in the query without the names found before it) is matched, and only if it
+    is a whole word. The differences are that the names aren't found across the names removed from the query, and that
+    the names are removed at the right place when lowercasing changes the query's length (like with "İ").
+    """
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.automaton = AhoCorasick([name.lower() for name in self.names])
+
+    def find(self, query, remove=False):
+        """
+        Returns the names found in the query, in dictionary order, and the query without them if remove (else as is).
+        """
+        text = query.lower()
+        pattern_starts = defaultdict(list)
+        for start, pattern_i in self.automaton.find_all(text):
+            pattern_starts[pattern_i].append(start)
+
+        found = []
+        # Sorted (start, end) of the removed names, which never overlap:
+        removed_starts = []
+        removed_ends = []
+        for pattern_i in sorted(pattern_starts):
+            length = len(self.automaton.patterns[pattern_i])
+            for start in pattern_starts[pattern_i]:
+                span_i = bisect_right(removed_starts, start + length - 1)
+                # The first occurrence which is still in the query:
+                if not span_i or removed_ends[span_i - 1] <= start:
+                    break
+            else:
+                continue
+
+            # The characters around the occurrence, skipping the removed names:
+            before = start - 1
+            before_span_i = bisect_right(removed_starts, before)
+            while before_span_i and removed_ends[before_span_i - 1] > before:
+                before = removed_starts[before_span_i - 1] - 1
+                before_span_i -= 1
+            after = start + length
+            after_span_i = bisect_right(removed_starts, after)
+            while after_span_i and removed_starts[after_span_i - 1] == after:
+                after = removed_ends[after_span_i - 1]
+                after_span_i = bisect_right(removed_starts, after)
+            if (before >= 0 and text[before].isalpha()) or (after < len(text) and text[after].isalpha()):
+                continue
+
+            found.append(self.names[pattern_i])
+            if remove:
+                removed_starts.insert(span_i, start)
+                removed_ends.insert(span_i, start + length)
+
+        if remove:
+            if len(text) != len(query):
+                # The position in the query of each character of the lowercase query:
+                positions = [query_i for query_i, char in enumerate(query) for _ in char.lower()] + [len(query)]
+                removed_starts = [positions[start] for start in removed_starts]
+                removed_ends = [positions[end] for end in removed_ends]
+            kept_starts = [0] + removed_ends
+            query = ''.join(query[kept_start:kept_end]
+                            for kept_start, kept_end in zip(kept_starts, removed_starts + [len(query)]))
+        return found, query
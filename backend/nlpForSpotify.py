@@ -4,133 +4,38 @@
 
 import spacy
 import pandas
-import nltk
-nltk.download('wordnet')
-nltk.download('omw-1.4')
-from nltk.corpus import wordnet
+
+from keywordLexicon import CATEGORIES, load_lexicon, score_lemmas
+from nameMatcher import NameMatcher
 
 artists_names = pandas.read_csv("artists_unique.csv")["name"].values
 genre_names = pandas.read_csv("genres1_unique.csv")["gen"].values
-nlp = spacy.load("en_core_web_sm")
-
-categories = ["acousticness",
-               "danceability",
-               "energy",
-               "instrumentalness",
-               "liveliness",
-               "loudness",
-               "speechiness",
-               "tempo", 
-               "valence"]
-
-keywords_pos = {"acousticness" : set(["musical", "choral", "acoustic", "cappella", "air", "chamber", "classical", "classic", "folk", "harmonic", "resonant", "rustic", "clean", "classic"]),
-               "danceability" : set(["groovy", "funky", "funk", "catchy", "listenable", "dance", "danceable", "hummable", "tuneful", "jangly", "rhythmic"]),
-               "energy" : set(["inciting", "glorious", "exciting", "exhilarating", "energetic", "motivational", "frantic", "work", "workout", "powerful", "snappy", "zestful", "tireless", "spirited", "kinetic", "speedy", "sprightly", "active", "brisk", "peppy", "fast", "exercise", "pump", "pumped", "dance", "danceable", "party", "lively", "peppy", "agressive", "dynamic"]),
-               "instrumentalness" : set(["instrumental", "folk", "rustic", "clean", "classic", "chamber"]),
-               "liveliness" : set(["frantic", "lively", "peppy", "active", "upbeat", "brisk", "snappy", "active", "happy"]),
-               "loudness" : set(["glorious", "sonic", "fortissimo", "dramatic", "hard", "frantic", "loud", "booming", "noisy", "clamorous", "intense"]),
-               "speechiness" : set(["poetic", "lyrical", "motivational", "breathy", "speechy", "verbal", "capella", "singing", "sing"]),
-               "tempo" : set(["glorious", "frantic", "fast", "uptempo", "party", "soaring", "hyper"]),
-               "valence" : set(["romantic", "uplifting", "inspiring", "healing", "soothing", "warm", "motivational", "happy", "breathtaking", "glad", "good", "beautiful", "beach", "paradise", "relaxing"])}
-
-keywords_neg = {"acousticness" : set(["electric", "electronic", "beeping", "chiptune", "computer", "computerized"]),
-               "danceability" : set(["sophisticated", "enigmatic", "irregular", "strange", "contemporary", "relaxing"]),
-               "energy" : set(["rainy", "rain", "slow", "sleepy", "tired", "rest", "restful", "lullaby", "beach", "relaxing", "forest"]),
-               "instrumentalness" : set(["simple", "choral", "choir", "speechy", "verbal", "capella", "singing", "sing"]),
-               "liveliness" : set(["stufy", "rain", "sleepy", "tired", "rest", "restful", "lullaby", "chill", "calm", "beach", "paradise"]),
-               "loudness" : set(["light", "gentle", "faint", "soft", "smooth", "study", "quiet", "sneaky", "calm"]),
-               "speechiness" : set(["instrumental", "folk", "rustic", "clean", "classic", "chamber"]),
-               "tempo" : set(["romantic", "mellow", "soothing", "warm", "smooth", "slow", "slowed", "chill", "calm," "downtempo", "calm"]),
-               "valence" : set(["emotional", "moody", "somber", "melancholy", "sad", "mournful", "bad", "blue", "depressing"])}
-
-keywords_increase = set(["very", "extremely", "really"])
-keywords_reverse = set(["not", "no"])
-
-for i in range(0, 1):
-    for category in categories:
-        pos_base = keywords_pos[category]
-        neg_base = keywords_neg[category]
-        pos = set()
-        neg = set()
-        for word in pos_base:
-            for syn in wordnet.synsets(word):
-                for lm in syn.lemmas():
-                    pos.add(lm.name())
-                    if lm.antonyms():
-                        neg.add(lm.antonyms()[0].name())
-        for word in neg_base:
-            for syn in wordnet.synsets(word):
-                for lm in syn.lemmas():
-                    neg.add(lm.name())
-                    if lm.antonyms():
-                        pos.add(lm.antonyms()[0].name())
-        keywords_pos[category].update(pos)
-        keywords_neg[category].update(neg)
-        
-    increase_base = keywords_increase.copy()
-    reverse_base = keywords_reverse.copy()
-    for word in increase_base:
-        for syn in wordnet.synsets(word):
-            for lm in syn.lemmas():
-                keywords_increase.add(lm.name())
-
-    for word in reverse_base:
-        for syn in wordnet.synsets(word):
-            for lm in syn.lemmas():
-                keywords_reverse.add(lm.name())
+# Built once, so each query is matched in one pass over it instead of one search per name:
+artist_matcher = NameMatcher(artists_names)
+genre_matcher = NameMatcher(genre_names)
+# nl2features only reads the lemmas, which need the tagger and attribute ruler (for the POS) and the lemmatizer, so the
+# parser and NER aren't loaded:
+nlp = spacy.load("en_core_web_sm", exclude=["parser", "ner"])
+# Number of queries that nl2features_batch gives the pipeline at once:
+NLP_BATCH_SIZE = 256
+
+# The keywords expanded with their WordNet synonyms and antonyms, built by `python keywordLexicon.py` before the backend
+# starts, or here (with nltk and WordNet) when that file is missing or stale:
+lexicon = load_lexicon()
 
 ### USER GIVES INPUT
 
-def nl2features(iput):
-#iput = "relaxing beach playlist"
+def match_names(iput):
+    """
+    Returns the artists and genres found in the query, and the query without the artists.
+    """
+    names_found, iput = artist_matcher.find(iput, remove=True)
+    genres_found, _ = genre_matcher.find(iput)
+    return names_found, genres_found, iput
 
-    names_found = []
-    for artist in artists_names:
-        if artist.lower() in iput.lower():
-            index = iput.lower().index(artist.lower())
-            if (index == 0 or not iput[index - 1].isalpha()) \
-            and (index + len(artist.lower()) == len(iput) or not iput[index + len(artist.lower())].isalpha()):
-                names_found.append(artist)
-                iput = iput[:index] + iput[index + len(artist.lower()):]
-
-    genres_found = []
-    for genre in genre_names:
-        if genre.lower() in iput.lower():
-            index = iput.lower().index(genre.lower())
-            if (index == 0 or not iput[index - 1].isalpha()) \
-            and (index + len(genre.lower()) == len(iput) or not iput[index + len(genre.lower())].isalpha()):
-                genres_found.append(genre)
-
-    features_dict = {"acousticness":0,
-                "danceability":0,
-                "energy":0,
-                "instrumentalness":0,
-                "liveliness":0,
-                "loudness":0,
-                "speechiness":0,
-                "tempo":0,
-                "valence":0}
-
-
-    doc = nlp(iput)
-    mult = 1
-    found = False
-
-    for token in doc:
-        for category in categories:
-            if token.lemma_ in keywords_pos[category]:
-                features_dict[category] += mult
-                mult = 1
-            if token.lemma_ in keywords_neg[category]:
-                features_dict[category] -= mult
-                mult = 1
-            if token.lemma_ in keywords_reverse or token.lemma_ in keywords_increase:
-                if token.lemma_ in keywords_reverse:
-                    mult = -1 * mult
-                if token.lemma_ in keywords_increase:
-                    mult = mult + mult/abs(mult)
-            else:
-                mult = 1
+
+def doc2features(doc, names_found, genres_found):
+    features_dict = dict(zip(CATEGORIES, score_lemmas([token.lemma_ for token in doc], lexicon)))
 
     for feature in features_dict:
         if (features_dict[feature] != 0):
@@ -138,10 +43,25 @@ def nl2features(iput):
 
     features_dict['artists'] = names_found
     features_dict['genres'] = genres_found
+    return features_dict
 
 
-    
-    return features_dict
+def nl2features(iput):
+#iput = "relaxing beach playlist"
+
+    names_found, genres_found, iput = match_names(iput)
+    return doc2features(nlp(iput), names_found, genres_found)
+
+
+def nl2features_batch(queries, batch_size=NLP_BATCH_SIZE, n_process=1):
+    """
+    Returns the features of each query, like nl2features, but runs the queries through the pipeline in batches (and
+    n_process processes), for scoring many queries at once (like a query log).
+    """
+    matched = [match_names(iput) for iput in queries]
+    docs = nlp.pipe([iput for _, _, iput in matched], batch_size=batch_size, n_process=n_process)
+    return [doc2features(doc, names_found, genres_found)
+            for doc, (names_found, genres_found, _) in zip(docs, matched)]
 
 nl2features("relaxing beach party playlist with Katy Perry")
 print("Done")
\ No newline at end of file
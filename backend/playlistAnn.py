@@ -0,0 +1,250 @@
+### APPROXIMATE NEAREST NEIGHBOR SEARCH OF PLAYLISTS (INVERTED FILE INDEX)
+
+# Searching all the playlists (see playlistIndex.py) costs a product over every one of them per query. The inverted file
+# (IVF) index clusters the playlist vectors with k-means offline, and a query only scores the playlists of the
+# nprobe clusters whose centroids are nearest to its target: more probes find more of the exact nearest playlists
+# (recall) for more time. It is built from the playlist table, into .npy files which the backend's workers memory map,
+# so they share the same pages:
+#
+#     python playlistAnn.py build [--index-path annIndex] [--lists-count N]
+#     python playlistAnn.py benchmark [--index-path annIndex] [--k 10] [--probes 1 2 4 8 16 32 64]
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from playlistIndex import AVG_COLUMN_NAMES, K, STD_COLUMN_NAMES, features_target, load_playlist_index
+from QueryBuilder import AUDIO_FEATURES
+
+ANN_INDEX_PATH = os.getenv('PLAYLIST_ANN_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'annIndex'))
+# Number of clusters probed per query by default:
+PROBES_COUNT = 32
+KMEANS_ITERATIONS = 20
+# Number of playlists per cluster sampled to train the k-means on:
+KMEANS_SAMPLE_PER_LIST = 64
+# Number of playlists assigned to their clusters at once:
+ASSIGN_CHUNK_SIZE = 65536
+
+ARRAY_NAMES = ['centroids', 'list_offsets', 'vectors', 'mpd_ids', 'names', 'name_offsets']
+
+
+def default_lists_count(playlists_count):
+    return max(1, int(2 * np.sqrt(playlists_count)))
+
+
+def assign_lists(vectors, centroids):
+    """
+    Returns the index of the nearest centroid (with the largest dot product) of each vector.
+    """
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_CHUNK_SIZE):
+        chunk = vectors[start:start + ASSIGN_CHUNK_SIZE]
+        assignments[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+def spherical_kmeans(vectors, lists_count, iterations=KMEANS_ITERATIONS, seed=351):
+    """
+    Returns the unit centroids of k-means over the (unit) vectors, by cosine similarity, trained on a sample of them.
+    The clusters which end up empty get a random vector instead.
+    """
+    rng = np.random.default_rng(seed)
+    sample = vectors[np.sort(rng.choice(len(vectors), min(len(vectors), lists_count * KMEANS_SAMPLE_PER_LIST),
+                                        replace=False))]
+    centroids = sample[rng.choice(len(sample), lists_count, replace=len(sample) < lists_count)].astype(np.float32)
+    for _ in range(iterations):
+        assignments = assign_lists(sample, centroids)
+        sums = np.stack([np.bincount(assignments, weights=sample[:, dimension_i], minlength=lists_count)
+                         for dimension_i in range(sample.shape[1])], axis=1)
+        norms = np.linalg.norm(sums, axis=1)
+        empty = norms == 0
+        sums[empty] = sample[rng.choice(len(sample), empty.sum())]
+        norms[empty] = np.linalg.norm(sums[empty], axis=1)
+        centroids = (sums / np.where(norms > 0, norms, 1)[:, np.newaxis]).astype(np.float32)
+    return centroids
+
+
+def build_ann_index(mpd_ids, playlist_names, vectors, lists_count=None, iterations=KMEANS_ITERATIONS):
+    """
+    Returns the arrays of the index of the (playlists x aggregates) unit vectors: the centroids, and the playlists'
+    vectors, mpd_ids and names (as one UTF-8 buffer with offsets) sorted by cluster, with the offsets of the clusters.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    lists_count = min(lists_count or default_lists_count(len(vectors)), len(vectors))
+    centroids = spherical_kmeans(vectors, lists_count, iterations)
+    assignments = assign_lists(vectors, centroids)
+    order = np.argsort(assignments, kind='stable')
+    encoded_names = [playlist_names[playlist_i].encode('utf-8') for playlist_i in order]
+    return {'centroids': centroids,
+            'list_offsets': np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=lists_count))]),
+            'vectors': np.ascontiguousarray(vectors[order]),
+            'mpd_ids': np.asarray(mpd_ids, dtype=np.int64)[order],
+            'names': np.frombuffer(b''.join(encoded_names), dtype=np.uint8),
+            'name_offsets': np.concatenate([[0], np.cumsum([len(name) for name in encoded_names], dtype=np.int64)])}
+
+
+def save_ann_index(arrays, index_path=ANN_INDEX_PATH):
+    """
+    Saves the arrays of the index as .npy files in a directory, which replaces the index_path one once complete, so the
+    workers which mapped the previous files keep reading them.
+    """
+    building_path = index_path + '.building'
+    shutil.rmtree(building_path, ignore_errors=True)
+    os.makedirs(building_path)
+    for array_name in ARRAY_NAMES:
+        np.save(os.path.join(building_path, array_name + '.npy'), arrays[array_name])
+    with open(os.path.join(building_path, 'meta.json'), 'w') as meta_file:
+        json.dump({'features': AUDIO_FEATURES,
+                   'aggregate_columns': AVG_COLUMN_NAMES + STD_COLUMN_NAMES,
+                   'playlists_count': len(arrays['mpd_ids']),
+                   'lists_count': len(arrays['centroids'])}, meta_file)
+
+    old_path = index_path + '.old'
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(index_path):
+        os.rename(index_path, old_path)
+    os.rename(building_path, index_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+class PlaylistAnnIndex:
+    """
+    Memory mapped IVF index of the playlist vectors (see build_ann_index), searched like playlistIndex.PlaylistIndex.
+    """
+
+    def __init__(self, index_path=ANN_INDEX_PATH):
+        with open(os.path.join(index_path, 'meta.json')) as meta_file:
+            self.meta = json.load(meta_file)
+        if self.meta['aggregate_columns'] != AVG_COLUMN_NAMES + STD_COLUMN_NAMES:
+            raise ValueError(f'The index at {index_path} was built from other aggregates, rebuild it.')
+        for array_name in ARRAY_NAMES:
+            setattr(self, array_name, np.load(os.path.join(index_path, array_name + '.npy'), mmap_mode='r'))
+
+    def playlist_name(self, playlist_i):
+        return bytes(self.names[self.name_offsets[playlist_i]:self.name_offsets[playlist_i + 1]]).decode('utf-8')
+
+    def search_target(self, target, k=K, probes_count=PROBES_COUNT):
+        """
+        Returns the indexes (in the index's order) and similarities of the k nearest playlists to the target among the
+        ones of its probes_count nearest clusters, nearest first.
+        """
+        centroid_similarities = self.centroids @ target
+        probes_count = min(probes_count, len(centroid_similarities))
+        probes = np.argpartition(centroid_similarities, len(centroid_similarities) - probes_count)[-probes_count:]
+        candidates = np.concatenate([np.arange(self.list_offsets[list_i], self.list_offsets[list_i + 1])
+                                     for list_i in probes])
+        similarities = np.concatenate([self.vectors[self.list_offsets[list_i]:self.list_offsets[list_i + 1]] @ target
+                                       for list_i in probes])
+        k = min(k, len(similarities))
+        if not k:
+            return candidates, similarities
+        top = np.argpartition(similarities, len(similarities) - k)[len(similarities) - k:]
+        top = top[np.argsort(-similarities[top], kind='stable')]
+        return candidates[top], similarities[top]
+
+    def search(self, features, k=K, probes_count=PROBES_COUNT):
+        """
+        Returns the (mpd_id, playlist name, distance) of the k nearest playlists to the features of nl2features that it
+        finds, nearest first, or none if it has no features.
+        """
+        target = features_target(features)
+        if target is None:
+            return []
+        playlist_indexes, similarities = self.search_target(target, k, probes_count)
+        # The euclidean distance between unit vectors:
+        distances = np.sqrt(np.maximum(2 - 2 * similarities, 0))
+        return [(int(self.mpd_ids[playlist_i]), self.playlist_name(playlist_i), float(distance))
+                for playlist_i, distance in zip(playlist_indexes, distances)]
+
+
+def random_targets(targets_count, seed=351):
+    """
+    Returns targets of random features (between 1 and 4 of them, each 1 or -1).
+    """
+    rng = np.random.default_rng(seed)
+    targets = []
+    for _ in range(targets_count):
+        features = {k: float(rng.choice([-1, 1]))
+                    for k in rng.choice(AUDIO_FEATURES, rng.integers(1, 5), replace=False)}
+        targets.append(features_target(features))
+    return targets
+
+
+def exact_search_target(vectors, target, k=K):
+    similarities = vectors @ target
+    return np.argpartition(similarities, len(similarities) - k)[len(similarities) - k:]
+
+
+def benchmark_recall(ann_index, k=K, probes_counts=(1, 2, 4, 8, 16, 32, 64), targets_count=200):
+    """
+    Returns the recall@k (the share of the exact k nearest playlists found) and the median latency of the searches with
+    each number of probes, over random targets, with the exact search's latency.
+    """
+    vectors = np.asarray(ann_index.vectors)
+    targets = random_targets(targets_count)
+    exact_latencies = []
+    exact_tops = []
+    for target in targets:
+        start_time = time.perf_counter()
+        exact_tops.append(set(exact_search_target(vectors, target, k).tolist()))
+        exact_latencies.append(time.perf_counter() - start_time)
+
+    results = []
+    for probes_count in probes_counts:
+        latencies = []
+        found_count = 0
+        for target, exact_top in zip(targets, exact_tops):
+            start_time = time.perf_counter()
+            playlist_indexes, _ = ann_index.search_target(target, k, probes_count)
+            latencies.append(time.perf_counter() - start_time)
+            found_count += len(exact_top & set(playlist_indexes.tolist()))
+        results.append({'probes_count': probes_count,
+                        'recall': found_count / (k * len(targets)),
+                        'median_ms': float(np.median(latencies) * 1000)})
+    return results, float(np.median(exact_latencies) * 1000)
+
+
+async def load_vectors(db_url):
+    from dataAccess import Database
+
+    database = Database(db_url)
+    try:
+        playlist_index = await load_playlist_index(database)
+    finally:
+        await database.dispose()
+    # The index is (aggregates x playlists):
+    return playlist_index.mpd_ids, playlist_index.playlist_names, playlist_index.matrix.T
+
+
+if __name__ == '__main__':
+    from dataAccess import DB_URL
+
+    parser = argparse.ArgumentParser(description='Build or benchmark the approximate nearest playlists index.')
+    parser.add_argument('command', choices=['build', 'benchmark'])
+    parser.add_argument('--db-url', default=DB_URL, help='SQLAlchemy (async) URL of the database to build from.')
+    parser.add_argument('--index-path', default=ANN_INDEX_PATH, help='Directory of the index files.')
+    parser.add_argument('--lists-count', type=int, help='Number of clusters (default: 2 sqrt(number of playlists)).')
+    parser.add_argument('--iterations', type=int, default=KMEANS_ITERATIONS, help='Number of k-means iterations.')
+    parser.add_argument('--k', type=int, default=K, help='Number of nearest playlists of the benchmark.')
+    parser.add_argument('--probes', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64],
+                        help='Numbers of probed clusters of the benchmark.')
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    if args.command == 'build':
+        mpd_ids, playlist_names, vectors = asyncio.run(load_vectors(args.db_url))
+        save_ann_index(build_ann_index(mpd_ids, playlist_names, vectors, args.lists_count, args.iterations),
+                       args.index_path)
+        print(f'Built the index of {len(mpd_ids)} playlists at {args.index_path}. '
+              f'(Took {time.perf_counter() - start_time}s).')
+    else:
+        results, exact_median_ms = benchmark_recall(PlaylistAnnIndex(args.index_path), args.k, args.probes)
+        print(f'Exact search: {exact_median_ms:.3f}ms')
+        for result in results:
+            print(f'{result["probes_count"]} probes: recall@{args.k} {result["recall"]:.4f}, '
+                  f'{result["median_ms"]:.3f}ms')
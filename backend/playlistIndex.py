@@ -0,0 +1,98 @@
+### IN-MEMORY NEAREST NEIGHBOR SEARCH OF PLAYLISTS BY AUDIO FEATURES
+
+import asyncio
+import time
+
+import numpy as np
+from sqlalchemy import column, select, table
+
+from QueryBuilder import AUDIO_FEATURES, FEATURE_COLUMN_NAMES
+
+# Value of the aggregates which are undefined for a playlist (like the std of a single track playlist), see the ETL's
+# models.AGGREGATE_DEFAULT:
+AGGREGATE_DEFAULT = -1000000
+# Weight of the std of the features in the target (relative to their avg), which is negative to prefer the playlists
+# whose tracks are consistently like the target over the ones which only are on average:
+STD_WEIGHT = -0.5
+K = 10
+
+AVG_COLUMN_NAMES = [FEATURE_COLUMN_NAMES.get(k, k) + "_avg" for k in AUDIO_FEATURES]
+STD_COLUMN_NAMES = [FEATURE_COLUMN_NAMES.get(k, k) + "_std" for k in AUDIO_FEATURES]
+
+playlist = table('playlist', column('playlist_mpd_id'), column('playlist_name'),
+                 *[column(column_name) for column_name in AVG_COLUMN_NAMES + STD_COLUMN_NAMES])
+
+
+def normalize_rows(matrix):
+    """
+    Standardizes the columns of a (playlists x aggregates) matrix, with the undefined aggregates at their column's mean,
+    and scales its rows to unit length, as float32.
+    """
+    matrix = np.array(matrix, dtype=np.float64).reshape(len(matrix), len(AVG_COLUMN_NAMES) + len(STD_COLUMN_NAMES))
+    defined = matrix != AGGREGATE_DEFAULT
+    counts = np.maximum(defined.sum(axis=0), 1)
+    means = np.where(defined, matrix, 0).sum(axis=0) / counts
+    stds = np.sqrt(np.where(defined, (matrix - means) ** 2, 0).sum(axis=0) / counts)
+    matrix = np.where(defined, (matrix - means) / np.where(stds > 0, stds, 1), 0)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.ascontiguousarray(matrix / np.where(norms > 0, norms, 1), dtype=np.float32)
+
+
+def features_target(features):
+    """
+    Returns the unit target of the features of nl2features, or None if it has none.
+    """
+    signs = np.array([features.get(k, 0) for k in AUDIO_FEATURES], dtype=np.float32)
+    if not signs.any():
+        return None
+    target = np.concatenate([signs, STD_WEIGHT * np.abs(signs)])
+    return target / np.linalg.norm(target)
+
+
+class PlaylistIndex:
+    """
+    The standardized avg and std of the audio features of every playlist, as unit vectors of a float32 matrix, so the
+    nearest playlists to a target (the direction of the features asked for) are the ones with the largest dot product
+    with it: one matrix-vector product, and a partial sort (argpartition) of the top k.
+
+    The target only has the features which nl2features found (1 or -1), so when they are few the product only reads the
+    aggregates of those (masked scoring). The matrix is stored as (aggregates x playlists), so each aggregate's values
+    are contiguous, which also makes the product much faster than over (playlists x aggregates) rows of 18 values.
+    """
+
+    def __init__(self, mpd_ids, playlist_names, aggregates):
+        self.mpd_ids = np.asarray(mpd_ids, dtype=np.int64)
+        self.playlist_names = list(playlist_names)
+        self.matrix = np.ascontiguousarray(normalize_rows(aggregates).T)
+
+    def search(self, features, k=K):
+        """
+        Returns the (mpd_id, playlist name, distance) of the k nearest playlists to the features of nl2features, nearest
+        first, or none if it has no features.
+        """
+        target = features_target(features)
+        if target is None or not len(self.mpd_ids):
+            return []
+        aggregate_indexes = np.flatnonzero(target)
+        if len(aggregate_indexes) * 4 <= len(target):
+            similarities = target[aggregate_indexes] @ self.matrix[aggregate_indexes]
+        else:
+            # Copying most of the matrix would cost more than multiplying its other aggregates by 0:
+            similarities = target @ self.matrix
+        k = min(k, len(similarities))
+        top = np.argpartition(similarities, len(similarities) - k)[len(similarities) - k:]
+        top = top[np.argsort(-similarities[top], kind='stable')]
+        # The euclidean distance between unit vectors:
+        distances = np.sqrt(np.maximum(2 - 2 * similarities[top], 0))
+        return [(int(self.mpd_ids[playlist_i]), self.playlist_names[playlist_i], float(distance))
+                for playlist_i, distance in zip(top, distances)]
+
+
+async def load_playlist_index(database):
+    start_time = time.perf_counter()
+    rows = await database.fetch_all(select(playlist).order_by(playlist.c.playlist_mpd_id))
+    # Off the event loop, as it takes about a second per million playlists:
+    playlist_index = await asyncio.to_thread(PlaylistIndex, [row[0] for row in rows], [row[1] for row in rows],
+                                             [row[2:] for row in rows])
+    print(f'Loaded the index of {len(rows)} playlists. (Took {time.perf_counter() - start_time}s).')
+    return playlist_index
@@ -0,0 +1,111 @@
+### CACHE OF THE RESULTS OF REPEATED QUERIES
+
+import string
+import time
+from collections import OrderedDict
+
+from sqlalchemy.sql import text
+
+# Returned by QueryCache.get when the key isn't cached (as None can be a cached value):
+MISSING = object()
+
+DATA_VERSION_QUERY = text('SELECT MAX(updated_at), COUNT(*) FROM ingest_slice')
+
+
+def normalize_query(query):
+    """
+    Normalizes a query into its cache key: lowercase, with single spaces between its words, and each word without the
+    punctuation at its ends (like "Dance, party!" -> "dance party"). Punctuation inside words is kept, as it can be part
+    of an artist's name (like "AC/DC").
+    """
+    return ' '.join(word for word in (word.strip(string.punctuation) for word in query.lower().split()) if word)
+
+
+class QueryCache:
+    """
+    LRU cache with a time to live: an entry is dropped after ttl_seconds, and the least recently used one when there are
+    max_entries. It isn't locked, as the backend's handlers use it from the event loop only.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key -> (expiry time, value), from the least to the most recently used:
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self.entries[key]
+            self.expirations += 1
+        self.misses += 1
+        return MISSING
+
+    def put(self, key, value):
+        self.entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.invalidations += 1
+
+    def stats(self):
+        requests_count = self.hits + self.misses
+        return {'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests_count if requests_count else 0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations}
+
+
+class DataVersion:
+    """
+    Version of the data loaded by the ingestion, from its manifest (the ingest_slice table): the last time a slice was
+    loaded, and the number of slices. It is read at most every check_seconds, so checking it doesn't slow down the
+    cached queries.
+    """
+
+    def __init__(self, database, check_seconds=5):
+        self.database = database
+        self.check_seconds = check_seconds
+        self.version = None
+        self.checked_at = None
+
+    async def read(self):
+        try:
+            return tuple((await self.database.fetch_all(DATA_VERSION_QUERY))[0])
+        except Exception as error:
+            # Like a database loaded before the ingestion kept a manifest:
+            print(f'Could not read the data version: {error}')
+            return None
+
+    async def changed(self):
+        """
+        Returns whether the version changed since it was last checked (not the first time it is).
+        """
+        now = time.monotonic()
+        if self.checked_at is not None and now - self.checked_at < self.check_seconds:
+            return False
+        first_check = self.checked_at is None
+        # Set first, so the concurrent requests don't all read it:
+        self.checked_at = now
+        version = await self.read()
+        changed = not first_check and version != self.version
+        self.version = version
+        return changed
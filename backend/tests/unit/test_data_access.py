@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.sql import text
+
+from dataAccess import Database, QueryTimeoutError
+
+pytest.importorskip('aiosqlite')
+
+
+def test_database_queries_concurrently_on_pooled_connections(tmp_path):
+    async def run():
+        database = Database('sqlite+aiosqlite:///' + str(tmp_path / 'pool.sqlite3'), pool_size=3, pool_timeout=5)
+        rows = await asyncio.gather(*[database.fetch_all(text('SELECT :query_i'), {'query_i': query_i})
+                                      for query_i in range(20)])
+        stats = database.stats()
+        await database.dispose()
+        return rows, stats
+
+    rows, stats = asyncio.run(run())
+
+    assert [query_rows[0][0] for query_rows in rows] == list(range(20))
+    assert stats['queries'] == 20 and stats['in_flight'] == 0 and stats['errors'] == 0
+    # The connections are reused, and all returned to the pool:
+    assert stats['pool_size'] == 3 and stats['checked_in'] <= 3 and stats['checked_out'] == 0
+
+
+def test_database_times_out_when_the_pool_is_exhausted(tmp_path):
+    async def run():
+        database = Database('sqlite+aiosqlite:///' + str(tmp_path / 'pool.sqlite3'), pool_size=1, pool_timeout=0.1)
+        async with database.engine.connect():
+            with pytest.raises(PoolTimeoutError):
+                await database.fetch_all(text('SELECT 1'))
+        rows = await database.fetch_all(text('SELECT 1'))
+        stats = database.stats()
+        await database.dispose()
+        return rows, stats
+
+    rows, stats = asyncio.run(run())
+
+    assert rows[0][0] == 1
+    assert stats['pool_timeouts'] == 1 and stats['in_flight'] == 0
+
+
+def test_database_invalidates_the_connection_of_a_timed_out_query(tmp_path):
+    async def run():
+        database = Database('sqlite+aiosqlite:///' + str(tmp_path / 'pool.sqlite3'), pool_size=1, query_timeout=0.05)
+        invalidated = []
+        event.listen(database.engine.sync_engine, 'invalidate', lambda *args: invalidated.append(args))
+        with pytest.raises(QueryTimeoutError):
+            await database.fetch_all(text('WITH RECURSIVE counter(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM counter '
+                                          'WHERE n < 3000000) SELECT COUNT(*) FROM counter'))
+        database.query_timeout = 5
+        rows = await database.fetch_all(text('SELECT 1'))
+        stats = database.stats()
+        await database.dispose()
+        return rows, stats, invalidated
+
+    rows, stats, invalidated = asyncio.run(run())
+
+    assert rows[0][0] == 1 and len(invalidated) == 1
+    assert stats['query_timeouts'] == 1 and stats['in_flight'] == 0 and stats['checked_out'] == 0
@@ -0,0 +1,36 @@
+import asyncio
+import importlib
+import os
+
+import pytest
+
+from keywordLexicon import LEXICON_PATH
+
+BACKEND_PATH = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_cached_features_match_the_names_of_the_query_as_written(monkeypatch, tmp_path):
+    for module_name in ('fastapi', 'pandas', 'matplotlib', 'seaborn', 'aiosqlite'):
+        pytest.importorskip(module_name)
+    spacy = pytest.importorskip('spacy')
+    if not spacy.util.is_package('en_core_web_sm'):
+        pytest.skip('the en_core_web_sm model is not installed')
+    if not os.path.exists(LEXICON_PATH):
+        pytest.skip('the keyword lexicon is not built (python keywordLexicon.py)')
+    # The database isn't queried, but its engine is created at import:
+    monkeypatch.setenv('BACKEND_DB_URL', 'sqlite+aiosqlite:///' + str(tmp_path / 'backend.sqlite3'))
+    # nlpForSpotify reads the artist and genre names relative to the working directory:
+    monkeypatch.chdir(BACKEND_PATH)
+    FastBackend = importlib.import_module('FastBackend')
+    FastBackend.features_cache.clear()
+    hits = FastBackend.features_cache.hits
+
+    async def run():
+        return [await FastBackend.cached_nl2features(query)
+                for query in ["Guns N' Roses and Tyler, The Creator", "guns n' roses and tyler the creator!"]]
+
+    features, cached_features = asyncio.run(run())
+
+    assert "Guns N' Roses" in features['artists'] and 'Tyler, The Creator' in features['artists']
+    # The second query has the same cache key, so it isn't run through nl2features again:
+    assert cached_features is features and FastBackend.features_cache.hits == hits + 1
@@ -0,0 +1,95 @@
+import json
+import os
+import random
+
+import pytest
+
+import keywordLexicon
+from keywordLexicon import (CATEGORIES, KEYWORDS_INCREASE, KEYWORDS_NEG, KEYWORDS_POS, KEYWORDS_REVERSE,
+                            compile_lexicon, keywords_hash, load_lexicon, score_lemmas, write_lexicon)
+
+
+def score_lemmas_by_category(lemmas, keywords_pos, keywords_neg, keywords_increase, keywords_reverse):
+    # The scoring that nl2features did before the lexicon:
+    features_dict = dict.fromkeys(CATEGORIES, 0)
+    mult = 1
+    for lemma in lemmas:
+        for category in CATEGORIES:
+            if lemma in keywords_pos[category]:
+                features_dict[category] += mult
+                mult = 1
+            if lemma in keywords_neg[category]:
+                features_dict[category] -= mult
+                mult = 1
+            if lemma in keywords_reverse or lemma in keywords_increase:
+                if lemma in keywords_reverse:
+                    mult = -1 * mult
+                if lemma in keywords_increase:
+                    mult = mult + mult / abs(mult)
+            else:
+                mult = 1
+    return [features_dict[category] for category in CATEGORIES]
+
+
+def test_score_lemmas_matches_scoring_by_category():
+    keywords_pos = {category: set(keywords) for category, keywords in KEYWORDS_POS.items()}
+    keywords_neg = {category: set(keywords) for category, keywords in KEYWORDS_NEG.items()}
+    keywords_increase = set(KEYWORDS_INCREASE)
+    keywords_reverse = set(KEYWORDS_REVERSE)
+    # Keywords which are also "increase" or "reverse" words, or both:
+    keywords_pos['energy'].add('not')
+    keywords_neg['acousticness'].add('very')
+    keywords_increase.add('hardly')
+    keywords_reverse.add('hardly')
+    keywords_pos['valence'].add('hardly')
+    keywords = compile_lexicon(keywords_pos, keywords_neg, keywords_increase, keywords_reverse)
+
+    rng = random.Random(351)
+    lemmas = sorted(keywords) + ['playlist', 'with', 'the']
+    for _ in range(2000):
+        query_lemmas = [rng.choice(lemmas) for _ in range(rng.randrange(1, 8))]
+        assert score_lemmas(query_lemmas, keywords) == score_lemmas_by_category(
+            query_lemmas, keywords_pos, keywords_neg, keywords_increase, keywords_reverse), query_lemmas
+
+
+def test_load_lexicon_reads_written_lexicon(tmp_path):
+    lexicon = compile_lexicon(KEYWORDS_POS, KEYWORDS_NEG, KEYWORDS_INCREASE, KEYWORDS_REVERSE)
+    path = str(tmp_path / 'keywordLexicon.json')
+    write_lexicon(lexicon, path)
+
+    assert load_lexicon(path) == lexicon
+    assert len(keywords_hash()) == 64
+
+
+def test_load_lexicon_rebuilds_invalid_lexicons(tmp_path, monkeypatch):
+    lexicon = compile_lexicon(KEYWORDS_POS, KEYWORDS_NEG, KEYWORDS_INCREASE, KEYWORDS_REVERSE)
+    # Without WordNet:
+    monkeypatch.setattr(keywordLexicon, 'build_lexicon', lambda: lexicon)
+    path = str(tmp_path / 'keywordLexicon.json')
+    stale_lexicon_json = json.dumps({'keywords_hash': '0' * 64, 'lemmas': {}})
+
+    for lexicon_json in [None, '{"keywords_hash": "', '[]', json.dumps({'keywords_hash': keywords_hash()}),
+                         stale_lexicon_json]:
+        if lexicon_json is not None:
+            with open(path, 'w') as lexicon_file:
+                lexicon_file.write(lexicon_json)
+        with pytest.raises(RuntimeError, match='python keywordLexicon.py'):
+            load_lexicon(path, rebuild=False)
+
+        assert load_lexicon(path) == lexicon
+        assert load_lexicon(path, rebuild=False) == lexicon
+        os.remove(path)
+    # Without the temporary file:
+    assert os.listdir(str(tmp_path)) == []
+
+    # A lexicon which can't be written is still served:
+    assert load_lexicon(str(tmp_path / 'missing' / 'keywordLexicon.json')) == lexicon
+
+
+def test_load_lexicon_raises_when_it_cannot_rebuild(tmp_path, monkeypatch):
+    def build_lexicon_without_wordnet():
+        raise LookupError('Resource wordnet not found.')
+    monkeypatch.setattr(keywordLexicon, 'build_lexicon', build_lexicon_without_wordnet)
+
+    with pytest.raises(RuntimeError, match='without nltk and WordNet'):
+        load_lexicon(str(tmp_path / 'keywordLexicon.json'))
@@ -0,0 +1,55 @@
+import csv
+import os
+import random
+
+from nameMatcher import AhoCorasick, NameMatcher
+
+BACKEND_PATH = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def read_names(file_name):
+    with open(os.path.join(BACKEND_PATH, file_name), newline='', encoding='utf-8') as names_file:
+        return [row[0] for row in list(csv.reader(names_file))[1:]]
+
+
+def find_names(names, query, remove=False):
+    # The search that nl2features did before the matcher:
+    found = []
+    for name in names:
+        if name.lower() in query.lower():
+            index = query.lower().index(name.lower())
+            if (index == 0 or not query[index - 1].isalpha()) \
+                    and (index + len(name) == len(query) or not query[index + len(name)].isalpha()):
+                found.append(name)
+                if remove:
+                    query = query[:index] + query[index + len(name):]
+    return found, query
+
+
+def test_aho_corasick_finds_overlapping_patterns():
+    automaton = AhoCorasick(['he', 'she', 'his', 'hers', ''])
+    assert sorted(automaton.find_all('ushers')) == [(1, 1), (2, 0), (2, 3)]
+
+
+def test_name_matcher_matches_search():
+    names = ['Katy Perry', 'Perry', 'Katy', 'AC/DC', 'Kat', 'Rock', 'rock and roll', 'Hard Rock', 'A', '!!!', 'B B']
+    matcher = NameMatcher(names)
+    for query in ['relaxing beach party playlist with Katy Perry', 'KATY PERRY and perry', 'katydid perry', 'ac/dc!!!',
+                  'hard rock and roll', 'a rock', 'Perryrock katy', 'b b b b', '', 'Kat Katy']:
+        for remove in [False, True]:
+            assert matcher.find(query, remove) == find_names(names, query, remove), query
+
+
+def test_name_matcher_matches_search_of_dataset_names():
+    artist_names = read_names('artists_unique.csv')
+    genre_names = read_names('genres1_unique.csv')
+    artist_matcher = NameMatcher(artist_names)
+    genre_matcher = NameMatcher(genre_names)
+    rng = random.Random(351)
+    words = ['playlist', 'with', 'and', 'chill', 'very', 'not', 'happy', 'rock', 'pop', 'the', 'for', 'a', 'x']
+    for _ in range(200):
+        query = ' '.join(rng.choice(artist_names + genre_names) if rng.random() < 0.4 else rng.choice(words)
+                         for _ in range(rng.randrange(1, 10)))
+        names_found, query_without_names = artist_matcher.find(query, remove=True)
+        assert (names_found, query_without_names) == find_names(artist_names, query, remove=True), query
+        assert genre_matcher.find(query_without_names)[0] == find_names(genre_names, query_without_names)[0], query
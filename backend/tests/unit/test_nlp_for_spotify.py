@@ -0,0 +1,27 @@
+import importlib
+import os
+
+import pytest
+
+from keywordLexicon import LEXICON_PATH
+
+BACKEND_PATH = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_nl2features_batch_matches_nl2features(monkeypatch):
+    pytest.importorskip('pandas')
+    spacy = pytest.importorskip('spacy')
+    if not spacy.util.is_package('en_core_web_sm'):
+        pytest.skip('the en_core_web_sm model is not installed')
+    if not os.path.exists(LEXICON_PATH):
+        pytest.skip('the keyword lexicon is not built (python keywordLexicon.py)')
+    # nlpForSpotify reads the artist and genre names relative to the working directory:
+    monkeypatch.chdir(BACKEND_PATH)
+    nlpForSpotify = importlib.import_module('nlpForSpotify')
+
+    queries = ['relaxing beach party playlist with Katy Perry', 'not very happy songs', 'really really loud rock',
+               'chill, calm study music by Drake and Lady Gaga', '', 'fast workout hip hop', 'not sad',
+               'relaxing beach party playlist with Katy Perry'] * 3
+    # Batches smaller than the queries, so they're split across several:
+    assert nlpForSpotify.nl2features_batch(queries, batch_size=5) == [nlpForSpotify.nl2features(query)
+                                                                      for query in queries]
@@ -0,0 +1,34 @@
+import numpy as np
+
+from playlistAnn import PlaylistAnnIndex, benchmark_recall, build_ann_index, save_ann_index
+from playlistIndex import PlaylistIndex, normalize_rows
+from QueryBuilder import AUDIO_FEATURES
+
+
+def test_ann_index_searching_all_clusters_matches_exact_search(tmp_path):
+    rng = np.random.default_rng(351)
+    aggregates = rng.random((2000, 2 * len(AUDIO_FEATURES)))
+    mpd_ids = list(range(5000, 7000))
+    playlist_names = [f'Playlist {mpd_id} é' for mpd_id in mpd_ids]
+    index_path = str(tmp_path / 'annIndex')
+    save_ann_index(build_ann_index(mpd_ids, playlist_names, normalize_rows(aggregates), lists_count=16,
+                                   iterations=5), index_path)
+    # Rebuilding replaces the index:
+    save_ann_index(build_ann_index(mpd_ids, playlist_names, normalize_rows(aggregates), lists_count=20), index_path)
+
+    ann_index = PlaylistAnnIndex(index_path)
+    playlist_index = PlaylistIndex(mpd_ids, playlist_names, aggregates)
+
+    assert isinstance(ann_index.vectors, np.memmap) and ann_index.meta['lists_count'] == 20
+    assert ann_index.list_offsets[-1] == 2000 and sorted(ann_index.mpd_ids.tolist()) == mpd_ids
+    for features in [{'energy': 1.0}, {'tempo': -1.0, 'liveliness': 1.0, 'artists': []}]:
+        nearest = ann_index.search(features, k=8, probes_count=20)
+        expected_nearest = playlist_index.search(features, k=8)
+        assert [playlist[:2] for playlist in nearest] == [playlist[:2] for playlist in expected_nearest]
+        assert np.allclose([playlist[2] for playlist in nearest], [playlist[2] for playlist in expected_nearest],
+                           atol=1e-5)
+        assert len(ann_index.search(features, k=8, probes_count=1)) <= 8
+    assert ann_index.search({'energy': 0}) == []
+
+    results, _ = benchmark_recall(ann_index, k=5, probes_counts=(1, 20), targets_count=20)
+    assert 0 < results[0]['recall'] <= results[1]['recall'] == 1
@@ -0,0 +1,58 @@
+import asyncio
+
+import numpy as np
+import pytest
+from sqlalchemy.sql import text
+
+from dataAccess import Database
+from playlistIndex import (AGGREGATE_DEFAULT, AVG_COLUMN_NAMES, STD_COLUMN_NAMES, PlaylistIndex, features_target,
+                           load_playlist_index, normalize_rows)
+from QueryBuilder import AUDIO_FEATURES
+
+
+def random_aggregates(playlists_count):
+    rng = np.random.default_rng(351)
+    aggregates = rng.random((playlists_count, len(AVG_COLUMN_NAMES) + len(STD_COLUMN_NAMES)))
+    aggregates[rng.random(aggregates.shape) < 0.05] = AGGREGATE_DEFAULT
+    return aggregates
+
+
+def test_search_returns_nearest_playlists():
+    aggregates = random_aggregates(500)
+    playlist_index = PlaylistIndex(range(1000, 1500), [f'Playlist {i}' for i in range(500)], aggregates)
+    vectors = normalize_rows(aggregates).astype(np.float64)
+
+    for features in [{'energy': 1.0}, {'energy': 1.0, 'valence': -1.0, 'artists': []},
+                     dict.fromkeys(AUDIO_FEATURES, -1.0)]:
+        target = features_target(features).astype(np.float64)
+        distances = np.linalg.norm(vectors - target, axis=1)
+        nearest = playlist_index.search(features, k=7)
+        assert [mpd_id for mpd_id, _, _ in nearest] == [1000 + i for i in np.argsort(distances, kind='stable')[:7]]
+        assert np.allclose([distance for _, _, distance in nearest], np.sort(distances)[:7], atol=1e-5)
+    assert playlist_index.search({'energy': 0, 'artists': ['Drake']}) == []
+
+
+def test_load_playlist_index(tmp_path):
+    pytest.importorskip('aiosqlite')
+    aggregates = random_aggregates(30)
+
+    async def run():
+        database = Database('sqlite+aiosqlite:///' + str(tmp_path / 'index.sqlite3'))
+        aggregate_column_names = AVG_COLUMN_NAMES + STD_COLUMN_NAMES
+        async with database.engine.begin() as connection:
+            await connection.execute(text(f'CREATE TABLE playlist (playlist_mpd_id INTEGER PRIMARY KEY, '
+                                          f'playlist_name TEXT, {", ".join(aggregate_column_names)})'))
+            await connection.execute(
+                text(f'INSERT INTO playlist VALUES (:mpd_id, :name, '
+                     f'{", ".join(":" + column_name for column_name in aggregate_column_names)})'),
+                [dict(zip(aggregate_column_names, playlist_aggregates), mpd_id=29 - i, name=f'Playlist {29 - i}')
+                 for i, playlist_aggregates in enumerate(aggregates.tolist())])
+        playlist_index = await load_playlist_index(database)
+        await database.dispose()
+        return playlist_index
+
+    playlist_index = asyncio.run(run())
+
+    assert playlist_index.mpd_ids.tolist() == list(range(30))
+    assert playlist_index.playlist_names[0] == 'Playlist 0'
+    assert np.array_equal(playlist_index.matrix.T, normalize_rows(aggregates[::-1]))
@@ -0,0 +1,51 @@
+from sqlalchemy import create_engine
+from sqlalchemy.sql import text
+
+from QueryBuilder import AUDIO_FEATURES, build_query, group_playlist_songs, playlist_songs_query
+
+
+def features(artists=(), **signs):
+    return dict({feature: signs.get(feature, 0) for feature in AUDIO_FEATURES}, artists=list(artists), genres=[])
+
+
+def test_playlist_songs_query_groups_distinct_songs_per_playlist():
+    engine = create_engine('sqlite://')
+    with engine.begin() as connection:
+        connection.execute(text('CREATE TABLE master2 (mpd_id INTEGER, track_pos INTEGER, track_id TEXT, '
+                                'track_name TEXT, aname TEXT, PRIMARY KEY (mpd_id, track_pos))'))
+        rows = [{'mpd_id': mpd_id, 'track_pos': track_pos, 'track_id': f't{track_pos % 15}',
+                 'track_name': f'Track {track_pos % 15}', 'aname': 'Artist'}
+                for mpd_id in [1, 2, 3] for track_pos in range(30 if mpd_id == 1 else 3)]
+        connection.execute(text('INSERT INTO master2 VALUES (:mpd_id, :track_pos, :track_id, :track_name, :aname)'),
+                           rows)
+
+        playlist_songs = group_playlist_songs(connection.execute(playlist_songs_query, {'mpd_ids': [3, 1]}))
+
+    assert sorted(playlist_songs) == [1, 3]
+    assert [song['track_id'] for song in playlist_songs[1]] == [f't{track_i}' for track_i in range(12)]
+    assert playlist_songs[3] == [{'track_name': f'Track {track_i}', 'aname': 'Artist', 'track_id': f't{track_i}'}
+                                 for track_i in range(3)]
+
+
+def test_build_query_binds_parameters_and_reuses_statements_of_a_shape():
+    engine = create_engine('sqlite://')
+    with engine.begin() as connection:
+        connection.execute(text('CREATE TABLE master2 (mpd_id INTEGER, pname TEXT, aname TEXT, energy_avg FLOAT, '
+                                'liveness_avg FLOAT)'))
+        connection.execute(text('INSERT INTO master2 VALUES (:mpd_id, :pname, :aname, :energy_avg, :liveness_avg)'),
+                           [{'mpd_id': 1, 'pname': 'Loud', 'aname': "Guns N' Roses", 'energy_avg': 0.9,
+                             'liveness_avg': 0.1},
+                            {'mpd_id': 1, 'pname': 'Loud', 'aname': 'Drake', 'energy_avg': 0.9,
+                             'liveness_avg': 0.1},
+                            {'mpd_id': 2, 'pname': 'Calm', 'aname': 'Enya', 'energy_avg': 0.1,
+                             'liveness_avg': 0.5},
+                            {'mpd_id': 3, 'pname': 'Live', 'aname': "Guns N' Roses", 'energy_avg': 0.1,
+                             'liveness_avg': 0.3}])
+
+        statement, parameters = build_query(features(["Guns N' Roses"], energy=1.0))
+        assert connection.execute(statement, parameters).all() == [(1, 'Loud'), (3, 'Live')]
+        other_statement, other_parameters = build_query(features(['Enya'], energy=1.0), MAGIC=0.5, LIMIT=1)
+        assert other_statement is statement
+        assert connection.execute(other_statement, other_parameters).all() == [(1, 'Loud')]
+        statement, parameters = build_query(features(liveliness=-1), MAGIC=0.4)
+        assert connection.execute(statement, parameters).all() == [(1, 'Loud'), (3, 'Live')]
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+from sqlalchemy.sql import text
+
+from dataAccess import Database
+from queryCache import MISSING, DataVersion, QueryCache, normalize_query
+
+
+def test_normalize_query():
+    assert normalize_query('  Dance   PARTY!! ') == 'dance party'
+    assert normalize_query('chill - study...') == 'chill study'
+    assert normalize_query("AC/DC, Guns N' Roses") == 'ac/dc guns n roses'
+    assert normalize_query("Rock'n'roll 2.0") == "rock'n'roll 2.0"
+    assert normalize_query('dance, party') == normalize_query('dance party') == 'dance party'
+    assert normalize_query('?!') == ''
+
+
+def test_query_cache_evicts_least_recently_used_and_expired_entries():
+    cache = QueryCache(max_entries=2)
+    cache.put('workout', 1)
+    cache.put('chill study', None)
+    assert cache.get('workout') == 1
+    cache.put('dance party', 3)
+
+    assert cache.get('chill study') is MISSING
+    assert cache.get('workout') == 1
+    assert cache.get('dance party') == 3
+    expired_cache = QueryCache(ttl_seconds=0)
+    expired_cache.put('workout', 1)
+    assert expired_cache.get('workout') is MISSING
+    assert cache.stats()['hits'] == 3 and cache.stats()['misses'] == 1 and cache.stats()['evictions'] == 1
+    assert expired_cache.stats()['expirations'] == 1
+
+
+def test_data_version_changes_with_ingest_slices(tmp_path):
+    pytest.importorskip('aiosqlite')
+
+    async def run():
+        database = Database('sqlite+aiosqlite:///' + str(tmp_path / 'version.sqlite3'))
+        async with database.engine.begin() as connection:
+            await connection.execute(text('CREATE TABLE ingest_slice (slice_i INTEGER PRIMARY KEY, '
+                                          'updated_at DATETIME)'))
+        data_version = DataVersion(database, check_seconds=0)
+        changes = [await data_version.changed(), await data_version.changed()]
+        async with database.engine.begin() as connection:
+            await connection.execute(text("INSERT INTO ingest_slice VALUES (0, '2023-05-01 12:00:00')"))
+        changes += [await data_version.changed(), await data_version.changed()]
+        await database.dispose()
+        return changes
+
+    assert asyncio.run(run()) == [False, False, True, False]